@@ -0,0 +1,84 @@
+"""
+Module containing a bounded cache of metric values with per-entry time-to-live.
+"""
+# core python dependencies
+from collections import OrderedDict
+import logging
+import threading
+import time
+from typing import Any, Dict, Hashable, Tuple
+
+# iter8 dependencies
+import iter8_analytics.constants as constants
+from iter8_analytics.config import env_config
+
+logger = logging.getLogger('iter8_analytics')
+
+class MetricValueCache:
+    """
+    Cache of metric values keyed by the canonical interpolated metric query.
+    Every entry has its own time-to-live; when the cache is full,
+    the least recently used entry is evicted.
+
+    Attributes:
+        maxsize (int): Maximum number of entries in the cache.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+        # key -> (value, expiry time)
+        self.entries: "OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Tuple[Any, bool]:
+        """
+        Get the (value, found) pair for the key; expired entries are not found.
+        """
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[1] > now:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[0], True
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            return None, False
+
+    def put(self, key: Hashable, value: Any, ttl: float):
+        """
+        Cache the value for ttl seconds.
+        """
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last = False)
+                self.evictions += 1
+
+    def clear(self):
+        """
+        Remove all entries.
+        """
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Get the number of hits, misses, evictions, and entries.
+        """
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self.entries)
+            }
+
+metric_value_cache = MetricValueCache(maxsize = env_config[constants.METRIC_CACHE_SIZE])
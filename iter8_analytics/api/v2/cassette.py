@@ -0,0 +1,173 @@
+"""
+Module containing record and replay of metrics backend responses using an on-disk cassette.
+"""
+# core python dependencies
+from collections import defaultdict, deque
+from enum import Enum
+import gzip
+import hashlib
+import json
+import logging
+import re
+import threading
+from typing import Any, Deque, Dict, Optional, Tuple
+
+# iter8 dependencies
+import iter8_analytics.constants as constants
+from iter8_analytics.config import env_config
+from iter8_analytics.api.v2.responses import BackendResponse
+
+logger = logging.getLogger('iter8_analytics')
+
+# numbers in queries, such as elapsedTime, change from one iteration to the next
+NUMBER = re.compile(r"\d+(\.\d+)?")
+
+class CassetteMode(str, Enum):
+    """
+    Cassette modes
+    """
+    OFF = "off"
+    RECORD = "record"
+    REPLAY = "replay"
+
+class CassetteMissError(ValueError):
+    """
+    Raised in replay mode when the cassette has no response for a request.
+    """
+
+def get_cassette_keys(url: str, method: str, params: Any, body: Any, form: Any) -> \
+    Tuple[str, str]:
+    """
+    Get the exact key and the number-insensitive key of a backend request.
+    Headers and auth are not part of the keys, so that credentials are never written to disk
+    and cassettes can be replayed with different credentials.
+    """
+    canonical = json.dumps({
+        "url": url,
+        "method": method,
+        "params": params,
+        "body": body,
+        "form": form
+    }, sort_keys = True, default = str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest(), \
+        hashlib.sha256(NUMBER.sub("#", canonical).encode("utf-8")).hexdigest()
+
+class Cassette:
+    """
+    Record metrics backend responses to a gzipped JSON lines file, and replay them.
+
+    In replay mode, a request is served the recorded response of the exact same request;
+    if there is none, it is served the recorded responses of requests which differ
+    only in numbers (such as elapsedTime in queries) in the order in which they were recorded.
+
+    Attributes:
+        mode (CassetteMode): Whether responses are recorded, replayed, or neither.
+        path (str): Path of the cassette file.
+        replay_latency (bool): Whether replayed responses are delayed by their recorded latency.
+    """
+
+    def __init__(self, mode: CassetteMode, path: str, replay_latency: bool):
+        self.mode = mode
+        self.path = path
+        self.replay_latency = replay_latency
+        self.lock = threading.Lock()
+        self.exact: Dict[str, Dict[str, Any]] = {}
+        self.fuzzy: Dict[str, Deque[Dict[str, Any]]] = defaultdict(deque)
+        self.loaded = False
+        self.recorded = 0
+        self.replayed = 0
+        self.missed = 0
+
+    def recording(self) -> bool:
+        """
+        Whether responses are recorded.
+        """
+        return self.mode == CassetteMode.RECORD
+
+    def replaying(self) -> bool:
+        """
+        Whether responses are replayed.
+        """
+        return self.mode == CassetteMode.REPLAY
+
+    def load(self):
+        """
+        Read the cassette file, if it has not been read yet;
+        raise CassetteMissError if it is missing or cannot be read.
+        """
+        with self.lock:
+            if self.loaded:
+                return
+            exact: Dict[str, Dict[str, Any]] = {}
+            fuzzy: Dict[str, Deque[Dict[str, Any]]] = defaultdict(deque)
+            try:
+                with gzip.open(self.path, "rt", encoding = "utf-8") as cassette_file:
+                    for line in cassette_file:
+                        if line.strip():
+                            entry = json.loads(line)
+                            exact.setdefault(entry["key"], entry)
+                            fuzzy[entry["match"]].append(entry)
+            except (OSError, EOFError, ValueError, KeyError, TypeError) as exc:
+                logger.error("Cannot read cassette %s: %s", self.path, exc)
+                raise CassetteMissError(f"cannot read cassette {self.path}: {exc}") from exc
+            self.exact, self.fuzzy = exact, fuzzy
+            self.loaded = True
+            logger.info("Loaded %s responses from cassette %s", len(self.exact), self.path)
+
+    def record(self, url: str, method: str, params: Any, body: Any, form: Any, \
+        response: BackendResponse, latency: float):
+        """
+        Append the response to the cassette file.
+        """
+        key, match = get_cassette_keys(url, method, params, body, form)
+        line = json.dumps({
+            "key": key,
+            "match": match,
+            "status": response.status_code,
+            "latency": round(latency, 6),
+            "body": response.content.decode("utf-8", errors = "surrogateescape")
+        }, separators = (",", ":")) + "\n"
+        with self.lock:
+            # each record is a separate gzip member, which gzip readers concatenate
+            with gzip.open(self.path, "at", encoding = "utf-8", \
+                errors = "surrogateescape") as cassette_file:
+                cassette_file.write(line)
+            self.recorded += 1
+
+    def replay(self, url: str, method: str, params: Any, body: Any, form: Any) -> \
+        Tuple[BackendResponse, float]:
+        """
+        Get the recorded response and latency for the request;
+        raise CassetteMissError if there is none, or if the cassette cannot be read.
+        """
+        self.load()
+        key, match = get_cassette_keys(url, method, params, body, form)
+        with self.lock:
+            entry: Optional[Dict[str, Any]] = self.exact.get(key)
+            if entry is None and self.fuzzy.get(match):
+                # rotate through the recorded responses of similar requests
+                entry = self.fuzzy[match][0]
+                self.fuzzy[match].rotate(-1)
+            if entry is None:
+                self.missed += 1
+                raise CassetteMissError(f"no recorded response for {method} {url}")
+            self.replayed += 1
+        latency = entry["latency"] if self.replay_latency else 0.0
+        return BackendResponse(entry["status"], \
+            entry["body"].encode("utf-8", errors = "surrogateescape")), latency
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the mode and the number of responses recorded, replayed and missed.
+        """
+        with self.lock:
+            return {
+                "mode": self.mode.value,
+                "recorded": self.recorded,
+                "replayed": self.replayed,
+                "missed": self.missed
+            }
+
+cassette = Cassette(mode = CassetteMode(env_config[constants.CASSETTE_MODE]), \
+    path = env_config[constants.CASSETTE_PATH], \
+    replay_latency = env_config[constants.CASSETTE_REPLAY_LATENCY])
@@ -0,0 +1,71 @@
+"""
+Module containing checkpoints of incrementally evaluated counter metrics.
+"""
+# core python dependencies
+import logging
+from typing import Dict, Hashable, NamedTuple, Optional
+
+# iter8 dependencies
+import iter8_analytics.constants as constants
+from iter8_analytics.config import env_config
+from iter8_analytics.api.v2.cache import MetricValueCache
+
+logger = logging.getLogger('iter8_analytics')
+
+class Checkpoint(NamedTuple):
+    """
+    Value of a counter metric as of elapsed_time seconds since the start of the experiment.
+    """
+    value: float
+    elapsed_time: int
+
+class IncrementalQuery(NamedTuple):
+    """
+    Query of an incremental counter metric for the window since its checkpoint;
+    request is None if the checkpoint is current.
+    """
+    key: Hashable
+    elapsed_time: int
+    checkpoint: Checkpoint
+    request: Optional[Dict]
+
+class CheckpointStore:
+    """
+    Checkpoints keyed by experiment start time and metric query;
+    a checkpoint expires when it is not updated for ttl seconds.
+
+    Attributes:
+        ttl (float): Seconds after which an idle checkpoint expires.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.ttl = ttl
+        self.checkpoints = MetricValueCache(maxsize = maxsize)
+
+    def get(self, key: Hashable) -> Optional[Checkpoint]:
+        """
+        Get the checkpoint for the key, if any.
+        """
+        checkpoint, _ = self.checkpoints.get(key)
+        return checkpoint
+
+    def put(self, key: Hashable, checkpoint: Checkpoint):
+        """
+        Store the checkpoint for the key.
+        """
+        self.checkpoints.put(key, checkpoint, self.ttl)
+
+    def clear(self):
+        """
+        Remove all checkpoints.
+        """
+        self.checkpoints.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Get the number of hits, misses, evictions, and checkpoints.
+        """
+        return self.checkpoints.stats()
+
+checkpoint_store = CheckpointStore(maxsize = env_config[constants.CHECKPOINT_STORE_SIZE], \
+    ttl = env_config[constants.CHECKPOINT_TTL_SECONDS])
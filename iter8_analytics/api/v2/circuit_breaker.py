@@ -0,0 +1,172 @@
+"""
+Module containing circuit breakers, which fail queries to unavailable metrics backends fast.
+"""
+# core python dependencies
+import logging
+import threading
+import time
+from enum import Enum
+from typing import Any, Dict
+
+# iter8 dependencies
+import iter8_analytics.constants as constants
+from iter8_analytics.config import env_config
+from iter8_analytics.api.v2.sessions import get_backend_key
+
+logger = logging.getLogger('iter8_analytics')
+
+class CircuitOpenError(Exception):
+    """
+    Raised when a query is rejected because the circuit breaker of its backend is open.
+    """
+
+class CircuitState(str, Enum):
+    """
+    States of a circuit breaker
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+class CircuitBreaker:
+    """
+    Circuit breaker of a metrics backend.
+    Closed: queries are made; failure_threshold consecutive failures open the circuit.
+    Open: queries are rejected until reset_timeout seconds have passed since opening.
+    Half-open: a single trial query is made; its success closes the circuit,
+    its failure opens it again; other queries are rejected meanwhile.
+
+    Attributes:
+        failure_threshold (int): Consecutive failures which open the circuit; 0 disables it.
+        reset_timeout (float): Seconds after which an open circuit becomes half-open.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.lock = threading.Lock()
+        self.state = CircuitState.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.times_opened = 0
+        self.rejected = 0
+
+    def before_call(self):
+        """
+        Check if a query may be made; raise CircuitOpenError if not.
+        """
+        if self.failure_threshold <= 0:
+            return
+        with self.lock:
+            if self.state == CircuitState.OPEN and \
+                time.monotonic() - self.opened_at >= self.reset_timeout:
+                logger.info("circuit breaker for %s is half-open", self.name)
+                self.state = CircuitState.HALF_OPEN
+            if self.state == CircuitState.CLOSED:
+                return
+            if self.state == CircuitState.HALF_OPEN and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return
+            self.rejected += 1
+        raise CircuitOpenError(f"circuit breaker for metrics backend {self.name} is open")
+
+    def on_success(self):
+        """
+        Record a successful query.
+        """
+        with self.lock:
+            if self.state != CircuitState.CLOSED:
+                logger.info("circuit breaker for %s is closed", self.name)
+            self.state = CircuitState.CLOSED
+            self.failures = 0
+            self.trial_in_flight = False
+
+    def on_failure(self):
+        """
+        Record a failed query.
+        """
+        if self.failure_threshold <= 0:
+            return
+        with self.lock:
+            self.failures += 1
+            self.trial_in_flight = False
+            if self.state == CircuitState.HALF_OPEN or \
+                (self.state == CircuitState.CLOSED and self.failures >= self.failure_threshold):
+                logger.warning("circuit breaker for %s is open after %s consecutive failures", \
+                    self.name, self.failures)
+                self.state = CircuitState.OPEN
+                self.opened_at = time.monotonic()
+                self.times_opened += 1
+
+    def on_response(self, status_code: int):
+        """
+        Record a query which got a response; server errors are failures.
+        """
+        if status_code >= 500:
+            self.on_failure()
+        else:
+            self.on_success()
+
+    def on_abort(self):
+        """
+        Record a query which neither succeeded nor failed, for instance, a cancelled query.
+        """
+        with self.lock:
+            self.trial_in_flight = False
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the state of the circuit breaker, consecutive failures,
+        number of times opened, and number of rejected queries.
+        """
+        with self.lock:
+            return {
+                "state": self.state.value,
+                "failures": self.failures,
+                "opened": self.times_opened,
+                "rejected": self.rejected
+            }
+
+class CircuitBreakers:
+    """
+    Circuit breakers keyed by metrics backend (scheme and host).
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.lock = threading.Lock()
+        self.breakers: Dict[str, CircuitBreaker] = {}
+
+    def get_breaker(self, url: str) -> CircuitBreaker:
+        """
+        Get the circuit breaker of the metrics backend of this url.
+        """
+        key = get_backend_key(url)
+        with self.lock:
+            breaker = self.breakers.get(key)
+            if breaker is None:
+                breaker = CircuitBreaker(key, self.failure_threshold, self.reset_timeout)
+                self.breakers[key] = breaker
+            return breaker
+
+    def reset(self):
+        """
+        Remove all circuit breakers.
+        """
+        with self.lock:
+            self.breakers.clear()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Get the stats of the circuit breaker of each metrics backend.
+        """
+        with self.lock:
+            breakers = list(self.breakers.values())
+        return {breaker.name: breaker.stats() for breaker in breakers}
+
+circuit_breakers = CircuitBreakers( \
+    failure_threshold = env_config[constants.CIRCUIT_BREAKER_FAILURE_THRESHOLD], \
+    reset_timeout = env_config[constants.CIRCUIT_BREAKER_RESET_SECONDS])
@@ -0,0 +1,148 @@
+"""
+Module containing single-flight coalescing of identical in-flight metrics backend queries.
+"""
+# core python dependencies
+import asyncio
+import logging
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple, Type
+
+logger = logging.getLogger('iter8_analytics')
+
+class Call:
+    """
+    An in-flight call whose outcome is shared by all callers with the same key.
+    """
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.exception: BaseException = None
+
+class AsyncCall:
+    """
+    An in-flight asynchronous call, run as a task owned by the single-flight entry,
+    and the number of callers waiting for it.
+    """
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls with the same key, so that only the first caller (the leader)
+    executes the call and all other callers share its result or exception.
+    Exceptions of the unshared types are specific to the leader, such as its deadline passing;
+    the other callers make the call again, each with its own func, instead of sharing them.
+
+    Attributes:
+        calls (int): Number of calls made.
+        executed (int): Number of calls actually executed.
+        coalesced (int): Number of calls which shared the outcome of an in-flight call.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight: Dict[Hashable, Call] = {}
+        self.async_in_flight: Dict[Tuple[Hashable, asyncio.AbstractEventLoop], AsyncCall] = {}
+        self.calls = 0
+        self.executed = 0
+        self.coalesced = 0
+
+    def do(self, key: Hashable, func: Callable[[], Any], \
+        unshared: Tuple[Type[BaseException], ...] = ()) -> Any:
+        """
+        Return func(), unless a call with the same key is in flight,
+        in which case wait for and return (or raise) its outcome.
+        """
+        with self.lock:
+            self.calls += 1
+            call = self.in_flight.get(key)
+            leader = call is None
+            if leader:
+                call = Call()
+                self.in_flight[key] = call
+                self.executed += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if isinstance(call.exception, unshared):
+                return self.do(key, func, unshared)
+            if call.exception is not None:
+                raise call.exception
+            return call.result
+
+        try:
+            call.result = func()
+            return call.result
+        except BaseException as exc:
+            call.exception = exc
+            raise
+        finally:
+            with self.lock:
+                del self.in_flight[key]
+            call.done.set()
+
+    async def do_async(self, key: Hashable, func: Callable[[], Awaitable[Any]], \
+        unshared: Tuple[Type[BaseException], ...] = ()) -> Any:
+        """
+        Asynchronous version of do; calls are coalesced within the running event loop.
+        func() runs as a task of its own, in the context of the leader, which all callers
+        wait for; a caller which is cancelled stops waiting, and the task is cancelled only
+        once no caller is waiting.
+        """
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            self.calls += 1
+            call = self.async_in_flight.get((key, loop))
+            leader = call is None or call.task.done()
+            if leader:
+                call = AsyncCall(loop.create_task(func()))
+                self.async_in_flight[(key, loop)] = call
+                call.task.add_done_callback(lambda task: self.finish_async(key, loop, call))
+                self.executed += 1
+            else:
+                self.coalesced += 1
+            call.waiters += 1
+
+        try:
+            # shield the shared task from cancellation of this caller
+            return await asyncio.shield(call.task)
+        except unshared:
+            if leader:
+                raise
+        finally:
+            with self.lock:
+                call.waiters -= 1
+                abandoned = call.waiters == 0 and not call.task.done()
+                if abandoned and self.async_in_flight.get((key, loop)) is call:
+                    # later callers with the same key start a new call
+                    del self.async_in_flight[(key, loop)]
+            if abandoned:
+                call.task.cancel()
+        return await self.do_async(key, func, unshared)
+
+    def finish_async(self, key: Hashable, loop: asyncio.AbstractEventLoop, call: AsyncCall):
+        """
+        Remove a finished asynchronous call from the calls in flight.
+        """
+        with self.lock:
+            if self.async_in_flight.get((key, loop)) is call:
+                del self.async_in_flight[(key, loop)]
+        if not call.task.cancelled():
+            # mark the exception, if any, as retrieved, in case no caller is waiting
+            call.task.exception()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Get the number of calls made, executed, and saved by coalescing.
+        """
+        with self.lock:
+            return {
+                "calls": self.calls,
+                "executed": self.executed,
+                "coalesced": self.coalesced
+            }
+
+single_flight = SingleFlight()
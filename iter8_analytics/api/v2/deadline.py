@@ -0,0 +1,82 @@
+"""
+Module containing the deadline budget of an analytics request,
+which bounds the time spent querying metrics backends.
+"""
+# core python dependencies
+import contextvars
+import logging
+import time
+from typing import Optional
+
+logger = logging.getLogger('iter8_analytics')
+
+class DeadlineExceededError(Exception):
+    """
+    Raised when the deadline of the analytics request has passed.
+    """
+
+class Deadline:
+    """
+    Deadline of an analytics request.
+
+    Attributes:
+        expiry (float): Monotonic time at which the deadline passes.
+    """
+
+    def __init__(self, budget: float):
+        """
+        Args:
+            budget (float): Seconds from now until the deadline.
+        """
+        self.expiry = time.monotonic() + budget
+
+    def remaining(self) -> float:
+        """
+        Get the seconds left until the deadline.
+        """
+        return self.expiry - time.monotonic()
+
+    def expired(self) -> bool:
+        """
+        Check if the deadline has passed.
+        """
+        return self.remaining() <= 0
+
+# deadline of the analytics request being processed, if any;
+# copied into asyncio tasks and into the threads fetching metric values
+current_deadline: contextvars.ContextVar = \
+    contextvars.ContextVar("iter8_analytics_deadline", default = None)
+
+def set_deadline(budget: Optional[float]) -> contextvars.Token:
+    """
+    Set the deadline of the current analytics request to budget seconds from now;
+    no deadline if budget is None. Return the token for resetting the deadline.
+    """
+    return current_deadline.set(None if budget is None else Deadline(budget))
+
+def reset_deadline(token: contextvars.Token):
+    """
+    Restore the deadline in effect before set_deadline.
+    """
+    current_deadline.reset(token)
+
+def get_timeout(default: float) -> float:
+    """
+    Get the timeout for the next metrics backend query:
+    the default timeout, or the time left until the deadline, whichever is smaller.
+    Raise DeadlineExceededError if the deadline has passed.
+    """
+    deadline = current_deadline.get()
+    if deadline is None:
+        return default
+    remaining = deadline.remaining()
+    if remaining <= 0:
+        raise DeadlineExceededError("deadline exceeded before querying metrics backend")
+    return min(default, remaining)
+
+def deadline_exceeded() -> bool:
+    """
+    Check if the deadline of the current analytics request, if any, has passed.
+    """
+    deadline = current_deadline.get()
+    return deadline is not None and deadline.expired()
@@ -23,6 +23,29 @@ request_count = {
     }
 }
 
+request_count_batch = {
+    "name": "request-count",
+    "metricObj": {
+        "apiVersion": "iter8.tools/v2alpha2",
+        "kind": "Metric",
+        "metadata": {
+            "name": "request-count"
+        },
+        "spec": {
+            "type": "Counter",
+            "params": [{
+                "name": "query",
+                "value": "sum by (service_name) (increase(revision_app_request_latencies_count{service_name=~'$names'}[${elapsedTime}s]))"
+            }],
+            "description": "Number of requests",
+            "provider": "prometheus",
+            "batch": True,
+            "jqExpression": "[.data.result[] | select(.metric.service_name == $name) | .value[1] | tonumber] | add // 0",
+            "urlTemplate": "http://metrics-mock:8080/promcounter"
+        }
+    }
+}
+
 mean_latency = {
     "name": "mean-latency",
     "metricObj": {
@@ -87,6 +110,48 @@ cpu_utilization = {
     }
 }
 
+cpu_utilization_merge = {
+    "name": "cpu-utilization",
+    "metricObj": {
+        "apiVersion": "iter8.tools/v2alpha2",
+        "kind": "Metric",
+        "metadata": {
+            "name": "cpu-utilization"
+        },
+        "spec": {
+            "description": "CPU utilization",
+            "body": "{\n  \"last\": $elapsedTime,\n  \"sampling\": 600,\n  \"filter\": \"kubernetes.node.name = 'n1' and service = '$name'\",\n   \"metrics\": [\n    {\n      \"id\": \"cpu.cores.used\",\n      \"aggregations\": { \"time\": \"avg\", \"group\": \"sum\" }\n    }\n  ],\n  \"dataSourceType\": \"container\",\n  \"paging\": {\n    \"from\": 0,\n    \"to\": 99\n  }\n}\n",
+            "method": "POST",
+            "type": "Gauge",
+            "provider": "Sysdig",
+            "merge": True,
+            "jqExpression": ".data[0].d[$offset] | tonumber",
+            "urlTemplate": "http://metrics-mock:8080/sysdig"
+        }
+    }
+}
+
+memory_utilization_merge = {
+    "name": "memory-utilization",
+    "metricObj": {
+        "apiVersion": "iter8.tools/v2alpha2",
+        "kind": "Metric",
+        "metadata": {
+            "name": "memory-utilization"
+        },
+        "spec": {
+            "description": "Memory utilization",
+            "body": "{\n  \"last\": $elapsedTime,\n  \"sampling\": 600,\n  \"filter\": \"kubernetes.node.name = 'n1' and service = '$name'\",\n   \"metrics\": [\n    {\n      \"id\": \"memory.bytes.used\",\n      \"aggregations\": { \"time\": \"avg\", \"group\": \"sum\" }\n    }\n  ],\n  \"dataSourceType\": \"container\",\n  \"paging\": {\n    \"from\": 0,\n    \"to\": 99\n  }\n}\n",
+            "method": "POST",
+            "type": "Gauge",
+            "provider": "Sysdig",
+            "merge": True,
+            "jqExpression": ".data[0].d[$offset] | tonumber",
+            "urlTemplate": "http://metrics-mock:8080/sysdig"
+        }
+    }
+}
+
 business_revenue = {
     "name": "business-revenue",
     "metricObj": {
@@ -16,6 +16,7 @@ from iter8_analytics.api.v2.types import ExperimentResource, \
     WinnerAssessmentAnalysis, WinnerAssessmentData, WeightsAnalysis, \
     Analysis, Objective, TestingPattern, Reward, PreferredDirection
 from iter8_analytics.api.v2.metrics import get_aggregated_metrics
+from iter8_analytics.api.v2.prefetch import get_prefetched_aggregated_metrics
 from iter8_analytics.api.utils import gen_round
 from iter8_analytics.api.utils import Message, MessageLevel
 from iter8_analytics.advancedparams import AdvancedParameters
@@ -369,17 +370,38 @@ def get_weights(experiment_resource: ExperimentResource):
     logger.debug("weights: %s", pprint.PrettyPrinter().pformat(_weights))
     return _weights
 
-def get_analytics_results(expr: ExperimentResource):
+def init_analysis(expr: ExperimentResource):
     """
-    Get analysis results using experiment resource and metric resources.
+    Replace the analysis in the experiment resource with a new one.
     """
     # if experiment contains aggregated builtin metric histograms, retain it
     ana = Analysis()
     if expr.status.analysis is not None:
         ana.aggregated_builtin_hists = expr.status.analysis.aggregated_builtin_hists
     expr.status.analysis = ana
-    expr.status.analysis.aggregated_metrics = get_aggregated_metrics(expr)
+
+def complete_analysis(expr: ExperimentResource):
+    """
+    Complete the analysis in the experiment resource, whose status includes aggregated metrics.
+    """
     expr.status.analysis.version_assessments = get_version_assessments(expr)
     expr.status.analysis.winner_assessment = get_winner_assessment(expr)
     expr.status.analysis.weights = get_weights(expr)
     return expr.status.analysis
+
+def get_analytics_results(expr: ExperimentResource):
+    """
+    Get analysis results using experiment resource and metric resources.
+    """
+    init_analysis(expr)
+    expr.status.analysis.aggregated_metrics = get_aggregated_metrics(expr)
+    return complete_analysis(expr)
+
+async def get_analytics_results_async(expr: ExperimentResource):
+    """
+    Asynchronous version of get_analytics_results;
+    metric values are prefetched, if the experiment is registered for prefetching.
+    """
+    init_analysis(expr)
+    expr.status.analysis.aggregated_metrics = await get_prefetched_aggregated_metrics(expr)
+    return complete_analysis(expr)
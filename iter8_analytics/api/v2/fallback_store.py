@@ -0,0 +1,200 @@
+"""
+Module containing a persistent store of the last known good value of each metric and version
+of each experiment, used as the fallback when a metric value cannot be fetched.
+"""
+# core python dependencies
+import asyncio
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+# iter8 dependencies
+import iter8_analytics.constants as constants
+from iter8_analytics.config import env_config
+from iter8_analytics.api.v2.types import ExperimentResource
+
+logger = logging.getLogger('iter8_analytics')
+
+def get_fallback_key(expr: ExperimentResource) -> str:
+    """
+    Get the key of the experiment in the fallback store, derived from its start time
+    and its versions, including their variables.
+    """
+    canonical = json.dumps({
+        "startTime": expr.status.startTime,
+        "versionInfo": expr.spec.versionInfo.dict()
+    }, sort_keys = True, default = str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+class FallbackStore:
+    """
+    Last known good metric values, keyed by (experiment key, metric name, version name),
+    in an SQLite database. All values are kept in memory, so lookups do not touch the database
+    once it is open; new values are written to the database in batches, and pending values are
+    written every flush_interval seconds by the flusher, once started.
+
+    Attributes:
+        path (str): Path of the SQLite database; the store is disabled if empty.
+        batch_size (int): Number of pending values which triggers a write.
+        flush_interval (float): Seconds after which pending values are written.
+        ttl (float): Seconds after which values not updated are deleted when the store is opened.
+    """
+
+    def __init__(self, path: str, batch_size: int, flush_interval: float, ttl: float):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.connection: Optional[sqlite3.Connection] = None
+        self.values: Dict[Tuple[str, str, str], float] = {}
+        self.pending: Dict[Tuple[str, str, str], Tuple[float, float]] = {}
+        self.last_flush = time.monotonic()
+        self.task = None
+        self.hits = 0
+        self.misses = 0
+        self.flushes = 0
+
+    def enabled(self) -> bool:
+        """
+        Check if the store has a database.
+        """
+        return bool(self.path)
+
+    def open(self):
+        """
+        Open the database, if it is not open, and load the values which have not expired.
+        Must be called while holding the lock.
+        """
+        if self.connection is not None:
+            return
+        self.connection = sqlite3.connect(self.path, check_same_thread = False)
+        with self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS fallbacks (" \
+                "experiment TEXT, metric TEXT, version TEXT, value REAL, updated REAL, " \
+                "PRIMARY KEY (experiment, metric, version)) WITHOUT ROWID")
+            self.connection.execute("DELETE FROM fallbacks WHERE updated < ?", \
+                (time.time() - self.ttl,))
+        for experiment, metric, version, value in self.connection.execute( \
+            "SELECT experiment, metric, version, value FROM fallbacks"):
+            self.values[(experiment, metric, version)] = value
+        logger.info("Loaded %s fallback values from %s", len(self.values), self.path)
+
+    def get(self, experiment: str, metric: str, version: str) -> Optional[float]:
+        """
+        Get the last known good value; None if there is none.
+        """
+        if not self.enabled():
+            return None
+        with self.lock:
+            self.open()
+            value = self.values.get((experiment, metric, version))
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return value
+
+    def put(self, experiment: str, metric: str, version: str, value: float):
+        """
+        Record a good value; it is written with the next batch.
+        """
+        if not self.enabled():
+            return
+        with self.lock:
+            self.open()
+            self.values[(experiment, metric, version)] = value
+            self.pending[(experiment, metric, version)] = (value, time.time())
+            if len(self.pending) >= self.batch_size or \
+                time.monotonic() - self.last_flush >= self.flush_interval:
+                self.write_pending()
+
+    def write_pending(self):
+        """
+        Write pending values in a single transaction. Must be called while holding the lock.
+        """
+        self.last_flush = time.monotonic()
+        if len(self.pending) == 0:
+            return
+        rows = [key + entry for key, entry in self.pending.items()]
+        self.pending = {}
+        try:
+            with self.connection:
+                self.connection.executemany("INSERT OR REPLACE INTO fallbacks " \
+                    "(experiment, metric, version, value, updated) VALUES (?, ?, ?, ?, ?)", rows)
+            self.flushes += 1
+        except sqlite3.Error as exc:
+            logger.error("cannot write fallback values to %s: %s", self.path, exc)
+
+    def flush(self):
+        """
+        Write pending values now.
+        """
+        if not self.enabled():
+            return
+        with self.lock:
+            if self.connection is not None:
+                self.write_pending()
+
+    async def run(self):
+        """
+        Write pending values every flush_interval seconds, off the event loop.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await loop.run_in_executor(None, self.flush)
+
+    def start(self):
+        """
+        Start the flusher in the running event loop, if the store is enabled.
+        """
+        if self.enabled():
+            self.task = asyncio.ensure_future(self.run())
+
+    async def stop(self):
+        """
+        Stop the flusher.
+        """
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    def close(self):
+        """
+        Write pending values and close the database.
+        """
+        self.flush()
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+                self.values = {}
+
+    def stats(self):
+        """
+        Get the number of lookups which found a value (hits) or not (misses),
+        batches written, values pending, and values in the store.
+        """
+        with self.lock:
+            return {
+                "enabled": self.enabled(),
+                "hits": self.hits,
+                "misses": self.misses,
+                "flushes": self.flushes,
+                "pending": len(self.pending),
+                "size": len(self.values)
+            }
+
+fallback_store = FallbackStore(path = env_config[constants.FALLBACK_STORE_PATH], \
+    batch_size = env_config[constants.FALLBACK_STORE_BATCH_SIZE], \
+    flush_interval = env_config[constants.FALLBACK_STORE_FLUSH_SECONDS], \
+    ttl = env_config[constants.FALLBACK_STORE_TTL_SECONDS])
@@ -0,0 +1,247 @@
+"""
+Module containing hedged queries to metrics backends: a query which is slower than
+a percentile of recently observed latencies is duplicated, and the first success is used.
+"""
+# core python dependencies
+import asyncio
+from collections import deque
+import concurrent.futures
+import contextvars
+import logging
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+from urllib.parse import urlsplit, urlunsplit
+
+# external module dependencies
+import numpy as np
+
+# iter8 dependencies
+import iter8_analytics.constants as constants
+from iter8_analytics.config import env_config
+from iter8_analytics.api.v2.sessions import get_backend_key
+
+logger = logging.getLogger('iter8_analytics')
+
+def parse_alternates(alternates: str) -> Dict[str, str]:
+    """
+    Parse comma separated backend=alternate pairs of metrics backend URLs
+    into a dict from backend key to alternate backend key.
+    """
+    parsed = {}
+    for pair in alternates.split(","):
+        if "=" in pair:
+            backend, alternate = pair.split("=", 1)
+            parsed[get_backend_key(backend.strip())] = get_backend_key(alternate.strip())
+    return parsed
+
+def succeeded(future) -> bool:
+    """
+    Check if a completed query returned a response without a server error.
+    """
+    return not future.cancelled() and future.exception() is None and \
+        future.result().status_code < 500
+
+class Hedger:
+    """
+    Hedge queries to metrics backends.
+    A query which has not returned within the given percentile of the recent latencies
+    of its backend is duplicated, optionally to an alternate replica of the backend.
+    Hedged queries are capped at max_extra_load times the number of queries.
+
+    Attributes:
+        percentile (float): Percentile of recent latencies after which to hedge; 0 disables.
+        min_samples (int): Latencies observed for a backend before its queries are hedged.
+        max_extra_load (float): Maximum ratio of hedged queries to queries.
+        alternates (Dict[str, str]): Alternate replica of metrics backends, by backend key.
+    """
+
+    window = 100
+
+    def __init__(self, percentile: float, min_samples: int, max_extra_load: float, \
+        alternates: Dict[str, str]):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.max_extra_load = max_extra_load
+        self.alternates = alternates
+        self.lock = threading.Lock()
+        self.latencies: Dict[str, deque] = {}
+        self.executor = None
+        self.queries = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.over_cap = 0
+
+    def observe(self, url: str, seconds: float):
+        """
+        Record the latency of a successful query.
+        """
+        key = get_backend_key(url)
+        with self.lock:
+            if key not in self.latencies:
+                self.latencies[key] = deque(maxlen = self.window)
+            self.latencies[key].append(seconds)
+
+    def get_hedge_delay(self, url: str) -> Optional[float]:
+        """
+        Get the seconds after which a query to this url is hedged;
+        None if queries are not hedged.
+        """
+        if self.percentile <= 0:
+            return None
+        with self.lock:
+            latencies = list(self.latencies.get(get_backend_key(url), []))
+        if len(latencies) < max(self.min_samples, 1):
+            return None
+        return float(np.percentile(latencies, self.percentile))
+
+    def get_hedge_url(self, url: str) -> str:
+        """
+        Get the url of the hedged query, at the alternate replica of the backend, if any.
+        """
+        alternate = self.alternates.get(get_backend_key(url))
+        if alternate is None:
+            return url
+        parts, alternate_parts = urlsplit(url), urlsplit(alternate)
+        return urlunsplit((alternate_parts.scheme, alternate_parts.netloc) + tuple(parts[2:]))
+
+    def count_query(self):
+        """
+        Count a query.
+        """
+        with self.lock:
+            self.queries += 1
+
+    def acquire_hedge(self) -> bool:
+        """
+        Check if one more hedged query stays within the cap on extra load, and count it.
+        """
+        with self.lock:
+            if self.hedged + 1 > self.max_extra_load * self.queries:
+                self.over_cap += 1
+                return False
+            self.hedged += 1
+            return True
+
+    def count_hedge_win(self):
+        """
+        Count a hedged query which returned before the original one.
+        """
+        with self.lock:
+            self.hedge_wins += 1
+
+    def timed(self, url: str, func: Callable[[str], Any]):
+        """
+        Return func(url), recording its latency if it succeeded.
+        """
+        start = time.monotonic()
+        response = func(url)
+        if response.status_code < 500:
+            self.observe(url, time.monotonic() - start)
+        return response
+
+    async def timed_async(self, url: str, func: Callable[[str], Awaitable[Any]]):
+        """
+        Asynchronous version of timed.
+        """
+        start = time.monotonic()
+        response = await func(url)
+        if response.status_code < 500:
+            self.observe(url, time.monotonic() - start)
+        return response
+
+    def get_executor(self) -> concurrent.futures.ThreadPoolExecutor:
+        """
+        Get the executor running hedged queries.
+        """
+        with self.lock:
+            if self.executor is None:
+                self.executor = concurrent.futures.ThreadPoolExecutor( \
+                    max_workers = 2 * env_config[constants.METRICS_FETCH_CONCURRENCY], \
+                        thread_name_prefix = "iter8-hedging")
+            return self.executor
+
+    def call(self, url: str, func: Callable[[str], Any]):
+        """
+        Return the HTTP response func(url), hedged with func(hedge url) if it is slow.
+        """
+        delay = self.get_hedge_delay(url)
+        if delay is None:
+            return self.timed(url, func)
+        self.count_query()
+
+        executor = self.get_executor()
+        primary = executor.submit(contextvars.copy_context().run, self.timed, url, func)
+        try:
+            return primary.result(timeout = delay)
+        except concurrent.futures.TimeoutError:
+            pass
+        if not self.acquire_hedge():
+            return primary.result()
+
+        hedge_url = self.get_hedge_url(url)
+        logger.debug("hedging query to %s after %s seconds using %s", url, delay, hedge_url)
+        hedge = executor.submit(contextvars.copy_context().run, self.timed, hedge_url, func)
+        pending = {primary, hedge}
+        while pending:
+            done, pending = concurrent.futures.wait(pending, \
+                return_when = concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                if succeeded(future):
+                    if future is hedge:
+                        self.count_hedge_win()
+                    return future.result()
+        return primary.result()
+
+    async def call_async(self, url: str, func: Callable[[str], Awaitable[Any]]):
+        """
+        Asynchronous version of call; the slower query is cancelled.
+        """
+        delay = self.get_hedge_delay(url)
+        if delay is None:
+            return await self.timed_async(url, func)
+        self.count_query()
+
+        primary = asyncio.ensure_future(self.timed_async(url, func))
+        tasks = [primary]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout = delay)
+            if done or not self.acquire_hedge():
+                return await primary
+
+            hedge_url = self.get_hedge_url(url)
+            logger.debug("hedging query to %s after %s seconds using %s", url, delay, hedge_url)
+            hedge = asyncio.ensure_future(self.timed_async(hedge_url, func))
+            tasks.append(hedge)
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, \
+                    return_when = asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if succeeded(task):
+                        if task is hedge:
+                            self.count_hedge_win()
+                        return task.result()
+            return primary.result()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the number of hedgeable queries, hedged queries, hedged queries which won,
+        and hedges not sent because of the cap on extra load.
+        """
+        with self.lock:
+            return {
+                "queries": self.queries,
+                "hedged": self.hedged,
+                "hedge_wins": self.hedge_wins,
+                "over_cap": self.over_cap
+            }
+
+hedger = Hedger(percentile = env_config[constants.HEDGE_PERCENTILE], \
+    min_samples = env_config[constants.HEDGE_MIN_SAMPLES], \
+    max_extra_load = env_config[constants.HEDGE_MAX_EXTRA_LOAD], \
+    alternates = parse_alternates(env_config[constants.HEDGE_ALTERNATE_BACKENDS]))
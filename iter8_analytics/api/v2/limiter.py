@@ -0,0 +1,258 @@
+"""
+Module containing adaptive limits on the number of concurrent queries to each metrics backend.
+"""
+# core python dependencies
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+# iter8 dependencies
+import iter8_analytics.constants as constants
+from iter8_analytics.config import env_config
+from iter8_analytics.api.v2.sessions import get_backend_key
+from iter8_analytics.api.v2.deadline import get_timeout
+
+logger = logging.getLogger('iter8_analytics')
+
+class LimiterSlot:
+    """
+    A slot for one query to a metrics backend, used as a (synchronous or asynchronous)
+    context manager. The query failed if it raised an exception or failed is set.
+    Cancelled queries, and queries for which aborted is set, do not change the limit.
+    """
+
+    def __init__(self, limiter: "ConcurrencyLimiter"):
+        self.limiter = limiter
+        self.failed = False
+        self.aborted = False
+        self.start = None
+
+    def __enter__(self):
+        self.limiter.acquire()
+        self.start = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.release(exc_type)
+
+    async def __aenter__(self):
+        await self.limiter.acquire_async()
+        self.start = time.monotonic()
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        self.release(exc_type)
+
+    def release(self, exc_type):
+        """
+        Release the slot, recording the outcome of the query.
+        """
+        if self.aborted or \
+            (exc_type is not None and issubclass(exc_type, asyncio.CancelledError)):
+            self.limiter.release(None, False)
+        else:
+            self.limiter.release(time.monotonic() - self.start, \
+                self.failed or exc_type is not None)
+
+class ConcurrencyLimiter:
+    """
+    Adaptive (AIMD) limit on the number of concurrent queries to a metrics backend.
+    The limit increases by one per limit successful queries, and is multiplied by backoff
+    after a failed query, or when the backend is overloaded: the short-term average latency
+    exceeds latency_tolerance times the long-term average latency. Averages are exponentially
+    weighted, so that a steady mix of cheap and expensive queries is not taken for overload;
+    overload decreases the limit at most once per limit queries.
+    Queries beyond the limit wait for a slot, until the request deadline.
+
+    Attributes:
+        limit (float): Current limit; the integer part is the number of allowed queries.
+        min_limit (int): Lowest limit.
+        max_limit (int): Highest limit.
+        backoff (float): Multiplicative decrease of the limit.
+        latency_tolerance (float): Short-term average latency, relative to the long-term
+            average latency, beyond which the backend is considered overloaded.
+    """
+
+    # weights of the latest latency in the short-term and long-term average latencies
+    short_smoothing = 0.1
+    long_smoothing = 0.01
+
+    def __init__(self, name: str, initial_limit: int, min_limit: int, max_limit: int, \
+        backoff: float, latency_tolerance: float):
+        self.name = name
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.condition = threading.Condition()
+        self.async_waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+        self.samples = 0
+        self.short_latency = 0.0
+        self.long_latency = 0.0
+        self.since_decrease = 0
+        self.in_flight = 0
+        self.waiting = 0
+
+    def try_acquire(self) -> bool:
+        """
+        Take a slot if one is free; call with the condition held.
+        """
+        if self.in_flight < max(int(self.limit), 1):
+            self.in_flight += 1
+            return True
+        return False
+
+    def acquire(self):
+        """
+        Wait for a slot; raise DeadlineExceededError if the request deadline passes meanwhile.
+        """
+        with self.condition:
+            self.waiting += 1
+            try:
+                while not self.try_acquire():
+                    timeout = get_timeout(float("inf"))
+                    self.condition.wait(None if timeout == float("inf") else timeout)
+            finally:
+                self.waiting -= 1
+
+    async def acquire_async(self):
+        """
+        Asynchronous version of acquire.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            with self.condition:
+                if self.try_acquire():
+                    return
+                future = loop.create_future()
+                self.async_waiters.append((loop, future))
+                self.waiting += 1
+            try:
+                timeout = get_timeout(float("inf"))
+                await asyncio.wait_for(future, None if timeout == float("inf") else timeout)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                with self.condition:
+                    self.waiting -= 1
+                    if (loop, future) in self.async_waiters:
+                        self.async_waiters.remove((loop, future))
+
+    def release(self, latency: Optional[float], failed: bool):
+        """
+        Free a slot and adapt the limit to the latency and outcome of the query;
+        the limit is unchanged if latency is None. All waiters are woken to compete for the slot.
+        """
+        with self.condition:
+            self.in_flight -= 1
+            if latency is not None:
+                self.adapt(latency, failed)
+            self.condition.notify_all()
+            waiters, self.async_waiters = self.async_waiters, []
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(wake, future)
+
+    def adapt(self, latency: float, failed: bool):
+        """
+        Increase the limit additively, or decrease it multiplicatively if the backend
+        failed or is overloaded; call with the condition held.
+        """
+        self.since_decrease += 1
+        overloaded = False
+        if not failed:
+            self.samples += 1
+            self.short_latency = self.smooth(self.short_latency, latency, self.short_smoothing)
+            self.long_latency = self.smooth(self.long_latency, latency, self.long_smoothing)
+            overloaded = self.short_latency > self.latency_tolerance * self.long_latency and \
+                self.since_decrease >= self.limit
+        if failed or overloaded:
+            self.limit = max(float(self.min_limit), self.limit * self.backoff)
+            self.since_decrease = 0
+            logger.debug("concurrency limit for %s decreased to %s", self.name, self.limit)
+        else:
+            self.limit = min(float(self.max_limit), self.limit + 1.0 / self.limit)
+
+    def smooth(self, average: float, latency: float, smoothing: float) -> float:
+        """
+        Update an exponentially weighted average latency; until there are enough samples,
+        it is the plain average of all samples.
+        """
+        weight = max(1.0 / self.samples, smoothing)
+        return average + weight * (latency - average)
+
+    def slot(self) -> LimiterSlot:
+        """
+        Get a slot for one query, to be used as a context manager.
+        """
+        return LimiterSlot(self)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the current limit, and the number of queries in flight and waiting.
+        """
+        with self.condition:
+            return {
+                "limit": int(self.limit),
+                "in_flight": self.in_flight,
+                "waiting": self.waiting
+            }
+
+def wake(future: asyncio.Future):
+    """
+    Wake an asynchronous waiter, unless it is gone.
+    """
+    if not future.done():
+        future.set_result(None)
+
+class ConcurrencyLimiters:
+    """
+    Concurrency limiters keyed by metrics backend (scheme and host).
+    """
+
+    def __init__(self, initial_limit: int, min_limit: int, max_limit: int, \
+        backoff: float, latency_tolerance: float):
+        self.initial_limit = initial_limit
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.lock = threading.Lock()
+        self.limiters: Dict[str, ConcurrencyLimiter] = {}
+
+    def get_limiter(self, url: str) -> ConcurrencyLimiter:
+        """
+        Get the concurrency limiter of the metrics backend of this url.
+        """
+        key = get_backend_key(url)
+        with self.lock:
+            limiter = self.limiters.get(key)
+            if limiter is None:
+                limiter = ConcurrencyLimiter(key, self.initial_limit, self.min_limit, \
+                    self.max_limit, self.backoff, self.latency_tolerance)
+                self.limiters[key] = limiter
+            return limiter
+
+    def reset(self):
+        """
+        Remove all concurrency limiters.
+        """
+        with self.lock:
+            self.limiters.clear()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Get the stats of the concurrency limiter of each metrics backend.
+        """
+        with self.lock:
+            limiters = list(self.limiters.values())
+        return {limiter.name: limiter.stats() for limiter in limiters}
+
+concurrency_limiters = ConcurrencyLimiters( \
+    initial_limit = env_config[constants.BACKEND_CONCURRENCY_INITIAL], \
+    min_limit = env_config[constants.BACKEND_CONCURRENCY_MIN], \
+    max_limit = env_config[constants.BACKEND_CONCURRENCY_MAX], \
+    backoff = env_config[constants.BACKEND_CONCURRENCY_BACKOFF], \
+    latency_tolerance = env_config[constants.BACKEND_LATENCY_TOLERANCE])
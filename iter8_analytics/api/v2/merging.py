@@ -0,0 +1,47 @@
+"""
+Module containing merging of POST queries for several metrics into a single query,
+for metrics backends whose request body holds a list of metrics (such as Sysdig).
+"""
+# core python dependencies
+import copy
+import json
+import logging
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+# iter8 dependencies
+from iter8_analytics.api.v2.types import Method
+
+logger = logging.getLogger('iter8_analytics')
+
+def get_merge_key(request: Dict[str, Any]) -> Optional[str]:
+    """
+    Get the key of a POST query whose JSON body holds a list of metrics;
+    queries with the same url, headers, auth, and body apart from the list of metrics
+    have the same key and can be merged. None if the query cannot be merged.
+    """
+    body = request["body"]
+    if request["method"] != Method.POST or not isinstance(body, dict) or \
+        not isinstance(body.get("metrics"), list) or request.get("form") is not None:
+        return None
+    auth = request["auth"]
+    return json.dumps({
+        "url": request["url"],
+        "params": request["params"],
+        "headers": request["headers"],
+        "auth": None if auth is None else [auth.username, auth.password],
+        "body": {key: value for key, value in body.items() if key != "metrics"}
+    }, sort_keys = True, default = str)
+
+def merge_requests(requests: Sequence[Dict[str, Any]]) -> Tuple[Dict[str, Any], Sequence[int]]:
+    """
+    Merge queries with the same merge key into a single query whose list of metrics
+    is the concatenation of their lists of metrics. Return the merged query and
+    the offset of the metrics of each query in the merged list.
+    """
+    merged = copy.deepcopy(requests[0])
+    merged["body"]["metrics"] = []
+    offsets = []
+    for request in requests:
+        offsets.append(len(merged["body"]["metrics"]))
+        merged["body"]["metrics"].extend(request["body"]["metrics"])
+    return merged, offsets
@@ -2,18 +2,25 @@
 Module containing classes and methods for querying prometheus and returning metric data.
 """
 # core python dependencies
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, wait
+import contextvars
 from datetime import datetime, timezone
 import logging
 from string import Template
-from typing import Sequence, Dict, Any
+from typing import Sequence, Dict, Any, Tuple, Iterable, NamedTuple
 import numbers
 import pprint
 import base64
 import binascii
+import hashlib
 import json
+import re
+import time
 
 # external module dependencies
 import requests
+import httpx
 from requests.auth import HTTPBasicAuth
 import numpy as np
 import jq
@@ -22,9 +29,30 @@ from kubernetes import client as kubeclient
 from kubernetes import config as kubeconfig
 
 # iter8 dependencies
+import iter8_analytics.constants as constants
+from iter8_analytics.config import env_config
 from iter8_analytics.api.v2.types import AggregatedMetricsAnalysis, ExperimentResource, \
     MetricResource, VersionDetail, AggregatedMetric, VersionMetric, MetricType, \
-    AuthType, Method
+    AuthType, Method, MetricInfo, Adapter
+from iter8_analytics.api.v2.sessions import session_pool, stream_stats
+from iter8_analytics.api.v2.coalescing import single_flight
+from iter8_analytics.api.v2.cache import metric_value_cache
+from iter8_analytics.api.v2.checkpoints import Checkpoint, IncrementalQuery, checkpoint_store
+from iter8_analytics.api.v2.merging import get_merge_key, merge_requests
+from iter8_analytics.api.v2.prometheus import parse_prometheus_response
+from iter8_analytics.api.v2.responses import read_response, read_response_async, \
+    read_httpx_response, byte_counters
+from iter8_analytics.api.v2.circuit_breaker import CircuitOpenError, circuit_breakers
+from iter8_analytics.api.v2.hedging import hedger
+from iter8_analytics.api.v2.limiter import concurrency_limiters
+from iter8_analytics.api.v2.deadline import DeadlineExceededError, get_timeout, \
+    deadline_exceeded, current_deadline
+from iter8_analytics.api.v2.cassette import cassette
+from iter8_analytics.api.v2.retry import RetryPolicy, retrier
+from iter8_analytics.api.v2.scheduling import FetchSkippedError, fetch_scheduler, \
+    get_metric_priorities, schedule_groups
+from iter8_analytics.api.v2.planning import current_fetch_plan, plan_metrics
+from iter8_analytics.api.v2.fallback_store import fallback_store, get_fallback_key
 from iter8_analytics.api.utils import Message, MessageLevel
 
 logger = logging.getLogger('iter8_analytics')
@@ -42,13 +70,19 @@ builtin_metrics_nn = [
     "iter8-system/latency-99th-percentile"
 ]
 
+# share the in-cluster kubernetes client for ten minutes, so that rotated tokens are picked up
+@cached(cache=TTLCache(maxsize=1, ttl=600))
+def get_kube_core_api():
+    """initialize the in-cluster kubernetes client"""
+    kubeconfig.load_incluster_config()
+    return kubeclient.CoreV1Api()
+
 # cache secrets data for no longer than ten seconds
 @cached(cache=TTLCache(maxsize=1024, ttl=10))
 def get_secret_data(name, namespace):
     """fetch a secret from Kubernetes cluster and return its decoded data"""
     # use in-cluster kubernetes client to fetch secret
-    kubeconfig.load_incluster_config()
-    core = kubeclient.CoreV1Api()
+    core = get_kube_core_api()
     try:
         sec = core.read_namespaced_secret(name, namespace)
     except kubeclient.exceptions.ApiException as exc:
@@ -102,26 +136,28 @@ def interpolate(template: str, args: dict):
         logger.error("Error while attemping to substitute tag in query template")
         return None, "Error while attemping to substitute tag in query template"
 
-def get_url(metric_resource: MetricResource):
+def get_url(metric_resource: MetricResource, secret_data: Tuple[dict, BaseException] = None):
     """Derive URL by substituting placeholders in the URLTemplate of a metric resource.
     Placeholder substitution will be attempted if the metric resource references a valid secret.
 
     Keyword arguments:
     metric_resource: the metric resource
+    secret_data: (data, err) of the secret referenced in the metric; fetched if None
     """
     if metric_resource.spec.urlTemplate is None:
         return None, ValueError("No URL template is available in metric resource")
     if metric_resource.spec.secret is None: # no need to interpolate
         return metric_resource.spec.urlTemplate, None
-    args, err = get_secret_data_for_metric(metric_resource)
+    args, err = secret_data or get_secret_data_for_metric(metric_resource)
     # interpolate urlTemplate string using secret data
     if err is None:
         return interpolate(metric_resource.spec.urlTemplate, args)
     return None, err
 
-def get_headers(metric_resource: MetricResource):
+def get_headers(metric_resource: MetricResource, secret_data: Tuple[dict, BaseException] = None):
     """
-    Get the headers to be used in the REST query for the given metric.
+    Get the headers to be used in the REST query for the given metric;
+    secret_data is the (data, err) of the secret referenced in the metric, fetched if None.
     """
     headers = {}
     # no headers will be used
@@ -141,7 +177,7 @@ def get_headers(metric_resource: MetricResource):
         return headers, None
 
     # args contain decoded secret data for header template interpolation
-    args, err = get_secret_data_for_metric(metric_resource)
+    args, err = secret_data or get_secret_data_for_metric(metric_resource)
     if err is None:
         for key in headers:
             headers[key], err = interpolate(headers[key], args)
@@ -150,9 +186,11 @@ def get_headers(metric_resource: MetricResource):
         return headers, None
     return None, err
 
-def get_basic_auth(metric_resource: MetricResource):
+def get_basic_auth(metric_resource: MetricResource, \
+    secret_data: Tuple[dict, BaseException] = None):
     """
-    Get basic auth information.
+    Get basic auth information;
+    secret_data is the (data, err) of the secret referenced in the metric, fetched if None.
     """
     # return error if authType is not Basic
     if metric_resource.spec.authType is None or \
@@ -165,7 +203,7 @@ def get_basic_auth(metric_resource: MetricResource):
         return None, ValueError("basic auth requires a secret")
 
     # args contain decoded secret data for basic auth
-    args, err = get_secret_data_for_metric(metric_resource)
+    args, err = secret_data or get_secret_data_for_metric(metric_resource)
     if err is None:
         if "username" in args and "password" in args:
             return HTTPBasicAuth(args["username"], args["password"]), None
@@ -179,8 +217,22 @@ def get_elapsed_time_seconds(start_time) -> int:
     elapsed = int((datetime.now(timezone.utc) - start_time).total_seconds())
     return max(elapsed, 1) # at least one second
 
-def get_params(metric_resource: MetricResource, version: VersionDetail, start_time: datetime):
-    """Interpolate REST query params for metric and return interpolated params"""
+def get_query_elapsed_time_seconds(start_time) -> int:
+    """
+    Elapsed time used in metric queries, rounded down to a multiple of elapsed_time_step_seconds,
+    so that repeated queries are identical and can be served from caches.
+    Elapsed time shorter than one step is not rounded.
+    """
+    elapsed = get_elapsed_time_seconds(start_time)
+    step = env_config[constants.ELAPSED_TIME_STEP_SECONDS]
+    if step <= 1 or elapsed < step:
+        return elapsed
+    return elapsed - elapsed % step
+
+def get_interpolation_args(version: VersionDetail, start_time: datetime) -> Dict[str, str]:
+    """
+    Get the args used for interpolating the params and body of a metric query for a version
+    """
     # args contain data from VersionInfo,
     # along with elapsedTime (time since the start of experiment)
     args = {}
@@ -188,9 +240,41 @@ def get_params(metric_resource: MetricResource, version: VersionDetail, start_ti
     if version.variables is not None and len(version.variables) > 0:
         for variable in version.variables:
             args[variable.name] = variable.value
-    elapsed = get_elapsed_time_seconds(start_time)
+    elapsed = get_query_elapsed_time_seconds(start_time)
+    args["elapsedTime"] = str(elapsed)
+    return args
+
+# metacharacters of RE2 regular expressions, as used in PromQL label matchers
+REGEX_METACHARACTERS = re.compile(r"([\\.+*?()|\[\]{}^$])")
+
+def escape_version_name(name: str) -> str:
+    """
+    Escape the regular expression metacharacters in a version name, so that it matches
+    only itself; the escaping backslashes are doubled, since PromQL label matchers are
+    string literals, in which backslashes are escaped.
+    """
+    return REGEX_METACHARACTERS.sub(r"\\\\\1", name)
+
+def get_batch_interpolation_args(versions: Sequence[VersionDetail], \
+    start_time: datetime) -> Dict[str, str]:
+    """
+    Get the args used for interpolating the params and body of a batch metric query,
+    which covers all versions at once
+    """
+    # names is a regular expression matching the name of any version,
+    # along with elapsedTime (time since the start of experiment)
+    args = {}
+    args["names"] = "|".join([escape_version_name(version.name) for version in versions])
+    elapsed = get_query_elapsed_time_seconds(start_time)
     args["elapsedTime"] = str(elapsed)
+    return args
+
+def get_params(metric_resource: MetricResource, version: VersionDetail, start_time: datetime):
+    """Interpolate REST query params for metric and return interpolated params"""
+    return interpolate_params(metric_resource, get_interpolation_args(version, start_time))
 
+def interpolate_params(metric_resource: MetricResource, args: Dict[str, str]):
+    """Interpolate REST query params for metric using args and return interpolated params"""
     params = {}
     if  metric_resource.spec.params is not None:
         for par in metric_resource.spec.params:
@@ -201,16 +285,10 @@ def get_params(metric_resource: MetricResource, version: VersionDetail, start_ti
 
 def get_body(metric_resource: MetricResource, version: VersionDetail, start_time: datetime):
     """Interpolate POST query body for metric and return interpolated body"""
-    # args contain data from VersionInfo,
-    # along with elapsedTime (time since the start of experiment)
-    args = {}
-    args["name"] = version.name
-    if version.variables is not None and len(version.variables) > 0:
-        for variable in version.variables:
-            args[variable.name] = variable.value
-    elapsed = get_elapsed_time_seconds(start_time)
-    args["elapsedTime"] = str(elapsed)
+    return interpolate_body(metric_resource, get_interpolation_args(version, start_time))
 
+def interpolate_body(metric_resource: MetricResource, args: Dict[str, str]):
+    """Interpolate POST query body for metric using args and return interpolated body"""
     if metric_resource.spec.body is None:
         return None, None
 
@@ -224,11 +302,36 @@ def get_body(metric_resource: MetricResource, version: VersionDetail, start_time
     except json.JSONDecodeError as jde:
         return None, jde
 
-def get_raw_response(url, method, params, body, headers, auth, timeout):
-    """Send GET or POST request to the url and get HTTP response"""
+def get_httpx_kw_args(url, params, body, headers, auth, timeout, form = None):
+    """
+    Get the keyword arguments of a request sent using an httpx client.
+    """
+    kw_args = {
+        "url": url,
+    }
+
+    if params is not None:
+        kw_args["params"] = params
+    if headers is not None:
+        kw_args["headers"] = headers
+    if body is not None:
+        kw_args["json"] = body
+    if form is not None:
+        kw_args["data"] = form
+    if auth is not None:
+        kw_args["auth"] = (auth.username, auth.password)
+    if timeout is not None:
+        kw_args["timeout"] = timeout
+    return kw_args
+
+def get_session_response(url, method, params, body, headers, auth, timeout, form = None):
+    """
+    Send GET or POST request to the url using the pooled session of the metrics backend.
+    """
     kw_args = {
         "url": url,
         "verify": False,
+        "stream": True
     }
 
     if params is not None:
@@ -237,25 +340,110 @@ def get_raw_response(url, method, params, body, headers, auth, timeout):
         kw_args["headers"] = headers
     if body is not None:
         kw_args["json"] = body
+    if form is not None:
+        kw_args["data"] = form
     if auth is not None:
         kw_args["auth"] = auth
     if timeout is not None:
         kw_args["timeout"] = timeout
 
+    # connections to the metrics backend are pooled and kept alive across requests
+    session = session_pool.get_session(url)
     if method == Method.GET:
-        return requests.get(**kw_args)
-    if method == Method.POST:
-        return requests.post(**kw_args)
-    raise ValueError("Unknown HTTP request method")
+        raw_response = session.get(**kw_args)
+    elif method == Method.POST:
+        raw_response = session.post(**kw_args)
+    else:
+        raise ValueError("Unknown HTTP request method")
+    return read_response(raw_response, env_config[constants.BACKEND_MAX_RESPONSE_BYTES])
+
+def get_http2_response(url, method, params, body, headers, auth, timeout, form = None):
+    """
+    Send GET or POST request to the url using the HTTP/2 client of the metrics backend;
+    concurrent requests from all threads are multiplexed over its connection.
+    """
+    if method not in (Method.GET, Method.POST):
+        raise ValueError("Unknown HTTP request method")
+    client = session_pool.get_http2_client(url)
+    with stream_stats.stream(url) as stream:
+        with client.stream(method.value, **get_httpx_kw_args(url, params, body, headers, \
+            auth, timeout, form)) as raw_response:
+            stream["http_version"] = raw_response.http_version
+            return read_httpx_response(raw_response, \
+                env_config[constants.BACKEND_MAX_RESPONSE_BYTES])
+
+def get_raw_response(url, method, params, body, headers, auth, timeout, form = None):
+    """
+    Send GET or POST request to the url and get HTTP response.
+    The body is sent as JSON, or form is sent as a form.
+    The response body is streamed and read up to the maximum response size.
+    Metrics backends which support HTTP/2 may be queried over HTTP/2.
+    In cassette replay mode, the recorded response is returned instead;
+    in cassette record mode, the response is recorded.
+    """
+    if cassette.replaying():
+        response, latency = cassette.replay(url, method, params, body, form)
+        if latency > 0:
+            time.sleep(latency)
+        return response
+
+    start = time.monotonic()
+    if session_pool.uses_http2(url):
+        response = get_http2_response(url, method, params, body, headers, auth, timeout, form)
+    else:
+        response = get_session_response(url, method, params, body, headers, auth, timeout, form)
+    if cassette.recording():
+        cassette.record(url, method, params, body, form, response, time.monotonic() - start)
+    return response
+
+async def get_raw_response_async(client: httpx.AsyncClient, url, method, params, body, \
+    headers, auth, timeout, form = None):
+    """
+    Send GET or POST request to the url using an asynchronous client and get HTTP response.
+    If client is None, the pooled client for the metrics backend is used; it is an HTTP/2 client
+    if the metrics backend is queried over HTTP/2.
+    The response body is streamed and read up to the maximum response size.
+    Responses are recorded or replayed as in get_raw_response;
+    the cassette file is read and written in the default executor, off the event loop.
+    """
+    loop = asyncio.get_running_loop()
+    if cassette.replaying():
+        response, latency = await loop.run_in_executor(None, cassette.replay, \
+            url, method, params, body, form)
+        if latency > 0:
+            await asyncio.sleep(latency)
+        return response
+
+    kw_args = get_httpx_kw_args(url, params, body, headers, auth, timeout, form)
+    if client is None:
+        client = session_pool.get_async_client(url)
+    if method not in (Method.GET, Method.POST):
+        raise ValueError("Unknown HTTP request method")
+    start = time.monotonic()
+    if session_pool.uses_http2(url):
+        with stream_stats.stream(url) as stream:
+            async with client.stream(method.value, **kw_args) as raw_response:
+                stream["http_version"] = raw_response.http_version
+                response = await read_response_async(raw_response, \
+                    env_config[constants.BACKEND_MAX_RESPONSE_BYTES])
+    else:
+        async with client.stream(method.value, **kw_args) as raw_response:
+            response = await read_response_async(raw_response, \
+                env_config[constants.BACKEND_MAX_RESPONSE_BYTES])
+    if cassette.recording():
+        await loop.run_in_executor(None, cassette.record, url, method, params, body, form, \
+            response, time.monotonic() - start)
+    return response
 
-def unmarshal(response, jq_expression):
+def unmarshal(response, jq_expression, jq_args = None):
     """
-    Unmarshal metric value from metric response
+    Unmarshal metric value from metric response;
+    jq_args, if any, are bound to variables in the jq expression
     """
     try:
         # in general, jq execution could yield multiple values
         # we will use the first value
-        num = jq.compile(jq_expression).input(response).first()
+        num = jq.compile(jq_expression, args = jq_args).input(response).first()
         # if that value is not a number, there is an error
         if isinstance(num, numbers.Number) and not np.isnan(num):
             return num, None
@@ -299,63 +487,867 @@ def mocked_value(metric_resource: MetricResource, version: VersionDetail, start_
         beta = np.random.beta(_alpha, _beta)
         return (beta * 2 * named_level.level, None)
 
-def get_metric_value(metric_resource: MetricResource, version: VersionDetail, start_time: datetime):
+def uses_prometheus_adapter(metric_resource: MetricResource) -> bool:
     """
-    Interpolate metrics backend URL, headerTemplates, and REST query parameters;
-    query the metrics backend; return the value of the metric.
+    Check if the metric is queried and parsed using the built-in Prometheus adapter.
     """
-    if is_mocked(metric_resource):
-        metric_resource.spec.convert_to_float()
-        return mocked_value(metric_resource, version, start_time)
+    return metric_resource.spec.adapter == Adapter.PROMETHEUS and not metric_resource.spec.batch
+
+class RequestPlan(NamedTuple):
+    """
+    Compiled REST query of a metric: the metrics backend URL, headers and auth are resolved,
+    and the templates of the REST query params and body are parsed, so that only
+    the interpolation args differ between queries for different versions.
+    """
+    url: str
+    headers: Dict[str, str]
+    auth: HTTPBasicAuth
+    params: Sequence[Tuple[str, Template]]
+    body: Template
+
+# compiled request plans of the metrics being evaluated, by id of the metric resource;
+# copied into asyncio tasks and into the threads fetching metric values
+current_request_plans: contextvars.ContextVar = \
+    contextvars.ContextVar("iter8_analytics_request_plans", default = None)
 
-    (value, err) = (None, None)
+def compile_request_plan(metric_resource: MetricResource):
+    """
+    Resolve the metrics backend URL, headerTemplates and basic auth of the metric,
+    reading its secret at most once, and parse its REST query param and body templates;
+    return (request plan, None), or (None, err).
+    """
+    secret_data = get_secret_data_for_metric(metric_resource) \
+        if metric_resource.spec.secret is not None else (None, None)
     # interpolated metrics backend URL
-    url, err = get_url(metric_resource)
-    params, headers, auth, body = None, None, None, None
-    if err is None:
-        # interpolated params
-        params, err = get_params(metric_resource, version, start_time)
-        logger.debug("Params error: %s", err)
-        if params == {}:
-            params = None
+    url, err = get_url(metric_resource, secret_data)
+    headers, auth = None, None
     if err is None:
         # interpolated header templates
-        headers, err = get_headers(metric_resource)
+        headers, err = get_headers(metric_resource, secret_data)
         logger.debug("Headers error: %s", err)
         if headers == {}:
             headers = None
     if err is None:
         if metric_resource.spec.authType == AuthType.BASIC:
             # basic auth info
-            auth, err = get_basic_auth(metric_resource)
+            auth, err = get_basic_auth(metric_resource, secret_data)
             logger.debug("Auth error: %s", err)
-    if err is None:
-        body, err = get_body(metric_resource, version, start_time)
-        logger.debug("Body error: %s", err)
+    if err is not None:
+        return None, err
+    return RequestPlan(url = url, headers = headers, auth = auth, \
+        params = [(par.name, Template(par.value)) for par in metric_resource.spec.params or []], \
+        body = None if metric_resource.spec.body is None else Template(metric_resource.spec.body)),\
+            None
 
-    if err is None:
+def compile_request_plans(metric_resources: Iterable[MetricResource]) -> Dict[int, Tuple[ \
+    MetricResource, Tuple[RequestPlan, BaseException]]]:
+    """
+    Compile the request plans of metrics (mocked metrics have none), by id of the metric resource.
+    """
+    plans = {}
+    for metric_resource in metric_resources:
+        if id(metric_resource) not in plans and not is_mocked(metric_resource):
+            plans[id(metric_resource)] = (metric_resource, compile_request_plan(metric_resource))
+    return plans
+
+def set_request_plans(metric_resources: Iterable[MetricResource]) -> contextvars.Token:
+    """
+    Compile the request plans of the metrics about to be evaluated (mocked metrics have none);
+    they are used by all queries until reset_request_plans. Return the token for resetting them.
+    """
+    return current_request_plans.set(compile_request_plans(metric_resources))
+
+async def set_request_plans_async(metric_resources: Iterable[MetricResource]) \
+    -> contextvars.Token:
+    """
+    Asynchronous version of set_request_plans; plans are compiled in the default executor,
+    since reading secrets from the Kubernetes API server blocks.
+    """
+    plans = await asyncio.get_running_loop().run_in_executor(None, compile_request_plans, \
+        list(metric_resources))
+    return current_request_plans.set(plans)
+
+def reset_request_plans(token: contextvars.Token):
+    """
+    Restore the request plans in effect before set_request_plans.
+    """
+    current_request_plans.reset(token)
+
+def has_request_plan(metric_resource: MetricResource) -> bool:
+    """
+    Check if the request plan of the metric is compiled for the current evaluation.
+    """
+    plans = current_request_plans.get()
+    return plans is not None and id(metric_resource) in plans and \
+        plans[id(metric_resource)][0] is metric_resource
+
+def get_request_plan(metric_resource: MetricResource):
+    """
+    Get the request plan of the metric compiled for the current evaluation,
+    or compile one if the metric is not being evaluated.
+    """
+    if has_request_plan(metric_resource):
+        return current_request_plans.get()[id(metric_resource)][1]
+    return compile_request_plan(metric_resource)
+
+def substitute(template: Template, args: Dict[str, str]):
+    """
+    Interpolate a parsed template using a dictionary
+    """
+    try:
+        # if placeholder values are not present in args dictionary,
+        # then no interpolation will occur ... this is the behavior of safe_substitute
+        return template.safe_substitute(**args), None
+    except Exception:
+        logger.error("Error while attemping to substitute tag in query template")
+        return None, "Error while attemping to substitute tag in query template"
+
+def get_metric_request(metric_resource: MetricResource, args: Dict[str, str]):
+    """
+    Interpolate REST query parameters and body using args, on top of the request plan
+    of the metric; return the keyword arguments for the REST query to the metrics backend.
+    """
+    plan, err = get_request_plan(metric_resource)
+    if err is not None:
+        return None, err
+    # interpolated params
+    params = {}
+    for name, template in plan.params:
+        params[name], err = substitute(template, args)
+        if err is not None:
+            logger.debug("Params error: %s", err)
+            return None, err
+    if params == {}:
+        params = None
+    body = None
+    if plan.body is not None:
+        interpolated_body, err = substitute(plan.body, args)
+        if err is None:
+            try:
+                body = json.loads(interpolated_body)
+            except json.JSONDecodeError as jde:
+                err = jde
+        if err is not None:
+            logger.debug("Body error: %s", err)
+            return None, err
+
+    if uses_prometheus_adapter(metric_resource):
+        # Prometheus accepts query params as a POST form, which avoids URL length limits
+        return {
+            "url": plan.url,
+            "method": Method.POST,
+            "params": None,
+            "body": None,
+            "headers": plan.headers,
+            "auth": plan.auth,
+            "form": params
+        }, None
+    return {
+        "url": plan.url,
+        "method": metric_resource.spec.method,
+        "params": params,
+        "body": body,
+        "headers": plan.headers,
+        "auth": plan.auth,
+        "form": None
+    }, None
+
+def get_request_key(request: Dict[str, Any]) -> str:
+    """
+    Get a canonical key for the REST query to the metrics backend;
+    queries with the same method, url, params, headers, auth, body and form have the same key.
+    """
+    auth = request["auth"]
+    canonical = json.dumps({
+        "url": request["url"],
+        "method": request["method"],
+        "params": request["params"],
+        "body": request["body"],
+        "headers": request["headers"],
+        "auth": None if auth is None else [auth.username, auth.password],
+        "form": request["form"]
+    }, sort_keys = True, default = str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+def get_cache_key(metric_resource: MetricResource, request: Dict[str, Any], \
+    jq_args: Dict[str, str] = None) -> Tuple[str, str, str]:
+    """
+    Get the key of the metric value in the metric value cache.
+    """
+    return get_request_key(request), metric_resource.spec.jqExpression, \
+        json.dumps(jq_args, sort_keys = True)
+
+def get_cache_ttl(metric_resource: MetricResource) -> float:
+    """
+    Get the duration (in seconds) for which values of this metric are cached.
+    Values of incremental metrics are not cached, since each query covers a different window.
+    """
+    if is_incremental(metric_resource):
+        return 0.0
+    if metric_resource.spec.cacheTTL is not None:
+        return metric_resource.spec.cacheTTL
+    return env_config[constants.METRIC_CACHE_TTL_SECONDS]
+
+def is_deadline_timeout(exc: BaseException, timeout: float) -> bool:
+    """
+    Check if the query timed out with a timeout shortened to the deadline of the request;
+    only timeouts at the full metrics backend timeout are failures of the backend.
+    """
+    return isinstance(exc, (requests.exceptions.Timeout, httpx.TimeoutException)) and \
+        timeout is not None and timeout < env_config[constants.METRICS_BACKEND_TIMEOUT_SECONDS]
+
+def call_backend(url: str, func, timeout: float = None):
+    """
+    Return the HTTP response func(timeout) unless the circuit breaker of the metrics backend
+    is open, in which case raise CircuitOpenError. The timeout is shortened to the deadline of
+    the request, if any. func() waits for a slot of the concurrency limiter of the metrics backend.
+    Request exceptions and server error responses count as failures of the backend, except for
+    timeouts shortened to the deadline.
+    """
+    timeout = None if timeout is None else get_timeout(timeout)
+    breaker = circuit_breakers.get_breaker(url)
+    breaker.before_call()
+    try:
+        with concurrency_limiters.get_limiter(url).slot() as slot:
+            try:
+                raw_response = func(timeout)
+            except BaseException as exc:
+                slot.aborted = is_deadline_timeout(exc, timeout)
+                raise
+            slot.failed = raw_response.status_code >= 500
+    except (requests.exceptions.RequestException, httpx.HTTPError) as exc:
+        if is_deadline_timeout(exc, timeout):
+            breaker.on_abort()
+        else:
+            breaker.on_failure()
+        raise
+    except BaseException:
+        breaker.on_abort()
+        raise
+    breaker.on_response(raw_response.status_code)
+    return raw_response
+
+async def call_backend_async(url: str, func, timeout: float = None):
+    """
+    Asynchronous version of call_backend.
+    """
+    timeout = None if timeout is None else get_timeout(timeout)
+    breaker = circuit_breakers.get_breaker(url)
+    breaker.before_call()
+    try:
+        async with concurrency_limiters.get_limiter(url).slot() as slot:
+            try:
+                raw_response = await func(timeout)
+            except BaseException as exc:
+                slot.aborted = is_deadline_timeout(exc, timeout)
+                raise
+            slot.failed = raw_response.status_code >= 500
+    except httpx.HTTPError as exc:
+        if is_deadline_timeout(exc, timeout):
+            breaker.on_abort()
+        else:
+            breaker.on_failure()
+        raise
+    except BaseException:
+        breaker.on_abort()
+        raise
+    breaker.on_response(raw_response.status_code)
+    return raw_response
+
+def raise_deadline_error(exc: Exception):
+    """
+    Raise the error of a failed query as a DeadlineExceededError if the deadline of the request
+    has passed, since the query may have been cut short by the deadline; otherwise, raise it.
+    """
+    if deadline_exceeded() and not isinstance(exc, DeadlineExceededError):
+        raise DeadlineExceededError( \
+            f"deadline exceeded while querying metrics backend: {exc}") from exc
+    raise exc
+
+def get_response(request: Dict[str, Any], timeout: float, policy: RetryPolicy = None):
+    """
+    Query the metrics backend and return its JSON response.
+    Identical queries in flight at the same time share one backend call and one parsed response,
+    except for a call failed by the deadline of the request which made it; requests coalesced
+    with it query the metrics backend again, within their own deadlines.
+    Transient failures are retried according to the retry policy, if any.
+    """
+    def fetch():
+        logger.debug("Invoking requests with method %s and with \
+            url %s and params: %s and headers: %s and auth: %s and body: %s", \
+                request["method"], request["url"], request["params"], request["headers"], \
+                    request["auth"], request["body"])
+        try:
+            raw_response = retrier.call(policy or RetryPolicy(0), request["method"], \
+                lambda: hedger.call(request["url"], lambda url: call_backend(url, \
+                    lambda timeout: get_raw_response(**dict(request, url = url), \
+                        timeout = timeout), timeout)))
+        except Exception as exc: # pylint: disable=broad-except
+            raise_deadline_error(exc)
+        logger.debug("response status code: %s", raw_response.status_code)
+        logger.debug("response of %s bytes: %s", len(raw_response.content), \
+            raw_response.preview())
+        response = raw_response.json()
+        logger.debug("json response...")
+        logger.debug(response)
+        return response
+
+    return single_flight.do(get_request_key(request), fetch, \
+        unshared = (DeadlineExceededError,))
+
+async def get_response_async(request: Dict[str, Any], timeout: float, \
+    client: httpx.AsyncClient = None, policy: RetryPolicy = None):
+    """
+    Asynchronous version of get_response.
+    The shared query runs in a task of its own, within the deadline of the first caller,
+    and is not cancelled as long as any caller waits for it; each caller waits for it
+    no longer than its own deadline.
+    """
+    async def fetch():
+        logger.debug("Invoking httpx with method %s and with \
+            url %s and params: %s and headers: %s and auth: %s and body: %s", \
+                request["method"], request["url"], request["params"], request["headers"], \
+                    request["auth"], request["body"])
+        try:
+            raw_response = await retrier.call_async(policy or RetryPolicy(0), \
+                request["method"], lambda: hedger.call_async(request["url"], \
+                    lambda url: call_backend_async(url, lambda timeout: get_raw_response_async( \
+                        client, **dict(request, url = url), timeout = timeout), timeout)))
+        except Exception as exc: # pylint: disable=broad-except
+            raise_deadline_error(exc)
+        logger.debug("response status code: %s", raw_response.status_code)
+        logger.debug("response of %s bytes: %s", len(raw_response.content), \
+            raw_response.preview())
+        response = raw_response.json()
+        logger.debug("json response...")
+        logger.debug(response)
+        return response
+
+    deadline = current_deadline.get()
+    if deadline is None:
+        return await single_flight.do_async(get_request_key(request), fetch, \
+            unshared = (DeadlineExceededError,))
+    wait_timeout = get_timeout(deadline.remaining())
+    try:
+        return await asyncio.wait_for(single_flight.do_async(get_request_key(request), fetch, \
+            unshared = (DeadlineExceededError,)), timeout = wait_timeout)
+    except asyncio.TimeoutError as exc:
+        raise DeadlineExceededError("deadline exceeded while querying metrics backend") from exc
+
+def get_value_from_response(metric_resource: MetricResource, response, \
+    jq_args: Dict[str, str] = None):
+    """
+    Unmarshal the value of the metric from the JSON response of the metrics backend.
+    """
+    if uses_prometheus_adapter(metric_resource):
+        return parse_prometheus_response(response)
+    logger.debug("unmarshaling metrics response using jqExpression...")
+    if metric_resource.spec.jqExpression is None:
+        return None, ValueError("no jqExpression is specific in metric resource")
+    return unmarshal(response, metric_resource.spec.jqExpression, jq_args)
+
+def get_jq_args(version: VersionDetail) -> Dict[str, str]:
+    """
+    Get the jq variables used for unmarshaling the value of a version from a batch response,
+    namely, the name of the version and its variables.
+    """
+    jq_args = {}
+    if version.variables is not None:
+        for variable in version.variables:
+            # only valid identifiers can be jq variables
+            if variable.name.isidentifier():
+                jq_args[variable.name] = variable.value
+    jq_args["name"] = version.name
+    return jq_args
+
+def get_cached_values(metric_resource: MetricResource, request: Dict[str, Any], \
+    jq_args: Sequence[Dict[str, str]]):
+    """
+    Get the cache keys and cache ttl for the values unmarshaled using each jq_args,
+    and the cached values, or None unless all of them are cached.
+    """
+    cache_keys = [get_cache_key(metric_resource, request, args) for args in jq_args]
+    cache_ttl = get_cache_ttl(metric_resource)
+    if cache_ttl <= 0:
+        return cache_keys, cache_ttl, None
+    values = []
+    for cache_key in cache_keys:
+        value, found = metric_value_cache.get(cache_key)
+        if not found:
+            return cache_keys, cache_ttl, None
+        values.append((value, None))
+    return cache_keys, cache_ttl, values
+
+def get_values_from_response(metric_resource: MetricResource, response, \
+    jq_args: Sequence[Dict[str, str]], cache_keys, cache_ttl):
+    """
+    Unmarshal a value of the metric from the JSON response using each jq_args,
+    and cache the values.
+    """
+    values = []
+    for args, cache_key in zip(jq_args, cache_keys):
+        value, err = get_value_from_response(metric_resource, response, args)
+        if err is None:
+            metric_value_cache.put(cache_key, value, cache_ttl)
+        values.append((value, err))
+    return values
+
+def get_retry_policy(metric_resource: MetricResource) -> RetryPolicy:
+    """
+    Get the retry policy of queries of the metric.
+    Queries of the Prometheus adapter are read-only POST forms, which are retried by default.
+    """
+    retries = metric_resource.spec.retries
+    retry_post = metric_resource.spec.retryPost
+    return RetryPolicy(retries = env_config[constants.METRICS_BACKEND_RETRIES] \
+        if retries is None else retries, retry_post = uses_prometheus_adapter(metric_resource) \
+            if retry_post is None else retry_post)
+
+def fetch_response(request: Dict[str, Any], policy: RetryPolicy = None):
+    """
+    Query the metrics backend within the request deadline; return (JSON response, None),
+    or (None, err) if the query failed.
+    """
+    try:
+        return get_response(request, timeout = get_timeout(
+            env_config[constants.METRICS_BACKEND_TIMEOUT_SECONDS]), policy = policy), None
+    except (requests.exceptions.RequestException, httpx.HTTPError, httpx.InvalidURL, \
+        json.decoder.JSONDecodeError, ValueError, DeadlineExceededError, \
+        CircuitOpenError) as exc:
+        return None, get_fetch_error(exc)
+
+async def fetch_response_async(request: Dict[str, Any], client: httpx.AsyncClient = None, \
+    policy: RetryPolicy = None):
+    """
+    Asynchronous version of fetch_response.
+    """
+    try:
+        return await get_response_async(request, \
+            timeout = env_config[constants.METRICS_BACKEND_TIMEOUT_SECONDS], client = client, \
+                policy = policy), None
+    except (httpx.HTTPError, httpx.InvalidURL, \
+        json.decoder.JSONDecodeError, ValueError, DeadlineExceededError, \
+        CircuitOpenError) as exc:
+        return None, get_fetch_error(exc)
+
+def get_fetch_error(exc: BaseException) -> BaseException:
+    """
+    Log the error of a failed query; errors after the deadline has passed are deadline errors.
+    """
+    if deadline_exceeded() and not isinstance(exc, DeadlineExceededError):
+        exc = DeadlineExceededError(f"deadline exceeded while querying metrics backend: {exc}")
+    logger.error("Error while attempting to get metric value from backend")
+    logger.error(exc)
+    return exc
+
+def query_metric_values(metric_resource: MetricResource, request: Dict[str, Any], \
+    jq_args: Sequence[Dict[str, str]]):
+    """
+    Query the metrics backend; unmarshal a value of the metric using each jq_args.
+    Values are served from the metric value cache, if they are cached.
+    """
+    cache_keys, cache_ttl, values = get_cached_values(metric_resource, request, jq_args)
+    if values is not None:
+        return values
+
+    response, err = fetch_response(request, get_retry_policy(metric_resource))
+    if err is not None:
+        return [(None, err)] * len(jq_args)
+    return get_values_from_response(metric_resource, response, jq_args, cache_keys, cache_ttl)
+
+async def query_metric_values_async(metric_resource: MetricResource, request: Dict[str, Any], \
+    jq_args: Sequence[Dict[str, str]], client: httpx.AsyncClient = None):
+    """
+    Asynchronous version of query_metric_values.
+    """
+    cache_keys, cache_ttl, values = get_cached_values(metric_resource, request, jq_args)
+    if values is not None:
+        return values
+
+    response, err = await fetch_response_async(request, client, \
+        get_retry_policy(metric_resource))
+    if err is not None:
+        return [(None, err)] * len(jq_args)
+    return get_values_from_response(metric_resource, response, jq_args, cache_keys, cache_ttl)
+
+def get_merge_jq_args(metric_resource: MetricResource, offset: int = 0):
+    """
+    Get the jq variables for unmarshaling the value of a merge metric at this offset;
+    None for other metrics.
+    """
+    return {"offset": offset} if metric_resource.spec.merge else None
+
+def get_merged_query(members: Sequence[Tuple[MetricResource, VersionDetail, Dict[str, Any]]]):
+    """
+    Get the cached results of the (metric resource, version, request) members of a merged query,
+    and the merged request and offsets for the members which are not cached.
+    """
+    results = [None] * len(members)
+    uncached = []
+    for index, (metric_resource, _, request) in enumerate(members):
+        _, _, values = get_cached_values(metric_resource, request, \
+            [get_merge_jq_args(metric_resource)])
+        if values is None:
+            uncached.append(index)
+        else:
+            results[index] = values[0]
+    merged_request, offsets = None, []
+    if len(uncached) > 0:
+        merged_request, offsets = merge_requests([members[index][2] for index in uncached])
+    return results, uncached, merged_request, offsets
+
+def get_merged_values(members: Sequence[Tuple[MetricResource, VersionDetail, Dict[str, Any]]], \
+    results, uncached: Sequence[int], offsets: Sequence[int], response, err: BaseException):
+    """
+    Unmarshal the value of each uncached member from the response of the merged query,
+    and cache the values.
+    """
+    for index, offset in zip(uncached, offsets):
+        if err is not None:
+            results[index] = (None, err)
+            continue
+        metric_resource, _, request = members[index]
+        cache_keys = [get_cache_key(metric_resource, request, get_merge_jq_args(metric_resource))]
+        results[index] = get_values_from_response(metric_resource, response, \
+            [get_merge_jq_args(metric_resource, offset)], cache_keys, \
+                get_cache_ttl(metric_resource))[0]
+    return results
+
+def get_merged_retry_policy(members: Sequence[Tuple[MetricResource, VersionDetail, \
+    Dict[str, Any]]]) -> RetryPolicy:
+    """
+    Get the retry policy of a merged query: the fewest retries of its members,
+    and POST retries only if all members opt in.
+    """
+    policies = [get_retry_policy(metric_resource) for metric_resource, _, _ in members]
+    return RetryPolicy(retries = min(policy.retries for policy in policies), \
+        retry_post = all(policy.retry_post for policy in policies))
+
+def get_merged_metric_values(members: Sequence[Tuple[MetricResource, VersionDetail, \
+    Dict[str, Any]]]):
+    """
+    Query the metrics backend once for the (metric resource, version, request) members
+    of a merged query; return the value of each member.
+    """
+    results, uncached, merged_request, offsets = get_merged_query(members)
+    if merged_request is None:
+        return results
+    response, err = fetch_response(merged_request, get_merged_retry_policy(members))
+    return get_merged_values(members, results, uncached, offsets, response, err)
+
+async def get_merged_metric_values_async(members: Sequence[Tuple[MetricResource, VersionDetail, \
+    Dict[str, Any]]], client: httpx.AsyncClient = None):
+    """
+    Asynchronous version of get_merged_metric_values.
+    """
+    results, uncached, merged_request, offsets = get_merged_query(members)
+    if merged_request is None:
+        return results
+    response, err = await fetch_response_async(merged_request, client, \
+        get_merged_retry_policy(members))
+    return get_merged_values(members, results, uncached, offsets, response, err)
+
+def is_incremental(metric_resource: MetricResource) -> bool:
+    """
+    Check if the metric is a counter evaluated incrementally.
+    """
+    return metric_resource.spec.incremental and \
+        metric_resource.spec.type == MetricType.Counter and not metric_resource.spec.batch
+
+def get_incremental_query(metric_resource: MetricResource, version: VersionDetail, \
+    start_time: datetime):
+    """
+    Get the query of an incremental counter metric for the window since its checkpoint.
+    Checkpoints are keyed by the start time of the experiment and the metric query
+    (interpolated without elapsedTime). Without a usable checkpoint, the whole experiment is
+    queried and the value is added to a zero checkpoint.
+    Windows are computed from the elapsed time rounded only to seconds, not to
+    elapsed_time_step_seconds, since the query is evaluated at the current time, and
+    consecutive windows must neither overlap nor leave gaps.
+    """
+    args = get_interpolation_args(version, start_time)
+    elapsed = get_elapsed_time_seconds(start_time)
+    key_request, err = get_metric_request(metric_resource, dict(args, elapsedTime = ""))
+    if err is not None:
+        return None, err
+    key = (start_time.isoformat(), get_request_key(key_request), \
+        metric_resource.spec.jqExpression)
+
+    checkpoint = checkpoint_store.get(key)
+    if checkpoint is None or checkpoint.elapsed_time > elapsed:
+        checkpoint = Checkpoint(value = 0.0, elapsed_time = 0)
+    if checkpoint.elapsed_time == elapsed:
+        return IncrementalQuery(key, elapsed, checkpoint, None), None
+    request, err = get_metric_request(metric_resource, \
+        dict(args, elapsedTime = str(elapsed - checkpoint.elapsed_time)))
+    if err is not None:
+        return None, err
+    return IncrementalQuery(key, elapsed, checkpoint, request), None
+
+def update_checkpoint(query: IncrementalQuery, value: numbers.Number, err: BaseException):
+    """
+    Add the value for the window since the checkpoint to the checkpoint,
+    store the new checkpoint, and return the value of the counter.
+    """
+    if err is not None:
+        return None, err
+    value = query.checkpoint.value + value
+    checkpoint_store.put(query.key, Checkpoint(value = value, elapsed_time = query.elapsed_time))
+    return value, None
+
+def get_metric_value(metric_resource: MetricResource, version: VersionDetail, start_time: datetime):
+    """
+    Interpolate metrics backend URL, headerTemplates, and REST query parameters;
+    query the metrics backend; return the value of the metric.
+    """
+    if is_mocked(metric_resource):
+        metric_resource.spec.convert_to_float()
+        return mocked_value(metric_resource, version, start_time)
+
+    if is_incremental(metric_resource):
+        query, err = get_incremental_query(metric_resource, version, start_time)
+        if err is not None:
+            return None, err
+        if query.request is None:
+            return query.checkpoint.value, None
+        value, err = query_metric_values(metric_resource, query.request, [None])[0]
+        return update_checkpoint(query, value, err)
+
+    request, err = get_metric_request(metric_resource, \
+        get_interpolation_args(version, start_time))
+    if err is not None:
+        return None, err
+    return query_metric_values(metric_resource, request, [get_merge_jq_args(metric_resource)])[0]
+
+async def get_metric_value_async(metric_resource: MetricResource, version: VersionDetail, \
+    start_time: datetime, client: httpx.AsyncClient = None):
+    """
+    Asynchronous version of get_metric_value;
+    the metrics backend is queried using the given asynchronous HTTP client,
+    or the pooled client for the metrics backend if no client is given.
+    """
+    if is_mocked(metric_resource):
+        metric_resource.spec.convert_to_float()
+        return mocked_value(metric_resource, version, start_time)
+
+    if not has_request_plan(metric_resource):
+        # the metric is not part of an evaluation; compile its plan off the event loop
+        token = await set_request_plans_async([metric_resource])
+        try:
+            return await get_metric_value_async(metric_resource, version, start_time, client)
+        finally:
+            reset_request_plans(token)
+
+    if is_incremental(metric_resource):
+        query, err = get_incremental_query(metric_resource, version, start_time)
+        if err is not None:
+            return None, err
+        if query.request is None:
+            return query.checkpoint.value, None
+        value, err = (await query_metric_values_async(metric_resource, query.request, \
+            [None], client))[0]
+        return update_checkpoint(query, value, err)
+
+    request, err = get_metric_request(metric_resource, \
+        get_interpolation_args(version, start_time))
+    if err is not None:
+        return None, err
+    return (await query_metric_values_async(metric_resource, request, \
+        [get_merge_jq_args(metric_resource)], client))[0]
+
+def get_batch_metric_values(metric_resource: MetricResource, versions: Sequence[VersionDetail], \
+    start_time: datetime):
+    """
+    Query the metrics backend once for all versions of a batch metric;
+    return the value of the metric for each version.
+    The query is interpolated using the names of all versions ($names);
+    the value of each version is unmarshaled with its name and variables bound to jq variables.
+    """
+    if is_mocked(metric_resource):
+        return [get_metric_value(metric_resource, version, start_time) for version in versions]
+
+    request, err = get_metric_request(metric_resource, \
+        get_batch_interpolation_args(versions, start_time))
+    if err is not None:
+        return [(None, err)] * len(versions)
+    return query_metric_values(metric_resource, request, \
+        [get_jq_args(version) for version in versions])
+
+async def get_batch_metric_values_async(metric_resource: MetricResource, \
+    versions: Sequence[VersionDetail], start_time: datetime, client: httpx.AsyncClient = None):
+    """
+    Asynchronous version of get_batch_metric_values.
+    """
+    if is_mocked(metric_resource):
+        return [await get_metric_value_async(metric_resource, version, start_time, client) \
+            for version in versions]
+
+    if not has_request_plan(metric_resource):
+        # the metric is not part of an evaluation; compile its plan off the event loop
+        token = await set_request_plans_async([metric_resource])
         try:
-            logger.debug("Invoking requests with method %s and with \
-                url %s and params: %s and headers: %s and auth: %s and body: %s", \
-                    metric_resource.spec.method, url, params, headers, auth, body)
-            raw_response = get_raw_response(url = url, \
-                method = metric_resource.spec.method, params = params, body = body, \
-                    headers = headers, auth = auth, timeout = 5.0)
-            logger.debug("response status code: %s", raw_response.status_code)
-            logger.debug("response text: %s", raw_response.text)
-            response = raw_response.json()
-            logger.debug("json response...")
-            logger.debug(response)
-        except (requests.exceptions.RequestException, \
-            json.decoder.JSONDecodeError, ValueError) as exc:
-            logger.error("Error while attempting to get metric value from backend")
-            logger.error(exc)
-            return value, exc
-        logger.debug("unmarshaling metrics response using jqExpression...")
-        if metric_resource.spec.jqExpression is None:
-            return value, ValueError("no jqExpression is specific in metric resource")
-        value, err = unmarshal(response, metric_resource.spec.jqExpression)
-    return value, err
+            return await get_batch_metric_values_async(metric_resource, versions, start_time, \
+                client)
+        finally:
+            reset_request_plans(token)
+
+    request, err = get_metric_request(metric_resource, \
+        get_batch_interpolation_args(versions, start_time))
+    if err is not None:
+        return [(None, err)] * len(versions)
+    return await query_metric_values_async(metric_resource, request, \
+        [get_jq_args(version) for version in versions], client)
+
+def is_mergeable(metric_resource: MetricResource) -> bool:
+    """
+    Check if the query of the metric may be merged with those of other metrics.
+    """
+    return metric_resource.spec.merge and not metric_resource.spec.batch and \
+        not is_mocked(metric_resource) and not is_incremental(metric_resource)
+
+def get_fetch_groups(metric_versions: Sequence[Tuple[MetricResource, VersionDetail]], \
+    start_time: datetime):
+    """
+    Group (metric resource, version) pairs into the queries needed for fetching their values;
+    all versions of a batch metric are fetched together, mergeable queries with the same
+    merge key are fetched together, and other pairs are fetched individually.
+    Each group is a (metric resource, versions, positions of the pairs) tuple;
+    groups of merged queries have no metric resource, and a list of
+    (metric resource, version, request) members instead of versions.
+    """
+    groups = []
+    batch_groups = {}
+    merge_groups = {}
+    for position, (metric_resource, version) in enumerate(metric_versions):
+        merge_key, request = None, None
+        if is_mergeable(metric_resource):
+            request, err = get_metric_request(metric_resource, \
+                get_interpolation_args(version, start_time))
+            merge_key = get_merge_key(request) if err is None else None
+        if metric_resource.spec.batch and id(metric_resource) in batch_groups:
+            batch_groups[id(metric_resource)][1].append(version)
+            batch_groups[id(metric_resource)][2].append(position)
+        elif merge_key is not None and merge_key in merge_groups:
+            merge_groups[merge_key][1].append((metric_resource, version, request))
+            merge_groups[merge_key][2].append(position)
+        elif merge_key is not None:
+            group = (None, [(metric_resource, version, request)], [position])
+            groups.append(group)
+            merge_groups[merge_key] = group
+        else:
+            group = (metric_resource, [version], [position])
+            groups.append(group)
+            if metric_resource.spec.batch:
+                batch_groups[id(metric_resource)] = group
+    # a merged query with a single member is an individual query
+    return [(members[0][0], [members[0][1]], positions) \
+        if metric_resource is None and len(members) == 1 \
+            else (metric_resource, members, positions) \
+                for metric_resource, members, positions in groups]
+
+def get_metric_values(metric_versions: Sequence[Tuple[MetricResource, VersionDetail]], \
+    start_time: datetime, priorities: Sequence[int] = None) \
+        -> Sequence[Tuple[numbers.Number, BaseException]]:
+    """
+    Get the value of each (metric resource, version) pair by querying metrics backends
+    concurrently; at most metrics_fetch_concurrency queries are in flight at any time.
+    Queries are started in order of the priorities of the pairs, if any. If the request has
+    a deadline, queries not finished by the deadline are skipped instead of waited for.
+    Results are returned in the same order as the input pairs.
+    """
+    def fetch(group):
+        metric_resource, versions, _ = group
+        if deadline_exceeded():
+            results = fetch_scheduler.skip(group)
+        elif metric_resource is None:
+            results = get_merged_metric_values(versions)
+        elif metric_resource.spec.batch:
+            results = get_batch_metric_values(metric_resource, versions, start_time)
+        else:
+            results = [get_metric_value(metric_resource, versions[0], start_time)]
+        return results
+
+    # request plans are compiled once, and shared by all queries of this evaluation
+    token = set_request_plans(metric_resource for metric_resource, _ in metric_versions)
+    try:
+        groups = schedule_groups(get_fetch_groups(metric_versions, start_time), priorities)
+        max_workers = min(env_config[constants.METRICS_FETCH_CONCURRENCY], len(groups))
+        deadline = current_deadline.get()
+        # nothing to parallelize...
+        if max_workers <= 1:
+            group_results = [fetch(group) for group in groups]
+        else:
+            executor = ThreadPoolExecutor(max_workers = max_workers, \
+                thread_name_prefix = "iter8-metrics")
+            try:
+                # each fetch runs in a copy of this context, so that it sees the request deadline
+                futures = [executor.submit(contextvars.copy_context().run, fetch, group) \
+                    for group in groups]
+                if deadline is not None:
+                    wait(futures, timeout = max(deadline.remaining(), 0))
+                group_results = [future.result() if deadline is None or future.done() \
+                    else fetch_scheduler.skip(group) for future, group in zip(futures, groups)]
+            finally:
+                # queries still in flight past the deadline are not waited for
+                executor.shutdown(wait = deadline is None, cancel_futures = True)
+    finally:
+        reset_request_plans(token)
+    fetch_scheduler.record(groups, priorities, group_results)
+    return get_results_in_order(len(metric_versions), groups, group_results)
+
+async def get_metric_values_async(metric_versions: Sequence[Tuple[MetricResource, VersionDetail]], \
+    start_time: datetime, client: httpx.AsyncClient = None, priorities: Sequence[int] = None) \
+        -> Sequence[Tuple[numbers.Number, BaseException]]:
+    """
+    Asynchronous version of get_metric_values;
+    all queries share the event loop and at most metrics_fetch_concurrency are in flight.
+    """
+    semaphore = asyncio.Semaphore(max(env_config[constants.METRICS_FETCH_CONCURRENCY], 1))
+    async def fetch(group):
+        metric_resource, versions, _ = group
+        async with semaphore:
+            if deadline_exceeded():
+                results = fetch_scheduler.skip(group)
+            elif metric_resource is None:
+                results = await get_merged_metric_values_async(versions, client)
+            elif metric_resource.spec.batch:
+                results = await get_batch_metric_values_async(metric_resource, versions, \
+                    start_time, client)
+            else:
+                results = [await get_metric_value_async(metric_resource, versions[0], \
+                    start_time, client)]
+        return results
+
+    # request plans are compiled once, off the event loop, and shared by all queries
+    # of this evaluation
+    token = await set_request_plans_async(metric_resource for metric_resource, _ in metric_versions)
+    try:
+        # tasks wait for the semaphore in the order they are created, i.e., by priority
+        groups = schedule_groups(get_fetch_groups(metric_versions, start_time), priorities)
+        deadline = current_deadline.get()
+        if deadline is None or len(groups) == 0:
+            group_results = await asyncio.gather(*[fetch(group) for group in groups])
+        else:
+            tasks = [asyncio.ensure_future(fetch(group)) for group in groups]
+            _, pending = await asyncio.wait(tasks, timeout = max(deadline.remaining(), 0))
+            for task in pending:
+                task.cancel()
+            group_results = [fetch_scheduler.skip(group) if task in pending else task.result() \
+                for task, group in zip(tasks, groups)]
+    finally:
+        reset_request_plans(token)
+    fetch_scheduler.record(groups, priorities, group_results)
+    return get_results_in_order(len(metric_versions), groups, group_results)
+
+def get_results_in_order(count: int, groups, group_results):
+    """
+    Get the results of fetch groups in the order of the (metric resource, version) pairs.
+    """
+    results = [None] * count
+    for (_, _, positions), values in zip(groups, group_results):
+        for position, value in zip(positions, values):
+            results[position] = value
+    return results
 
 # We will mirror the following handler data structures below...
 
@@ -508,51 +1500,161 @@ def get_builtin_metrics(expr: ExperimentResource):
         populate_builtins_for_version(iam, version, builtins.version_results[version])
     return iam
 
-def get_aggregated_metrics(expr: ExperimentResource):
+def get_versions(expr: ExperimentResource) -> Sequence[VersionDetail]:
     """
-    Get aggregated metrics using experiment resource and metric resources.
+    Get the baseline followed by the candidate versions of the experiment.
     """
     versions = [expr.spec.versionInfo.baseline]
     if expr.spec.versionInfo.candidates is not None:
         versions += expr.spec.versionInfo.candidates
+    return versions
+
+def get_custom_metrics(expr: ExperimentResource) -> Sequence[MetricInfo]:
+    """
+    Get the custom metrics, i.e., the metrics which are not builtin, of the experiment.
+    """
+    if expr.status.metrics is None:
+        return []
+    return [metric_info for metric_info in expr.status.metrics \
+        if metric_info.metricObj.spec.provider is None or \
+            metric_info.metricObj.spec.provider != "iter8"]
 
+def assemble_aggregated_metrics(expr: ExperimentResource, custom_metrics: Sequence[MetricInfo], \
+    versions: Sequence[VersionDetail], results: Sequence[Tuple[numbers.Number, BaseException]], \
+        skipped_metrics: Sequence[MetricInfo] = ()):
+    """
+    Assemble aggregated metrics from builtin metrics and the (value, err) results
+    for each custom metric and version, in the order of custom metrics and versions.
+    If a result is missing, fall back to the value in the previous aggregated metrics,
+    or else to the last known good value in the fallback store.
+    Skipped metrics, which were not needed for analysis, are left out.
+    """
     # messages not working as intended...
     messages = []
+    fallback_key = get_fallback_key(expr)
 
     # initialize aggregated metrics object
     iam = get_builtin_metrics(expr)
 
-    # there are no metrics to be fetched
-    if expr.status.metrics is None:
-        iam.message = Message.join_messages(messages)
-        return iam
-
-    for metric_info in expr.status.metrics:
-        # only custom metrics is handled below... not builtin metrics
-        if metric_info.metricObj.spec.provider is None or \
-            metric_info.metricObj.spec.provider != "iter8":
-            iam.data[metric_info.name] = AggregatedMetric(data = {})
-            # fetch the metric value for each version...
-            for version in versions:
-                # initialize metric object for this version...
-                iam.data[metric_info.name].data[version.name] = VersionMetric()
-                val, err = get_metric_value(metric_info.metricObj, version, \
-                expr.status.startTime)
-                if err is None and val is not None:
-                    iam.data[metric_info.name].data[version.name].value = val
-                else:
-                    try:
-                        val = float(expr.status.analysis.aggregated_metrics.data\
-                            [metric_info.name].data[version.name].value)
-                    except AttributeError:
-                        val = None
-                    iam.data[metric_info.name].data[version.name].value = val
-                if err is not None:
-                    messages.append(Message(MessageLevel.ERROR, \
-                        f"Error from metrics backend for metric: {metric_info.name} \
+    results = iter(results)
+    for metric_info in custom_metrics:
+        iam.data[metric_info.name] = AggregatedMetric(data = {})
+        for version in versions:
+            # initialize metric object for this version...
+            iam.data[metric_info.name].data[version.name] = VersionMetric()
+            val, err = next(results)
+            if err is None and val is not None:
+                iam.data[metric_info.name].data[version.name].value = val
+                fallback_store.put(fallback_key, metric_info.name, version.name, val)
+            else:
+                try:
+                    val = float(expr.status.analysis.aggregated_metrics.data\
+                        [metric_info.name].data[version.name].value)
+                except (AttributeError, KeyError, TypeError):
+                    val = fallback_store.get(fallback_key, metric_info.name, version.name)
+                iam.data[metric_info.name].data[version.name].value = val
+            if isinstance(err, FetchSkippedError):
+                messages.append(Message(MessageLevel.ERROR, \
+                    f"Skipped metric: {metric_info.name} \
+                            and version: {version.name} at the deadline; using previous value"))
+            elif isinstance(err, DeadlineExceededError):
+                messages.append(Message(MessageLevel.ERROR, \
+                    f"Deadline exceeded for metric: {metric_info.name} \
+                            and version: {version.name}; using previous value"))
+            elif isinstance(err, CircuitOpenError):
+                messages.append(Message(MessageLevel.ERROR, \
+                    f"Metrics backend unavailable for metric: {metric_info.name} \
+                            and version: {version.name}; using previous value"))
+            elif err is not None:
+                messages.append(Message(MessageLevel.ERROR, \
+                    f"Error from metrics backend for metric: {metric_info.name} \
                             and version: {version.name}"))
 
+    if len(skipped_metrics) > 0:
+        messages.append(Message(MessageLevel.INFO, "Not fetched (not needed for analysis): " + \
+            ", ".join(metric_info.name for metric_info in skipped_metrics)))
+
     iam.message = Message.join_messages(messages)
     logger.debug("Analysis object after metrics collection")
     logger.debug(pprint.PrettyPrinter().pformat(iam))
     return iam
+
+async def assemble_aggregated_metrics_async(expr: ExperimentResource, \
+    custom_metrics: Sequence[MetricInfo], versions: Sequence[VersionDetail], \
+        results: Sequence[Tuple[numbers.Number, BaseException]], \
+            skipped_metrics: Sequence[MetricInfo] = ()):
+    """
+    Asynchronous version of assemble_aggregated_metrics; the fallback store is read and
+    written off the event loop.
+    """
+    return await asyncio.get_running_loop().run_in_executor(None, \
+        assemble_aggregated_metrics, expr, custom_metrics, versions, results, skipped_metrics)
+
+def get_metric_versions(custom_metrics: Sequence[MetricInfo], versions: Sequence[VersionDetail]):
+    """
+    Get the (metric resource, version) pair for each custom metric and version.
+    """
+    return [(metric_info.metricObj, version) \
+        for metric_info in custom_metrics for version in versions]
+
+def get_pair_priorities(expr: ExperimentResource, custom_metrics: Sequence[MetricInfo], \
+    versions: Sequence[VersionDetail]) -> Sequence[int]:
+    """
+    Get the fetch priority of each custom metric and version.
+    """
+    priorities = get_metric_priorities(expr, custom_metrics)
+    return [priorities[metric_info.name] for metric_info in custom_metrics for _ in versions]
+
+def get_planned_metrics(expr: ExperimentResource) \
+    -> Tuple[Sequence[MetricInfo], Sequence[MetricInfo]]:
+    """
+    Get the custom metrics to fetch under the fetch plan of the current request,
+    and the custom metrics to skip.
+    """
+    return plan_metrics(expr, get_custom_metrics(expr), current_fetch_plan.get())
+
+def get_aggregated_metrics(expr: ExperimentResource):
+    """
+    Get aggregated metrics using experiment resource and metric resources.
+    """
+    versions = get_versions(expr)
+    custom_metrics, skipped_metrics = get_planned_metrics(expr)
+
+    # fetch the metric value for each metric and version concurrently;
+    # objectives and rewards first...
+    results = get_metric_values(get_metric_versions(custom_metrics, versions), \
+        expr.status.startTime, get_pair_priorities(expr, custom_metrics, versions))
+    return assemble_aggregated_metrics(expr, custom_metrics, versions, results, skipped_metrics)
+
+async def get_aggregated_metrics_async(expr: ExperimentResource, client: httpx.AsyncClient = None):
+    """
+    Asynchronous version of get_aggregated_metrics.
+    """
+    versions = get_versions(expr)
+    custom_metrics, skipped_metrics = get_planned_metrics(expr)
+
+    # fetch the metric value for each metric and version concurrently;
+    # objectives and rewards first...
+    results = await get_metric_values_async(get_metric_versions(custom_metrics, versions), \
+        expr.status.startTime, client, get_pair_priorities(expr, custom_metrics, versions))
+    return await assemble_aggregated_metrics_async(expr, custom_metrics, versions, results, \
+        skipped_metrics)
+
+def get_backend_stats() -> Dict[str, Any]:
+    """
+    Get statistics about queries to metrics backends.
+    """
+    return {
+        "coalescing": single_flight.stats(),
+        "cache": metric_value_cache.stats(),
+        "circuit_breakers": circuit_breakers.stats(),
+        "hedging": hedger.stats(),
+        "concurrency_limits": concurrency_limiters.stats(),
+        "checkpoints": checkpoint_store.stats(),
+        "cassette": cassette.stats(),
+        "retries": retrier.stats(),
+        "bytes": byte_counters.stats(),
+        "fallbacks": fallback_store.stats(),
+        "scheduling": fetch_scheduler.stats(),
+        "http2_streams": stream_stats.stats()
+    }
@@ -0,0 +1,71 @@
+"""
+Module containing the planning of metric fetches: only the metrics needed by the requested
+stages of analysis are fetched, unless the request opts in to fetching all metrics.
+"""
+# core python dependencies
+import contextvars
+import logging
+from typing import FrozenSet, NamedTuple, Optional, Sequence, Set, Tuple
+
+# iter8 dependencies
+from iter8_analytics.api.v2.types import AnalysisStage, ExperimentResource, MetricInfo
+
+logger = logging.getLogger('iter8_analytics')
+
+ALL_STAGES = frozenset(AnalysisStage)
+
+class FetchPlan(NamedTuple):
+    """
+    Stages of analysis for which metrics are fetched, and whether all metrics are fetched
+    regardless of the stages.
+    """
+    stages: FrozenSet[AnalysisStage] = ALL_STAGES
+    fetch_all: bool = False
+
+# fetch plan of the analytics request being processed, if any; all metrics are fetched if none
+current_fetch_plan: contextvars.ContextVar = \
+    contextvars.ContextVar("iter8_analytics_fetch_plan", default = None)
+
+def set_fetch_plan(plan: Optional[FetchPlan]) -> contextvars.Token:
+    """
+    Set the fetch plan of the current analytics request; all metrics are fetched if plan is None.
+    Return the token for resetting the plan.
+    """
+    return current_fetch_plan.set(plan)
+
+def reset_fetch_plan(token: contextvars.Token):
+    """
+    Restore the fetch plan in effect before set_fetch_plan.
+    """
+    current_fetch_plan.reset(token)
+
+def get_needed_metrics(expr: ExperimentResource, stages: FrozenSet[AnalysisStage]) -> Set[str]:
+    """
+    Get the names of the metrics needed by the stages of analysis: version assessments check
+    objectives; winner assessment and weights also depend on the feasibility of versions
+    (objectives) and on rewards.
+    """
+    criteria = expr.spec.criteria
+    if criteria is None:
+        return set()
+    needed = set()
+    if len(stages) > 0:
+        needed.update(objective.metric for objective in criteria.objectives or [])
+    if AnalysisStage.WINNER_ASSESSMENT in stages or AnalysisStage.WEIGHTS in stages:
+        needed.update(reward.metric for reward in criteria.rewards or [])
+    return needed
+
+def plan_metrics(expr: ExperimentResource, metrics: Sequence[MetricInfo], \
+    plan: Optional[FetchPlan]) -> Tuple[Sequence[MetricInfo], Sequence[MetricInfo]]:
+    """
+    Split metrics into those to fetch and those to skip under the plan.
+    """
+    if plan is None or plan.fetch_all:
+        return list(metrics), []
+    needed = get_needed_metrics(expr, plan.stages)
+    planned = [metric_info for metric_info in metrics if metric_info.name in needed]
+    skipped = [metric_info for metric_info in metrics if metric_info.name not in needed]
+    if len(skipped) > 0:
+        logger.debug("not fetching metrics not needed for analysis: %s", \
+            [metric_info.name for metric_info in skipped])
+    return planned, skipped
@@ -0,0 +1,240 @@
+"""
+Module containing the background prefetch scheduler, which fetches the metric values of
+registered experiments just ahead of the expected analytics requests for them.
+"""
+# core python dependencies
+import asyncio
+import copy
+import hashlib
+import json
+import logging
+import time
+from typing import Any, Dict
+
+# iter8 dependencies
+import iter8_analytics.constants as constants
+from iter8_analytics.config import env_config
+from iter8_analytics.api.v2.types import ExperimentResource, AggregatedMetricsAnalysis
+from iter8_analytics.api.v2.metrics import get_versions, get_custom_metrics, \
+    get_metric_values_async, assemble_aggregated_metrics_async, get_aggregated_metrics_async, \
+    get_planned_metrics
+
+logger = logging.getLogger('iter8_analytics')
+
+def get_experiment_key(expr: ExperimentResource) -> str:
+    """
+    Get the key of the experiment, a digest of its start time, versions, criteria and
+    metric specs; analytics requests for the same experiment have the same key, and
+    prefetched results are not used for requests whose experiment spec has changed.
+    """
+    canonical = json.dumps({
+        "startTime": expr.status.startTime,
+        "versionInfo": expr.spec.versionInfo.dict(),
+        "criteria": expr.spec.criteria.dict() if expr.spec.criteria is not None else None,
+        "metrics": [metric_info.dict() for metric_info in expr.status.metrics or []]
+    }, sort_keys = True, default = str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+class Registration:
+    """
+    An experiment registered for prefetching, and its latest prefetched results.
+
+    Attributes:
+        expr (ExperimentResource): Experiment whose metric values are prefetched.
+        interval (float): Seconds between analytics requests for the experiment.
+        last_seen (float): Monotonic time of the latest request (or the registration).
+        next_fetch (float): Monotonic time at which metric values are prefetched next.
+        results (list): (value, err) result for each custom metric and version.
+        fetched_at (float): Monotonic time at which results were prefetched.
+        fetch_seconds (float): Duration of the latest prefetch.
+    """
+
+    def __init__(self, expr: ExperimentResource, interval: float):
+        now = time.monotonic()
+        self.expr = expr
+        self.interval = interval
+        self.last_seen = now
+        self.next_fetch = now
+        self.results = None
+        self.fetched_at = None
+        self.fetch_seconds = 0.0
+        self.fetching = False
+
+class Prefetcher:
+    """
+    Prefetch metric values of registered experiments in the background.
+    Values are prefetched lead seconds (plus the duration of the previous prefetch)
+    before the next expected request; at most max_workers prefetches run at a time.
+    Experiments without requests for idle_timeout seconds are unregistered.
+    Used from a single event loop.
+
+    Attributes:
+        max_workers (int): Maximum number of concurrent prefetches.
+        lead (float): Seconds ahead of the expected request at which values are prefetched.
+        idle_timeout (float): Seconds without requests after which experiments expire.
+        tick (float): Seconds between checks for due prefetches.
+    """
+
+    def __init__(self, max_workers: int, lead: float, idle_timeout: float, tick: float = 0.5):
+        self.max_workers = max_workers
+        self.lead = lead
+        self.idle_timeout = idle_timeout
+        self.tick = tick
+        self.registrations: Dict[str, Registration] = {}
+        self.semaphore = None
+        self.task = None
+        self.prefetches = 0
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.failures = 0
+
+    def register(self, expr: ExperimentResource, interval: float) -> str:
+        """
+        Register the experiment for prefetching every interval seconds; return its key.
+        """
+        key = get_experiment_key(expr)
+        registration = self.registrations.get(key)
+        if registration is None:
+            self.registrations[key] = Registration(copy.deepcopy(expr), interval)
+        else:
+            registration.interval = interval
+        return key
+
+    def unregister(self, key: str) -> bool:
+        """
+        Unregister the experiment with this key; return False if it is not registered.
+        """
+        return self.registrations.pop(key, None) is not None
+
+    def get_results(self, expr: ExperimentResource):
+        """
+        Get the prefetched results for the experiment, if it is registered and they were
+        fetched within its interval; None otherwise. Schedules the next prefetch.
+        """
+        registration = self.registrations.get(get_experiment_key(expr))
+        if registration is None:
+            return None
+        now = time.monotonic()
+        registration.last_seen = now
+        registration.next_fetch = max(registration.next_fetch, now + registration.interval - \
+            self.lead - registration.fetch_seconds)
+        if registration.results is None or now - registration.fetched_at > registration.interval:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return registration.results
+
+    async def prefetch(self, registration: Registration):
+        """
+        Fetch the metric values of a registered experiment.
+        """
+        async with self.semaphore:
+            start = time.monotonic()
+            expr = registration.expr
+            versions = get_versions(expr)
+            custom_metrics = get_custom_metrics(expr)
+            try:
+                registration.results = await get_metric_values_async( \
+                    [(metric_info.metricObj, version) for metric_info in custom_metrics \
+                        for version in versions], expr.status.startTime)
+                registration.fetched_at = time.monotonic()
+                registration.fetch_seconds = registration.fetched_at - start
+                self.prefetches += 1
+            finally:
+                registration.fetching = False
+
+    def prefetch_done(self, task: asyncio.Task):
+        """
+        Log and count a prefetch which failed with an exception.
+        """
+        if task.cancelled():
+            return
+        exc = task.exception()
+        if exc is not None:
+            logger.error("error while prefetching metric values: %s", exc)
+            self.failures += 1
+
+    def schedule(self):
+        """
+        Expire idle experiments and start due prefetches.
+        """
+        now = time.monotonic()
+        for key, registration in list(self.registrations.items()):
+            if now - registration.last_seen > self.idle_timeout:
+                logger.info("experiment %s expired from prefetching", key)
+                del self.registrations[key]
+                self.expired += 1
+            elif not registration.fetching and now >= registration.next_fetch:
+                registration.fetching = True
+                # until the next request arrives, prefetch once per interval
+                registration.next_fetch = now + registration.interval
+                asyncio.ensure_future(self.prefetch(registration)) \
+                    .add_done_callback(self.prefetch_done)
+
+    async def run(self):
+        """
+        Schedule prefetches every tick.
+        """
+        while True:
+            try:
+                self.schedule()
+            except Exception as exc: # pylint: disable=broad-except
+                logger.error("error while scheduling prefetches: %s", exc)
+            await asyncio.sleep(self.tick)
+
+    def start(self):
+        """
+        Start the scheduler in the running event loop.
+        """
+        self.semaphore = asyncio.Semaphore(max(self.max_workers, 1))
+        self.task = asyncio.ensure_future(self.run())
+
+    async def stop(self):
+        """
+        Stop the scheduler.
+        """
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the number of registered experiments, prefetches, requests answered from
+        prefetched results (hits) or not (misses), expired experiments, and failed prefetches.
+        """
+        return {
+            "experiments": len(self.registrations),
+            "prefetches": self.prefetches,
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "failures": self.failures
+        }
+
+prefetcher = Prefetcher(max_workers = env_config[constants.PREFETCH_WORKERS], \
+    lead = env_config[constants.PREFETCH_LEAD_SECONDS], \
+    idle_timeout = env_config[constants.PREFETCH_IDLE_SECONDS])
+
+async def get_prefetched_aggregated_metrics(expr: ExperimentResource) \
+    -> AggregatedMetricsAnalysis:
+    """
+    Get aggregated metrics from prefetched metric values, if the experiment is registered
+    and they are fresh; otherwise, fetch the metric values now.
+    All metrics are prefetched; only those in the fetch plan of the request are used.
+    """
+    results = prefetcher.get_results(expr)
+    if results is None:
+        return await get_aggregated_metrics_async(expr)
+    versions = get_versions(expr)
+    custom_metrics, skipped_metrics = get_planned_metrics(expr)
+    planned = {metric_info.name for metric_info in custom_metrics}
+    results = [result for index, metric_info in enumerate(get_custom_metrics(expr)) \
+        if metric_info.name in planned \
+            for result in results[index * len(versions): (index + 1) * len(versions)]]
+    return await assemble_aggregated_metrics_async(expr, custom_metrics, versions, results, \
+        skipped_metrics)
@@ -0,0 +1,62 @@
+"""
+Module containing the built-in Prometheus adapter, which parses instant query responses
+of the Prometheus HTTP API without jq.
+"""
+# core python dependencies
+import logging
+import math
+from typing import Any, Dict
+
+logger = logging.getLogger('iter8_analytics')
+
+class PrometheusResponseError(ValueError):
+    """
+    Raised when a Prometheus response does not contain a metric value.
+    """
+
+def parse_sample_value(sample) -> float:
+    """
+    Parse the value of a [timestamp, "value"] sample; non-finite values are errors.
+    """
+    try:
+        value = float(sample[1])
+    except (TypeError, ValueError, IndexError) as exc:
+        raise PrometheusResponseError(f"invalid sample in Prometheus response: {sample}") \
+            from exc
+    if math.isnan(value):
+        raise PrometheusResponseError("Prometheus query returned NaN")
+    if math.isinf(value):
+        raise PrometheusResponseError("Prometheus query returned an infinite value")
+    return value
+
+def parse_prometheus_response(response: Dict[str, Any]):
+    """
+    Get the value of a Prometheus instant query from its JSON response:
+    the value of a scalar result, or of the first series of a vector result.
+    Return (value, None), or (None, PrometheusResponseError) if there is no usable value,
+    including if the response is malformed.
+    """
+    try:
+        if not isinstance(response, dict):
+            raise PrometheusResponseError("Prometheus response is not a JSON object")
+        if response.get("status") != "success":
+            raise PrometheusResponseError( \
+                f"Prometheus query failed: {response.get('errorType')}: {response.get('error')}")
+        data = response.get("data") or {}
+        result_type = data.get("resultType")
+        result = data.get("result")
+        if result_type == "scalar":
+            return parse_sample_value(result), None
+        if result_type == "vector":
+            if not result:
+                raise PrometheusResponseError("Prometheus query returned no data")
+            return parse_sample_value(result[0].get("value")), None
+        raise PrometheusResponseError( \
+            f"unsupported Prometheus result type: {result_type}; use an instant query")
+    except PrometheusResponseError as exc:
+        logger.error(exc)
+        return None, exc
+    except (AttributeError, KeyError, IndexError, TypeError, ValueError) as exc:
+        err = PrometheusResponseError(f"malformed Prometheus response: {exc!r}")
+        logger.error(err)
+        return None, err
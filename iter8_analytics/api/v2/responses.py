@@ -0,0 +1,275 @@
+"""
+Module containing size-bounded, streaming reads of metrics backend responses,
+which may be gzip or deflate encoded, and per-backend byte counters.
+"""
+# core python dependencies
+import json
+import logging
+import threading
+from typing import Dict
+import zlib
+
+# external module dependencies
+import requests
+import httpx
+from urllib3.exceptions import DecodeError, ProtocolError, ReadTimeoutError, SSLError
+
+# iter8 dependencies
+from iter8_analytics.api.v2.sessions import get_backend_key
+
+logger = logging.getLogger('iter8_analytics')
+
+# size of chunks in which response bodies are read
+CHUNK_SIZE = 64 * 1024
+
+# zlib window bits for decoding each supported content encoding
+WBITS = {
+    "gzip": 16 + zlib.MAX_WBITS,
+    "x-gzip": 16 + zlib.MAX_WBITS,
+    "deflate": zlib.MAX_WBITS
+}
+
+class ResponseTooLargeError(ValueError):
+    """
+    Raised when a metrics backend response is larger than the maximum body size.
+    """
+
+class BackendResponse:
+    """
+    Status code and body of a metrics backend response.
+
+    Attributes:
+        status_code (int): HTTP status code.
+        content (bytes): Response body.
+    """
+
+    def __init__(self, status_code: int, content: bytes):
+        self.status_code = status_code
+        self.content = content
+
+    def json(self):
+        """
+        Parse the body as JSON.
+        """
+        return json.loads(self.content)
+
+    @property
+    def text(self) -> str:
+        """
+        Body decoded as text.
+        """
+        return self.content.decode("utf-8", errors = "replace")
+
+    def preview(self, length: int = 200) -> str:
+        """
+        Beginning of the body, for logging.
+        """
+        text = self.content[:length].decode("utf-8", errors = "replace")
+        return text if len(self.content) <= length else text + "..."
+
+def check_content_length(headers, max_bytes: int):
+    """
+    Raise ResponseTooLargeError if the declared length of the body exceeds max_bytes.
+    """
+    content_length = headers.get("content-length")
+    if max_bytes > 0 and content_length is not None and content_length.isdigit() and \
+        int(content_length) > max_bytes:
+        raise ResponseTooLargeError( \
+            f"response of {content_length} bytes exceeds the maximum of {max_bytes} bytes")
+
+def append_chunk(body: bytearray, chunk: bytes, max_bytes: int):
+    """
+    Append a chunk to the body; raise ResponseTooLargeError if it grows beyond max_bytes.
+    """
+    body.extend(chunk)
+    if 0 < max_bytes < len(body):
+        raise ResponseTooLargeError( \
+            f"response exceeds the maximum of {max_bytes} bytes")
+
+class BodyDecoder:
+    """
+    Incrementally decode a body sent with the given content encoding into body.
+    Decoding stops as soon as the decoded body exceeds max_bytes, so that a small, highly
+    compressed response cannot be inflated beyond the maximum size.
+
+    Attributes:
+        body (bytearray): Decoded body.
+        max_bytes (int): Maximum size of the decoded body; max_bytes <= 0 means unbounded.
+        wire_bytes (int): Number of encoded bytes received.
+    """
+
+    def __init__(self, encoding: str, body: bytearray, max_bytes: int):
+        encoding = (encoding or "identity").strip().lower()
+        if encoding not in WBITS and encoding != "identity":
+            raise ValueError(f"unsupported content encoding of response: {encoding}")
+        self.wbits = WBITS.get(encoding)
+        self.decompressor = None if self.wbits is None else zlib.decompressobj(self.wbits)
+        self.body = body
+        self.max_bytes = max_bytes
+        self.wire_bytes = 0
+        # encoded bytes received before any byte was decoded
+        self.initial = bytearray()
+
+    def inflate(self, data: bytes):
+        """
+        Decompress data into the body, at most one byte beyond max_bytes at a time.
+        """
+        while len(data) > 0:
+            limit = self.max_bytes - len(self.body) + 1 if self.max_bytes > 0 else 0
+            append_chunk(self.body, self.decompressor.decompress(data, limit), self.max_bytes)
+            data = self.decompressor.unconsumed_tail
+
+    def feed(self, chunk: bytes):
+        """
+        Decode a chunk of the encoded body.
+        """
+        self.wire_bytes += len(chunk)
+        if self.decompressor is None:
+            append_chunk(self.body, chunk, self.max_bytes)
+            return
+        if len(self.body) == 0:
+            self.initial.extend(chunk)
+        try:
+            self.inflate(chunk)
+        except zlib.error as exc:
+            # some servers send raw deflate data without the zlib header
+            if self.wbits != zlib.MAX_WBITS or len(self.body) > 0:
+                raise ValueError(f"cannot decode response: {exc}") from exc
+            self.wbits = -zlib.MAX_WBITS
+            self.decompressor = zlib.decompressobj(self.wbits)
+            try:
+                self.inflate(bytes(self.initial))
+            except zlib.error as raw_exc:
+                raise ValueError(f"cannot decode response: {raw_exc}") from raw_exc
+
+    def finish(self):
+        """
+        Decode the rest of the body.
+        """
+        if self.decompressor is not None:
+            try:
+                append_chunk(self.body, self.decompressor.flush(), self.max_bytes)
+            except zlib.error as exc:
+                raise ValueError(f"cannot decode response: {exc}") from exc
+
+class ByteCounters:
+    """
+    Number of responses, bytes received on the wire and decoded bytes, per metrics backend.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters: Dict[str, Dict[str, int]] = {}
+
+    def add(self, url: str, wire_bytes: int, decoded_bytes: int):
+        """
+        Count a response from the metrics backend serving this url.
+        """
+        key = get_backend_key(url)
+        with self.lock:
+            counters = self.counters.setdefault(key, \
+                {"responses": 0, "wire_bytes": 0, "decoded_bytes": 0})
+            counters["responses"] += 1
+            counters["wire_bytes"] += wire_bytes
+            counters["decoded_bytes"] += decoded_bytes
+
+    def reset(self):
+        """
+        Reset all counters.
+        """
+        with self.lock:
+            self.counters = {}
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """
+        Get the counters of each metrics backend.
+        """
+        with self.lock:
+            return {key: dict(counters) for key, counters in self.counters.items()}
+
+byte_counters = ByteCounters()
+
+def start_decoding(headers, max_bytes: int) -> BodyDecoder:
+    """
+    Check the declared length of an unencoded body, and get the decoder of the body.
+    The declared length of an encoded body is its encoded length, which is not checked.
+    """
+    encoding = headers.get("content-encoding")
+    if encoding is None or encoding.strip().lower() == "identity":
+        check_content_length(headers, max_bytes)
+    return BodyDecoder(encoding, bytearray(), max_bytes)
+
+def iter_raw(raw_response: requests.Response):
+    """
+    Iterate over the raw (undecoded) chunks of a streamed response; errors of urllib3
+    are raised as the corresponding requests exceptions, as in Response.iter_content.
+    """
+    try:
+        yield from raw_response.raw.stream(CHUNK_SIZE, decode_content = False)
+    except ProtocolError as exc:
+        raise requests.exceptions.ChunkedEncodingError(exc) from exc
+    except DecodeError as exc:
+        raise requests.exceptions.ContentDecodingError(exc) from exc
+    except ReadTimeoutError as exc:
+        raise requests.exceptions.ReadTimeout(exc) from exc
+    except SSLError as exc:
+        raise requests.exceptions.SSLError(exc) from exc
+
+def read_response(raw_response: requests.Response, max_bytes: int) -> BackendResponse:
+    """
+    Read and decode the body of a streamed response in chunks, stopping as soon as
+    the decoded body exceeds max_bytes; max_bytes <= 0 means unbounded.
+    Bytes are counted and the connection is released in all cases.
+    """
+    decoder = None
+    try:
+        decoder = start_decoding(raw_response.headers, max_bytes)
+        for chunk in iter_raw(raw_response):
+            decoder.feed(chunk)
+        decoder.finish()
+        return BackendResponse(raw_response.status_code, bytes(decoder.body))
+    finally:
+        raw_response.close()
+        if decoder is not None:
+            byte_counters.add(raw_response.url, decoder.wire_bytes, len(decoder.body))
+
+def read_httpx_response(raw_response: httpx.Response, max_bytes: int) -> BackendResponse:
+    """
+    Version of read_response for streamed responses of (HTTP/2) httpx clients;
+    the caller closes the response.
+    """
+    decoder = None
+    try:
+        if raw_response.is_stream_consumed:
+            # the body was read in full, and decoded, before the response was returned
+            decoder = start_decoding({}, max_bytes)
+            decoder.feed(raw_response.content)
+        else:
+            decoder = start_decoding(raw_response.headers, max_bytes)
+            for chunk in raw_response.iter_raw():
+                decoder.feed(chunk)
+        decoder.finish()
+        return BackendResponse(raw_response.status_code, bytes(decoder.body))
+    finally:
+        if decoder is not None:
+            byte_counters.add(str(raw_response.url), decoder.wire_bytes, len(decoder.body))
+
+async def read_response_async(raw_response: httpx.Response, max_bytes: int) -> BackendResponse:
+    """
+    Asynchronous version of read_response; the caller closes the response.
+    """
+    decoder = None
+    try:
+        if raw_response.is_stream_consumed:
+            # the body was read in full, and decoded, before the response was returned
+            decoder = start_decoding({}, max_bytes)
+            decoder.feed(raw_response.content)
+        else:
+            decoder = start_decoding(raw_response.headers, max_bytes)
+            async for chunk in raw_response.aiter_raw():
+                decoder.feed(chunk)
+        decoder.finish()
+        return BackendResponse(raw_response.status_code, bytes(decoder.body))
+    finally:
+        if decoder is not None:
+            byte_counters.add(str(raw_response.url), decoder.wire_bytes, len(decoder.body))
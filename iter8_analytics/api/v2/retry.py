@@ -0,0 +1,182 @@
+"""
+Module containing retries of failed metrics backend queries,
+with jittered exponential backoff bounded by the deadline of the analytics request.
+"""
+# core python dependencies
+import asyncio
+import logging
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, NamedTuple
+
+# external module dependencies
+import requests
+import httpx
+
+# iter8 dependencies
+import iter8_analytics.constants as constants
+from iter8_analytics.config import env_config
+from iter8_analytics.api.v2.deadline import current_deadline
+from iter8_analytics.api.v2.types import Method
+
+logger = logging.getLogger('iter8_analytics')
+
+# responses to overloaded or unreachable metrics backends, which are likely transient
+RETRYABLE_STATUS_CODES = frozenset([429, 502, 503, 504])
+
+class RetryPolicy(NamedTuple):
+    """
+    Retry policy of a metrics backend query.
+
+    Attributes:
+        retries (int): Maximum number of retries after the first attempt.
+        retry_post (bool): Whether POST queries are retried.
+    """
+    retries: int
+    retry_post: bool = False
+
+def is_retryable_error(exc: BaseException) -> bool:
+    """
+    Check if a query failed because of a connection problem or timeout;
+    other errors, such as an open circuit or a passed deadline, are not retried.
+    """
+    return isinstance(exc, (requests.exceptions.ConnectionError, requests.exceptions.Timeout, \
+        requests.exceptions.ChunkedEncodingError, httpx.TransportError))
+
+def is_retryable_response(response) -> bool:
+    """
+    Check if the metrics backend responded with a transient error.
+    """
+    return response.status_code in RETRYABLE_STATUS_CODES
+
+class Retrier:
+    """
+    Retry failed metrics backend queries with full-jitter exponential backoff.
+    A retry is made only if its backoff, plus min_attempt seconds for the attempt itself,
+    fits in the time left until the deadline of the analytics request.
+
+    Attributes:
+        base_delay (float): Backoff cap (in seconds) before the first retry; doubled per retry.
+        max_delay (float): Maximum backoff cap (in seconds).
+        min_attempt (float): Time (in seconds) that must be left for a retry attempt.
+    """
+
+    def __init__(self, base_delay: float, max_delay: float, min_attempt: float, \
+        seed: int = None):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.min_attempt = min_attempt
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.retries = 0
+        self.recovered = 0
+        self.exhausted = 0
+        self.deadline_skipped = 0
+
+    def get_backoff(self, attempt: int) -> float:
+        """
+        Get the backoff (in seconds) before retry number attempt + 1.
+        """
+        cap = min(self.max_delay, self.base_delay * 2 ** attempt)
+        with self.lock:
+            return self.rng.uniform(0, cap)
+
+    def get_retry_backoff(self, policy: RetryPolicy, method: Method, attempt: int, \
+        failure: str):
+        """
+        Get the backoff before retrying a failed attempt; None if it should not be retried.
+        """
+        if attempt >= policy.retries or (method == Method.POST and not policy.retry_post):
+            if attempt > 0:
+                with self.lock:
+                    self.exhausted += 1
+            return None
+        backoff = self.get_backoff(attempt)
+        deadline = current_deadline.get()
+        if deadline is not None and deadline.remaining() < backoff + self.min_attempt:
+            logger.debug("not retrying %s: deadline is too close", failure)
+            with self.lock:
+                self.deadline_skipped += 1
+            return None
+        logger.debug("retrying %s after %s seconds", failure, backoff)
+        with self.lock:
+            self.retries += 1
+        return backoff
+
+    def count_outcome(self, attempt: int):
+        """
+        Count a query which succeeded after retries.
+        """
+        if attempt > 0:
+            with self.lock:
+                self.recovered += 1
+
+    def call(self, policy: RetryPolicy, method: Method, func: Callable[[], Any]):
+        """
+        Return the HTTP response func(), retrying transient failures according to the policy.
+        The response or exception of the last attempt is returned or raised.
+        """
+        attempt = 0
+        while True:
+            try:
+                response = func()
+            except Exception as exc:
+                if not is_retryable_error(exc):
+                    raise
+                backoff = self.get_retry_backoff(policy, method, attempt, repr(exc))
+                if backoff is None:
+                    raise
+            else:
+                if not is_retryable_response(response):
+                    self.count_outcome(attempt)
+                    return response
+                backoff = self.get_retry_backoff(policy, method, attempt, \
+                    f"response status {response.status_code}")
+                if backoff is None:
+                    return response
+            time.sleep(backoff)
+            attempt += 1
+
+    async def call_async(self, policy: RetryPolicy, method: Method, \
+        func: Callable[[], Awaitable[Any]]):
+        """
+        Asynchronous version of call.
+        """
+        attempt = 0
+        while True:
+            try:
+                response = await func()
+            except Exception as exc:
+                if not is_retryable_error(exc):
+                    raise
+                backoff = self.get_retry_backoff(policy, method, attempt, repr(exc))
+                if backoff is None:
+                    raise
+            else:
+                if not is_retryable_response(response):
+                    self.count_outcome(attempt)
+                    return response
+                backoff = self.get_retry_backoff(policy, method, attempt, \
+                    f"response status {response.status_code}")
+                if backoff is None:
+                    return response
+            await asyncio.sleep(backoff)
+            attempt += 1
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Get the number of retries, queries which succeeded after retries,
+        queries which still failed after all retries, and retries skipped because of deadlines.
+        """
+        with self.lock:
+            return {
+                "retries": self.retries,
+                "recovered": self.recovered,
+                "exhausted": self.exhausted,
+                "deadline_skipped": self.deadline_skipped
+            }
+
+retrier = Retrier(base_delay = env_config[constants.METRICS_BACKEND_RETRY_BASE_DELAY_SECONDS], \
+    max_delay = env_config[constants.METRICS_BACKEND_RETRY_MAX_DELAY_SECONDS], \
+    min_attempt = env_config[constants.METRICS_BACKEND_RETRY_MIN_ATTEMPT_SECONDS])
@@ -0,0 +1,113 @@
+"""
+Module containing the scheduling of metric fetches: metrics which decide the winner
+and weights of an experiment (objectives and rewards) are fetched before informational metrics,
+and fetches which cannot finish within the deadline of the request are skipped.
+"""
+# core python dependencies
+import logging
+import threading
+from typing import Dict, Sequence
+
+# iter8 dependencies
+from iter8_analytics.api.v2.types import ExperimentResource, MetricInfo
+from iter8_analytics.api.v2.deadline import DeadlineExceededError
+
+logger = logging.getLogger('iter8_analytics')
+
+# priorities of metrics; lower priorities are fetched first
+DECISION_PRIORITY = 0
+INFORMATIONAL_PRIORITY = 1
+
+PRIORITY_NAMES = {
+    DECISION_PRIORITY: "decision",
+    INFORMATIONAL_PRIORITY: "informational"
+}
+
+class FetchSkippedError(DeadlineExceededError):
+    """
+    Raised for metric values which were not fetched because the deadline passed first.
+    """
+
+def get_decision_metrics(expr: ExperimentResource) -> set:
+    """
+    Get the names of the metrics in the objectives and rewards of the experiment.
+    """
+    criteria = expr.spec.criteria
+    if criteria is None:
+        return set()
+    return {item.metric for item in \
+        list(criteria.objectives or []) + list(criteria.rewards or [])}
+
+def get_metric_priorities(expr: ExperimentResource, \
+    metrics: Sequence[MetricInfo]) -> Dict[str, int]:
+    """
+    Get the fetch priority of each metric, by name.
+    """
+    decision_metrics = get_decision_metrics(expr)
+    return {metric_info.name: DECISION_PRIORITY if metric_info.name in decision_metrics \
+        else INFORMATIONAL_PRIORITY for metric_info in metrics}
+
+def get_group_priority(group, priorities: Sequence[int]) -> int:
+    """
+    Get the priority of a fetch group: the highest priority (lowest number) of its pairs.
+    """
+    _, _, positions = group
+    return min(priorities[position] for position in positions)
+
+def schedule_groups(groups, priorities: Sequence[int] = None):
+    """
+    Order fetch groups by priority; groups of the same priority keep their order.
+    All pairs are decision metrics if priorities is None.
+    """
+    if priorities is None:
+        return list(groups)
+    return sorted(groups, key = lambda group: get_group_priority(group, priorities))
+
+class FetchScheduler:
+    """
+    Counts of metric values fetched and skipped, by priority.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.fetched: Dict[str, int] = {}
+        self.skipped: Dict[str, int] = {}
+
+    def record(self, groups, priorities: Sequence[int], group_results):
+        """
+        Record the results of fetch groups.
+        """
+        with self.lock:
+            for (_, _, positions), results in zip(groups, group_results):
+                for position, (_, err) in zip(positions, results):
+                    name = PRIORITY_NAMES[DECISION_PRIORITY if priorities is None \
+                        else priorities[position]]
+                    counts = self.skipped if isinstance(err, FetchSkippedError) \
+                        else self.fetched
+                    counts[name] = counts.get(name, 0) + 1
+
+    def skip(self, group):
+        """
+        Get the results of a fetch group which is skipped.
+        """
+        _, _, positions = group
+        logger.warning("skipped fetching %s metric values; deadline reached", len(positions))
+        return [(None, FetchSkippedError("deadline reached before the value was fetched")) \
+            for _ in positions]
+
+    def stats(self):
+        """
+        Get the number of metric values fetched and skipped, by priority.
+        """
+        with self.lock:
+            return {"fetched": dict(self.fetched), "skipped": dict(self.skipped)}
+
+    def reset(self):
+        """
+        Reset all counts.
+        """
+        with self.lock:
+            self.fetched = {}
+            self.skipped = {}
+
+fetch_scheduler = FetchScheduler()
@@ -0,0 +1,322 @@
+"""
+Module containing a pool of keep-alive HTTP sessions for metrics backends,
+and of HTTP/2 clients for metrics backends which support HTTP/2.
+"""
+# core python dependencies
+import asyncio
+from collections import deque
+from contextlib import contextmanager
+import importlib.util
+import logging
+import ssl
+import threading
+import time
+from typing import Any, Dict, FrozenSet, Tuple
+from urllib.parse import urlsplit
+
+# external module dependencies
+import requests
+from requests.adapters import HTTPAdapter
+import httpx
+import numpy as np
+
+# iter8 dependencies
+import iter8_analytics.constants as constants
+from iter8_analytics.config import env_config
+
+logger = logging.getLogger('iter8_analytics')
+
+# HTTP/2 support in httpx requires the h2 package (httpx[http2])
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+def get_backend_key(url: str) -> str:
+    """
+    Get the key of the metrics backend serving this url, namely, its scheme and host (with port).
+    """
+    parts = urlsplit(url)
+    return f"{parts.scheme.lower()}://{parts.netloc.lower()}"
+
+def parse_backends(backends: str) -> FrozenSet[str]:
+    """
+    Parse comma separated metrics backend URLs into a set of backend keys.
+    """
+    return frozenset(get_backend_key(url.strip()) for url in backends.split(",") \
+        if url.strip() != "")
+
+def create_ssl_context() -> ssl.SSLContext:
+    """
+    Create the SSL context shared by all connections to metrics backends.
+    Metrics backends are queried without certificate verification (verify = False).
+    """
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    return context
+
+class SSLContextAdapter(HTTPAdapter):
+    """
+    HTTP adapter which reuses the given SSL context for every connection it opens.
+    """
+    def __init__(self, ssl_context: ssl.SSLContext, **kwargs):
+        self.ssl_context = ssl_context
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs["ssl_context"] = self.ssl_context
+        return super().init_poolmanager(*args, **kwargs)
+
+    def proxy_manager_for(self, *args, **kwargs):
+        kwargs["ssl_context"] = self.ssl_context
+        return super().proxy_manager_for(*args, **kwargs)
+
+class SessionPool:
+    """
+    Pool of keep-alive HTTP sessions keyed by metrics backend (scheme and host).
+    Metrics backends in http2_backends are queried with HTTP/2 clients instead, which multiplex
+    all concurrent queries to the backend over a single connection.
+
+    Attributes:
+        pool_size (int): Maximum number of connections kept open per metrics backend.
+        keep_alive (bool): Keep connections open across requests.
+        max_idle (float): Seconds after which an unused session and its connections are closed.
+        accept_encoding (str): Content encodings accepted from metrics backends.
+        http2_backends (FrozenSet[str]): Keys of the metrics backends queried over HTTP/2.
+    """
+
+    def __init__(self, pool_size: int, keep_alive: bool, max_idle: float, \
+        accept_encoding: str = "gzip, deflate", http2_backends: FrozenSet[str] = frozenset()):
+        self.pool_size = pool_size
+        self.keep_alive = keep_alive
+        self.max_idle = max_idle
+        self.accept_encoding = accept_encoding
+        self.http2_backends = http2_backends
+        if len(http2_backends) > 0 and not HTTP2_AVAILABLE:
+            logger.warning("HTTP/2 requires the h2 package; " \
+                "querying metrics backends %s over HTTP/1.1", sorted(http2_backends))
+        self.ssl_context = create_ssl_context()
+        self.lock = threading.Lock()
+        # backend key -> (session, time of last use)
+        self.sessions: Dict[str, Tuple[requests.Session, float]] = {}
+        # backend key -> (HTTP/2 client shared by all threads, time of last use)
+        self.http2_clients: Dict[str, Tuple[httpx.Client, float]] = {}
+        # (backend key, event loop) -> (asynchronous client, time of last use)
+        self.async_clients: Dict[Tuple[str, asyncio.AbstractEventLoop], \
+            Tuple[httpx.AsyncClient, float]] = {}
+
+    def create_session(self) -> requests.Session:
+        """
+        Create a session whose connections are pooled, kept alive, and share the SSL context.
+        """
+        session = requests.Session()
+        session.verify = False
+        adapter = SSLContextAdapter(self.ssl_context, pool_connections = 1, \
+            pool_maxsize = self.pool_size)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        if not self.keep_alive:
+            session.headers["Connection"] = "close"
+        session.headers["Accept-Encoding"] = self.accept_encoding
+        return session
+
+    def uses_http2(self, url: str) -> bool:
+        """
+        Check if the metrics backend serving this url is queried over HTTP/2.
+        """
+        return HTTP2_AVAILABLE and get_backend_key(url) in self.http2_backends
+
+    def get_limits(self, http2: bool = False) -> httpx.Limits:
+        """
+        Get the connection limits of a client; HTTP/2 clients use a single connection.
+        """
+        max_connections = 1 if http2 else self.pool_size
+        return httpx.Limits(max_connections = max_connections, \
+            max_keepalive_connections = max_connections if self.keep_alive else 0, \
+                keepalive_expiry = self.max_idle)
+
+    def create_async_client(self, http2: bool = False) -> httpx.AsyncClient:
+        """
+        Create an asynchronous client whose connections are pooled, kept alive,
+        and share the SSL context.
+        """
+        return httpx.AsyncClient(verify = self.ssl_context, limits = self.get_limits(http2), \
+            headers = {"Accept-Encoding": self.accept_encoding}, http2 = http2)
+
+    def create_http2_client(self) -> httpx.Client:
+        """
+        Create an HTTP/2 client whose connection is kept alive and shares the SSL context.
+        """
+        return httpx.Client(verify = self.ssl_context, limits = self.get_limits(True), \
+            headers = {"Accept-Encoding": self.accept_encoding}, http2 = True)
+
+    def expire_idle_sessions(self, now: float):
+        """
+        Close sessions which have not been used for more than max_idle seconds.
+        Must be called while holding the lock.
+        """
+        for key in [key for key, (_, last_used) in self.sessions.items() \
+            if now - last_used > self.max_idle]:
+            session, _ = self.sessions.pop(key)
+            logger.debug("Closing idle session for metrics backend %s", key)
+            session.close()
+        for key in [key for key, (_, last_used) in self.http2_clients.items() \
+            if now - last_used > self.max_idle]:
+            client, _ = self.http2_clients.pop(key)
+            logger.debug("Closing idle HTTP/2 client for metrics backend %s", key)
+            client.close()
+        # asynchronous clients of closed event loops can no longer be used
+        for key in [key for key in self.async_clients if key[1].is_closed()]:
+            del self.async_clients[key]
+        for key in [key for key, (_, last_used) in self.async_clients.items() \
+            if now - last_used > self.max_idle]:
+            client, _ = self.async_clients.pop(key)
+            logger.debug("Closing idle asynchronous client for metrics backend %s", key[0])
+            # clients must be closed on their own event loop, which may run in another thread
+            asyncio.run_coroutine_threadsafe(client.aclose(), key[1])
+
+    def get_session(self, url: str) -> requests.Session:
+        """
+        Get the session for the metrics backend serving this url.
+        """
+        key = get_backend_key(url)
+        now = time.monotonic()
+        with self.lock:
+            self.expire_idle_sessions(now)
+            if key in self.sessions:
+                session, _ = self.sessions[key]
+            else:
+                logger.debug("Creating session for metrics backend %s", key)
+                session = self.create_session()
+            self.sessions[key] = (session, now)
+            return session
+
+    def get_http2_client(self, url: str) -> httpx.Client:
+        """
+        Get the HTTP/2 client for the metrics backend serving this url,
+        which is shared by all threads.
+        """
+        key = get_backend_key(url)
+        now = time.monotonic()
+        with self.lock:
+            self.expire_idle_sessions(now)
+            if key in self.http2_clients:
+                client, _ = self.http2_clients[key]
+            else:
+                logger.debug("Creating HTTP/2 client for metrics backend %s", key)
+                client = self.create_http2_client()
+            self.http2_clients[key] = (client, now)
+            return client
+
+    def get_async_client(self, url: str) -> httpx.AsyncClient:
+        """
+        Get the asynchronous client for the metrics backend serving this url.
+        Clients are bound to the running event loop.
+        """
+        key = (get_backend_key(url), asyncio.get_running_loop())
+        now = time.monotonic()
+        with self.lock:
+            self.expire_idle_sessions(now)
+            if key in self.async_clients:
+                client, _ = self.async_clients[key]
+            else:
+                logger.debug("Creating asynchronous client for metrics backend %s", key[0])
+                client = self.create_async_client(http2 = self.uses_http2(url))
+            self.async_clients[key] = (client, now)
+            return client
+
+    def close(self):
+        """
+        Close all sessions.
+        """
+        with self.lock:
+            sessions, self.sessions = self.sessions, {}
+            http2_clients, self.http2_clients = self.http2_clients, {}
+        for session, _ in sessions.values():
+            session.close()
+        for client, _ in http2_clients.values():
+            client.close()
+
+    async def aclose(self):
+        """
+        Close all sessions, and all asynchronous clients bound to the running event loop.
+        """
+        self.close()
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            keys = [key for key in self.async_clients if key[1] is loop]
+            clients = [self.async_clients.pop(key)[0] for key in keys]
+        for client in clients:
+            await client.aclose()
+
+class StreamStats:
+    """
+    Latency of queries to metrics backends queried over HTTP/2, per metrics backend:
+    each query is a stream, multiplexed with concurrent queries over the connection.
+    """
+
+    window = 1000
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters: Dict[str, Dict[str, Any]] = {}
+        self.latencies: Dict[str, deque] = {}
+
+    @contextmanager
+    def stream(self, url: str):
+        """
+        Time a query to the metrics backend serving this url; the caller sets
+        the "http_version" of the yielded dict to the protocol of the response.
+        """
+        key = get_backend_key(url)
+        with self.lock:
+            counters = self.counters.setdefault(key, {"streams": 0, "http2_streams": 0, \
+                "errors": 0, "in_flight": 0, "max_concurrent_streams": 0})
+            counters["in_flight"] += 1
+            counters["max_concurrent_streams"] = max(counters["max_concurrent_streams"], \
+                counters["in_flight"])
+        stream = {"http_version": None}
+        start = time.monotonic()
+        failed = True
+        try:
+            yield stream
+            failed = False
+        finally:
+            seconds = time.monotonic() - start
+            with self.lock:
+                counters["in_flight"] -= 1
+                counters["streams"] += 1
+                counters["http2_streams"] += stream["http_version"] == "HTTP/2"
+                counters["errors"] += failed
+                if not failed:
+                    self.latencies.setdefault(key, deque(maxlen = self.window)).append(seconds)
+
+    def reset(self):
+        """
+        Reset all counters and latencies.
+        """
+        with self.lock:
+            self.counters = {}
+            self.latencies = {}
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Get the number of streams (queries), streams served over HTTP/2, failed streams,
+        the maximum number of concurrent streams, and the 50th and 99th percentile and maximum
+        of recent stream latencies (in seconds), of each metrics backend.
+        """
+        with self.lock:
+            stats = {}
+            for key, counters in self.counters.items():
+                latencies = list(self.latencies.get(key, []))
+                stats[key] = dict(counters, \
+                    p50_latency = float(np.percentile(latencies, 50)) if latencies else None, \
+                    p99_latency = float(np.percentile(latencies, 99)) if latencies else None, \
+                    max_latency = max(latencies) if latencies else None)
+            return stats
+
+session_pool = SessionPool(pool_size = env_config[constants.BACKEND_POOL_SIZE], \
+    keep_alive = env_config[constants.BACKEND_KEEP_ALIVE], \
+        max_idle = env_config[constants.BACKEND_MAX_IDLE_SECONDS], \
+            accept_encoding = env_config[constants.BACKEND_ACCEPT_ENCODING], \
+                http2_backends = parse_backends(env_config[constants.BACKEND_HTTP2]))
+
+stream_stats = StreamStats()
@@ -57,6 +57,12 @@ class AuthType(str, Enum):
     BEARER = "Bearer"
     APIKEY = "APIKey"
 
+class Adapter(str, Enum):
+    """
+    Built-in adapters for querying metrics backends and parsing their responses.
+    """
+    PROMETHEUS = "prometheus"
+
 class Method(str, Enum):
     """
     The request method (aka verb) used in the HTTP(s) request to the metrics API endpoint.
@@ -64,6 +70,14 @@ class Method(str, Enum):
     GET = "GET"
     POST = "POST"
 
+class AnalysisStage(str, Enum):
+    """
+    Stages of analysis which use the aggregated metrics of an experiment.
+    """
+    VERSION_ASSESSMENTS = "version_assessments"
+    WINNER_ASSESSMENT = "winner_assessment"
+    WEIGHTS = "weights"
+
 class MetricType(str, Enum):
     """
     Is the metric type counter or gauge
@@ -100,6 +114,33 @@ class MetricSpec(BaseModel):
         disambiguate between builtin metrics and custom metrics")
     mock: Sequence[NamedLevel] = Field(None, \
         description = "information needed for mocking this metric")
+    adapter: Adapter = Field(None, description = "built-in adapter for the metrics backend; \
+        with the prometheus adapter, params (such as query) are sent as a POST form \
+        to urlTemplate, and the value is parsed from the scalar or instant vector result \
+        without jqExpression; not used with batch")
+    batch: bool = Field(False, description = "query the metrics backend once for all versions; \
+        params and body are interpolated using $names, a regular expression matching \
+        the name of any version, for use within a PromQL string literal (regular expression \
+        metacharacters in version names are escaped); the value of each version is unmarshaled using jqExpression \
+        with the name and variables of the version bound to the jq variables $name, ...")
+    incremental: bool = Field(False, description = "evaluate a counter metric incrementally; \
+        the service keeps a checkpoint of the value of the counter, queries only \
+        the window since the checkpoint using ${elapsedTime} as the window length, \
+        and adds the result to the checkpoint; not used with batch")
+    merge: bool = Field(False, description = "merge the POST query of this metric with those \
+        of other merge metrics with the same urlTemplate, headers, auth, and body apart from \
+        its metrics list; the value is unmarshaled using jqExpression with the jq variable \
+        $offset bound to the position of the first entry of the metrics list of this metric \
+        in the merged metrics list")
+    cacheTTL: float = Field(None, description = "units = seconds; \
+        metric values are cached for this duration; \
+        if unspecified, the service-wide metric cache ttl is used", ge = 0)
+    retries: int = Field(None, description = "number of retries of queries which failed \
+        with a connection error, timeout, or 429, 502, 503 or 504 response; \
+        if unspecified, the service-wide retry count is used", ge = 0)
+    retryPost: bool = Field(None, description = "retry POST queries; \
+        if unspecified, the read-only form queries of metrics using the prometheus adapter \
+        are retried, and other POST queries are not")
 
     def convert_to_float(self):
         """
@@ -468,3 +509,12 @@ class ExperimentResource(BaseModel):
         self.spec = self.spec.convert_to_quantity()
         self.status = self.status.convert_to_quantity()
         return self
+
+class PrefetchRegistration(BaseModel):
+    """
+    Pydantic model for registering an experiment for background prefetching of metric values
+    """
+    experimentResource: ExperimentResource = Field(..., \
+        description = "experiment resource, along with its metric resources")
+    interval: float = Field(..., description = "units = seconds; \
+        interval at which analytics results are requested for this experiment", gt = 0)
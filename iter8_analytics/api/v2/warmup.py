@@ -0,0 +1,199 @@
+"""
+Module containing the startup warm-up of metrics backend connections and the Kubernetes client,
+which keeps the first analytics requests after a rollout from paying for DNS lookups,
+TCP and TLS handshakes, and client initialization.
+"""
+# core python dependencies
+import asyncio
+import logging
+import socket
+import time
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit
+
+# external module dependencies
+import yaml
+
+# iter8 dependencies
+import iter8_analytics.constants as constants
+from iter8_analytics.config import env_config
+from iter8_analytics.api.v2.types import MetricResource
+from iter8_analytics.api.v2.sessions import get_backend_key, session_pool
+from iter8_analytics.api.v2.metrics import get_url, get_kube_core_api
+
+logger = logging.getLogger('iter8_analytics')
+
+def get_metric_resource_urls(metrics_file: str) -> List[str]:
+    """
+    Get the urls of the metric resources in a yaml (or JSON) file;
+    the file may contain metric resources, lists of them, or kubernetes lists (items).
+    """
+    urls = []
+    with open(metrics_file, encoding = "utf-8") as stream:
+        for doc in yaml.safe_load_all(stream):
+            if isinstance(doc, dict) and "items" in doc:
+                doc = doc["items"]
+            for item in doc if isinstance(doc, list) else [doc]:
+                try:
+                    url, err = get_url(MetricResource(** item))
+                except Exception as exc: # pylint: disable=broad-except
+                    url, err = None, exc
+                if err is not None:
+                    logger.warning("cannot warm up metric resource in %s: %s", metrics_file, err)
+                else:
+                    urls.append(url)
+    return urls
+
+def get_warmup_urls(backends: str, metrics_file: str) -> List[str]:
+    """
+    Get one url for each metrics backend to warm up, from comma separated urls
+    and the metric resources in the metrics file, if any.
+    """
+    urls = [url.strip() for url in backends.split(",") if url.strip() != ""]
+    if metrics_file:
+        try:
+            urls.extend(get_metric_resource_urls(metrics_file))
+        except (OSError, yaml.YAMLError) as exc:
+            logger.error("cannot read warm-up metrics file %s: %s", metrics_file, exc)
+    by_backend = {}
+    for url in urls:
+        by_backend.setdefault(get_backend_key(url), url)
+    return list(by_backend.values())
+
+def resolve(url: str):
+    """
+    Resolve the host of the url.
+    """
+    parts = urlsplit(url)
+    port = parts.port or (443 if parts.scheme == "https" else 80)
+    socket.getaddrinfo(parts.hostname, port, type = socket.SOCK_STREAM)
+
+def get_root_url(url: str) -> str:
+    """
+    Get the root url of the metrics backend serving this url.
+    """
+    return get_backend_key(url) + "/"
+
+def preconnect(url: str, timeout: float):
+    """
+    Open a pooled connection to the metrics backend using a HEAD request for its root,
+    so that no query is made; the connection is kept alive in the session
+    (or HTTP/2 client) of the backend.
+    """
+    root_url = get_root_url(url)
+    if session_pool.uses_http2(url):
+        session_pool.get_http2_client(url).head(root_url, timeout = timeout).close()
+    else:
+        session_pool.get_session(url).head(root_url, timeout = timeout).close()
+
+class Warmup:
+    """
+    Startup warm-up: metrics backends are resolved and pre-connected,
+    and the Kubernetes client is initialized. The service is ready once warm-up
+    has finished or timed out.
+
+    Attributes:
+        timeout (float): Seconds after which warm-up is abandoned.
+        urls (List[str]): One url of each metrics backend to warm up; if None, the urls are
+            read from the warm-up backends and metrics file settings when warm-up starts.
+        ready (bool): Whether warm-up has finished or timed out.
+    """
+
+    def __init__(self, timeout: float, urls: Optional[List[str]] = None):
+        self.timeout = timeout
+        self.urls = urls
+        self.ready = False
+        self.timed_out = False
+        self.duration: Optional[float] = None
+        # backend key -> warm-up status of the backend
+        self.backends: Dict[str, Dict[str, Any]] = {}
+        self.kube_client = False
+        self.task = None
+
+    async def warm_backend(self, url: str):
+        """
+        Resolve the backend, and pre-connect its session and its asynchronous client.
+        """
+        status = self.backends.setdefault(get_backend_key(url), \
+            {"resolved": False, "connected": False, "error": None})
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(None, resolve, url)
+            status["resolved"] = True
+            await loop.run_in_executor(None, preconnect, url, self.timeout)
+            await session_pool.get_async_client(url).head(get_root_url(url), \
+                timeout = self.timeout)
+            status["connected"] = True
+        except Exception as exc: # pylint: disable=broad-except
+            logger.warning("cannot warm up metrics backend %s: %s", url, exc)
+            status["error"] = str(exc)
+
+    async def warm_kube_client(self):
+        """
+        Initialize the in-cluster Kubernetes client, if running in a cluster.
+        """
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, get_kube_core_api)
+            self.kube_client = True
+        except Exception as exc: # pylint: disable=broad-except
+            logger.info("Kubernetes client not initialized: %s", exc)
+
+    async def warm_backends(self):
+        """
+        Warm up all backends; urls are read from the settings (and the metrics file, off
+        the event loop) unless they were given.
+        """
+        urls = self.urls
+        if urls is None:
+            urls = await asyncio.get_running_loop().run_in_executor(None, get_warmup_urls, \
+                env_config[constants.WARMUP_BACKENDS], env_config[constants.WARMUP_METRICS_FILE])
+        await asyncio.gather(*[self.warm_backend(url) for url in urls])
+
+    async def run(self):
+        """
+        Warm up all backends and the Kubernetes client, within the timeout.
+        """
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.gather(self.warm_kube_client(), \
+                self.warm_backends()), self.timeout)
+        except asyncio.TimeoutError:
+            logger.warning("warm-up timed out after %s seconds", self.timeout)
+            self.timed_out = True
+        finally:
+            self.duration = time.monotonic() - start
+            self.ready = True
+            logger.info("warm-up finished in %s seconds", self.duration)
+
+    def start(self):
+        """
+        Start warm-up in the running event loop.
+        """
+        self.ready = False
+        self.task = asyncio.ensure_future(self.run())
+
+    async def stop(self):
+        """
+        Stop warm-up, if it is still running.
+        """
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the warm-up status of each backend and of the Kubernetes client.
+        """
+        return {
+            "ready": self.ready,
+            "timed_out": self.timed_out,
+            "duration": self.duration,
+            "kube_client": self.kube_client,
+            "backends": self.backends
+        }
+
+warmup = Warmup(timeout = env_config[constants.WARMUP_TIMEOUT_SECONDS])
@@ -24,6 +24,173 @@ def get_env_config():
         "The iter8 analytics server will listen on port %s", \
             config[constants.ANALYTICS_SERVICE_PORT])
 
+    # maximum number of metric queries in flight during a single metrics collection
+    # override with environment variable
+    config[constants.METRICS_FETCH_CONCURRENCY] = int(os.getenv(
+        constants.METRICS_FETCH_CONCURRENCY_ENV, constants.METRICS_FETCH_CONCURRENCY_DEFAULT))
+
+    # pooled, keep-alive HTTP connections to metrics backends
+    # override with environment variables
+    config[constants.BACKEND_POOL_SIZE] = int(os.getenv(
+        constants.BACKEND_POOL_SIZE_ENV, constants.BACKEND_POOL_SIZE_DEFAULT))
+    config[constants.BACKEND_KEEP_ALIVE] = str(os.getenv(
+        constants.BACKEND_KEEP_ALIVE_ENV, constants.BACKEND_KEEP_ALIVE_DEFAULT)).lower() == 'true'
+    config[constants.BACKEND_MAX_IDLE_SECONDS] = float(os.getenv(
+        constants.BACKEND_MAX_IDLE_SECONDS_ENV, constants.BACKEND_MAX_IDLE_SECONDS_DEFAULT))
+    # content encodings accepted from metrics backends; identity disables compression
+    config[constants.BACKEND_ACCEPT_ENCODING] = os.getenv(
+        constants.BACKEND_ACCEPT_ENCODING_ENV, constants.BACKEND_ACCEPT_ENCODING_DEFAULT)
+    # metrics backends queried over HTTP/2, given as comma separated urls;
+    # concurrent queries to each of them are multiplexed over a single connection
+    config[constants.BACKEND_HTTP2] = os.getenv(
+        constants.BACKEND_HTTP2_ENV, constants.BACKEND_HTTP2_DEFAULT)
+
+    # caching of metric values; a ttl of zero disables caching unless a metric specifies its own
+    # override with environment variables
+    config[constants.METRIC_CACHE_TTL_SECONDS] = float(os.getenv(
+        constants.METRIC_CACHE_TTL_SECONDS_ENV, constants.METRIC_CACHE_TTL_SECONDS_DEFAULT))
+    config[constants.METRIC_CACHE_SIZE] = int(os.getenv(
+        constants.METRIC_CACHE_SIZE_ENV, constants.METRIC_CACHE_SIZE_DEFAULT))
+
+    # elapsedTime in metric queries is rounded down to a multiple of this step
+    # override with environment variable
+    config[constants.ELAPSED_TIME_STEP_SECONDS] = int(os.getenv(
+        constants.ELAPSED_TIME_STEP_SECONDS_ENV, constants.ELAPSED_TIME_STEP_SECONDS_DEFAULT))
+
+    # timeout for a single metrics backend query, unless less of the request deadline is left
+    # override with environment variable
+    config[constants.METRICS_BACKEND_TIMEOUT_SECONDS] = float(os.getenv(
+        constants.METRICS_BACKEND_TIMEOUT_SECONDS_ENV, \
+            constants.METRICS_BACKEND_TIMEOUT_SECONDS_DEFAULT))
+
+    # circuit breakers of metrics backends; a failure threshold of zero disables them
+    # override with environment variables
+    config[constants.CIRCUIT_BREAKER_FAILURE_THRESHOLD] = int(os.getenv(
+        constants.CIRCUIT_BREAKER_FAILURE_THRESHOLD_ENV, \
+            constants.CIRCUIT_BREAKER_FAILURE_THRESHOLD_DEFAULT))
+    config[constants.CIRCUIT_BREAKER_RESET_SECONDS] = float(os.getenv(
+        constants.CIRCUIT_BREAKER_RESET_SECONDS_ENV, \
+            constants.CIRCUIT_BREAKER_RESET_SECONDS_DEFAULT))
+
+    # hedging of queries slower than a percentile of recent latencies; a percentile of zero
+    # disables hedging; alternate backends are comma separated backend=alternate url pairs
+    # override with environment variables
+    config[constants.HEDGE_PERCENTILE] = float(os.getenv(
+        constants.HEDGE_PERCENTILE_ENV, constants.HEDGE_PERCENTILE_DEFAULT))
+    config[constants.HEDGE_MIN_SAMPLES] = int(os.getenv(
+        constants.HEDGE_MIN_SAMPLES_ENV, constants.HEDGE_MIN_SAMPLES_DEFAULT))
+    config[constants.HEDGE_MAX_EXTRA_LOAD] = float(os.getenv(
+        constants.HEDGE_MAX_EXTRA_LOAD_ENV, constants.HEDGE_MAX_EXTRA_LOAD_DEFAULT))
+    config[constants.HEDGE_ALTERNATE_BACKENDS] = os.getenv(
+        constants.HEDGE_ALTERNATE_BACKENDS_ENV, constants.HEDGE_ALTERNATE_BACKENDS_DEFAULT)
+
+    # adaptive (AIMD) limits on concurrent queries to each metrics backend;
+    # the initial limit defaults to the metrics fetch concurrency, so that it does not throttle
+    # a single metrics collection
+    # override with environment variables
+    config[constants.BACKEND_CONCURRENCY_INITIAL] = int(os.getenv(
+        constants.BACKEND_CONCURRENCY_INITIAL_ENV, config[constants.METRICS_FETCH_CONCURRENCY]))
+    config[constants.BACKEND_CONCURRENCY_MIN] = int(os.getenv(
+        constants.BACKEND_CONCURRENCY_MIN_ENV, constants.BACKEND_CONCURRENCY_MIN_DEFAULT))
+    config[constants.BACKEND_CONCURRENCY_MAX] = int(os.getenv(
+        constants.BACKEND_CONCURRENCY_MAX_ENV, constants.BACKEND_CONCURRENCY_MAX_DEFAULT))
+    config[constants.BACKEND_CONCURRENCY_BACKOFF] = float(os.getenv(
+        constants.BACKEND_CONCURRENCY_BACKOFF_ENV, constants.BACKEND_CONCURRENCY_BACKOFF_DEFAULT))
+    config[constants.BACKEND_LATENCY_TOLERANCE] = float(os.getenv(
+        constants.BACKEND_LATENCY_TOLERANCE_ENV, constants.BACKEND_LATENCY_TOLERANCE_DEFAULT))
+
+    # maximum size of a metrics backend response body; zero means unbounded
+    # override with environment variable
+    config[constants.BACKEND_MAX_RESPONSE_BYTES] = int(os.getenv(
+        constants.BACKEND_MAX_RESPONSE_BYTES_ENV, constants.BACKEND_MAX_RESPONSE_BYTES_DEFAULT))
+
+    # checkpoints of incremental counter metrics; idle checkpoints expire after the ttl
+    # override with environment variables
+    config[constants.CHECKPOINT_STORE_SIZE] = int(os.getenv(
+        constants.CHECKPOINT_STORE_SIZE_ENV, constants.CHECKPOINT_STORE_SIZE_DEFAULT))
+    config[constants.CHECKPOINT_TTL_SECONDS] = float(os.getenv(
+        constants.CHECKPOINT_TTL_SECONDS_ENV, constants.CHECKPOINT_TTL_SECONDS_DEFAULT))
+
+    # background prefetching of metric values of registered experiments
+    # override with environment variables
+    config[constants.PREFETCH_WORKERS] = int(os.getenv(
+        constants.PREFETCH_WORKERS_ENV, constants.PREFETCH_WORKERS_DEFAULT))
+    config[constants.PREFETCH_LEAD_SECONDS] = float(os.getenv(
+        constants.PREFETCH_LEAD_SECONDS_ENV, constants.PREFETCH_LEAD_SECONDS_DEFAULT))
+    config[constants.PREFETCH_IDLE_SECONDS] = float(os.getenv(
+        constants.PREFETCH_IDLE_SECONDS_ENV, constants.PREFETCH_IDLE_SECONDS_DEFAULT))
+
+    # record metrics backend responses to a cassette file (record), or serve them from it (replay)
+    # override with environment variables
+    config[constants.CASSETTE_MODE] = str(os.getenv(
+        constants.CASSETTE_MODE_ENV, constants.CASSETTE_MODE_DEFAULT)).lower()
+    config[constants.CASSETTE_PATH] = os.getenv(
+        constants.CASSETTE_PATH_ENV, constants.CASSETTE_PATH_DEFAULT)
+    config[constants.CASSETTE_REPLAY_LATENCY] = str(os.getenv(
+        constants.CASSETTE_REPLAY_LATENCY_ENV,
+        constants.CASSETTE_REPLAY_LATENCY_DEFAULT)).lower() == 'true'
+
+    # behavior of the fake metrics backend used for load testing
+    # override with environment variables
+    config[constants.FAKE_BACKEND_PORT] = int(os.getenv(
+        constants.FAKE_BACKEND_PORT_ENV, constants.FAKE_BACKEND_PORT_DEFAULT))
+    config[constants.FAKE_BACKEND_LATENCY_DISTRIBUTION] = str(os.getenv(
+        constants.FAKE_BACKEND_LATENCY_DISTRIBUTION_ENV,
+        constants.FAKE_BACKEND_LATENCY_DISTRIBUTION_DEFAULT)).lower()
+    config[constants.FAKE_BACKEND_LATENCY_SECONDS] = float(os.getenv(
+        constants.FAKE_BACKEND_LATENCY_SECONDS_ENV, constants.FAKE_BACKEND_LATENCY_SECONDS_DEFAULT))
+    config[constants.FAKE_BACKEND_LATENCY_SPREAD] = float(os.getenv(
+        constants.FAKE_BACKEND_LATENCY_SPREAD_ENV, constants.FAKE_BACKEND_LATENCY_SPREAD_DEFAULT))
+    config[constants.FAKE_BACKEND_ERROR_RATE] = float(os.getenv(
+        constants.FAKE_BACKEND_ERROR_RATE_ENV, constants.FAKE_BACKEND_ERROR_RATE_DEFAULT))
+    config[constants.FAKE_BACKEND_RESPONSE_BYTES] = int(os.getenv(
+        constants.FAKE_BACKEND_RESPONSE_BYTES_ENV, constants.FAKE_BACKEND_RESPONSE_BYTES_DEFAULT))
+
+    # retries of metrics backend queries which failed transiently, with jittered backoff;
+    # a retry is made only if the backoff and the minimum attempt time fit in the deadline;
+    # no retries by default, since retries add to the latency of requests without a deadline
+    # override with environment variables
+    config[constants.METRICS_BACKEND_RETRIES] = int(os.getenv(
+        constants.METRICS_BACKEND_RETRIES_ENV, constants.METRICS_BACKEND_RETRIES_DEFAULT))
+    config[constants.METRICS_BACKEND_RETRY_BASE_DELAY_SECONDS] = float(os.getenv(
+        constants.METRICS_BACKEND_RETRY_BASE_DELAY_SECONDS_ENV,
+        constants.METRICS_BACKEND_RETRY_BASE_DELAY_SECONDS_DEFAULT))
+    config[constants.METRICS_BACKEND_RETRY_MAX_DELAY_SECONDS] = float(os.getenv(
+        constants.METRICS_BACKEND_RETRY_MAX_DELAY_SECONDS_ENV,
+        constants.METRICS_BACKEND_RETRY_MAX_DELAY_SECONDS_DEFAULT))
+    config[constants.METRICS_BACKEND_RETRY_MIN_ATTEMPT_SECONDS] = float(os.getenv(
+        constants.METRICS_BACKEND_RETRY_MIN_ATTEMPT_SECONDS_ENV,
+        constants.METRICS_BACKEND_RETRY_MIN_ATTEMPT_SECONDS_DEFAULT))
+
+    # startup warm-up of connections to metrics backends, given as comma separated urls,
+    # or as metric resources in a yaml file; the service is ready once warm-up finishes
+    # or times out
+    # override with environment variables
+    config[constants.WARMUP_BACKENDS] = os.getenv(
+        constants.WARMUP_BACKENDS_ENV, constants.WARMUP_BACKENDS_DEFAULT)
+    config[constants.WARMUP_METRICS_FILE] = os.getenv(
+        constants.WARMUP_METRICS_FILE_ENV, constants.WARMUP_METRICS_FILE_DEFAULT)
+    config[constants.WARMUP_TIMEOUT_SECONDS] = float(os.getenv(
+        constants.WARMUP_TIMEOUT_SECONDS_ENV, constants.WARMUP_TIMEOUT_SECONDS_DEFAULT))
+
+    # persistent store of last known good metric values, used as fallbacks;
+    # disabled unless a path is given
+    # override with environment variables
+    config[constants.FALLBACK_STORE_PATH] = os.getenv(
+        constants.FALLBACK_STORE_PATH_ENV, constants.FALLBACK_STORE_PATH_DEFAULT)
+    config[constants.FALLBACK_STORE_BATCH_SIZE] = int(os.getenv(
+        constants.FALLBACK_STORE_BATCH_SIZE_ENV, constants.FALLBACK_STORE_BATCH_SIZE_DEFAULT))
+    config[constants.FALLBACK_STORE_FLUSH_SECONDS] = float(os.getenv(
+        constants.FALLBACK_STORE_FLUSH_SECONDS_ENV, constants.FALLBACK_STORE_FLUSH_SECONDS_DEFAULT))
+    config[constants.FALLBACK_STORE_TTL_SECONDS] = float(os.getenv(
+        constants.FALLBACK_STORE_TTL_SECONDS_ENV, constants.FALLBACK_STORE_TTL_SECONDS_DEFAULT))
+
+    # fetch all metrics of experiments, including those which are not needed by
+    # the requested stages of analysis; requests may opt in with the fetchAll query parameter
+    # override with environment variables
+    config[constants.METRICS_FETCH_ALL] = str(os.getenv(
+        constants.METRICS_FETCH_ALL_ENV, constants.METRICS_FETCH_ALL_DEFAULT)).lower() == 'true'
+
     return config
 
 env_config = get_env_config()
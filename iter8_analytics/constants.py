@@ -10,3 +10,197 @@ ANALYTICS_SERVICE_PORT = 'ANALYTICS_SERVICE_PORT'
 ANALYTICS_SERVICE_DEFAULT_PORT = 8080
 ANALYTICS_SERVICE_CONFIGFILE_PORT = 'port'
 ANALYTICS_SERVICE_PORT_ENV = 'ITER8_ANALYTICS_SERVER_PORT'
+
+METRICS_FETCH_CONCURRENCY = 'metrics_fetch_concurrency'
+METRICS_FETCH_CONCURRENCY_DEFAULT = 16
+METRICS_FETCH_CONCURRENCY_ENV = 'ITER8_ANALYTICS_METRICS_FETCH_CONCURRENCY'
+
+BACKEND_POOL_SIZE = 'backend_pool_size'
+BACKEND_POOL_SIZE_DEFAULT = 10
+BACKEND_POOL_SIZE_ENV = 'ITER8_ANALYTICS_BACKEND_POOL_SIZE'
+
+BACKEND_KEEP_ALIVE = 'backend_keep_alive'
+BACKEND_KEEP_ALIVE_DEFAULT = 'true'
+BACKEND_KEEP_ALIVE_ENV = 'ITER8_ANALYTICS_BACKEND_KEEP_ALIVE'
+
+BACKEND_MAX_IDLE_SECONDS = 'backend_max_idle_seconds'
+BACKEND_MAX_IDLE_SECONDS_DEFAULT = 60.0
+BACKEND_MAX_IDLE_SECONDS_ENV = 'ITER8_ANALYTICS_BACKEND_MAX_IDLE_SECONDS'
+
+BACKEND_ACCEPT_ENCODING = 'backend_accept_encoding'
+BACKEND_ACCEPT_ENCODING_DEFAULT = 'gzip, deflate'
+BACKEND_ACCEPT_ENCODING_ENV = 'ITER8_ANALYTICS_BACKEND_ACCEPT_ENCODING'
+
+BACKEND_HTTP2 = 'backend_http2'
+BACKEND_HTTP2_DEFAULT = ''
+BACKEND_HTTP2_ENV = 'ITER8_ANALYTICS_BACKEND_HTTP2'
+
+METRIC_CACHE_TTL_SECONDS = 'metric_cache_ttl_seconds'
+METRIC_CACHE_TTL_SECONDS_DEFAULT = 0.0
+METRIC_CACHE_TTL_SECONDS_ENV = 'ITER8_ANALYTICS_METRIC_CACHE_TTL_SECONDS'
+
+METRIC_CACHE_SIZE = 'metric_cache_size'
+METRIC_CACHE_SIZE_DEFAULT = 1024
+METRIC_CACHE_SIZE_ENV = 'ITER8_ANALYTICS_METRIC_CACHE_SIZE'
+
+ELAPSED_TIME_STEP_SECONDS = 'elapsed_time_step_seconds'
+ELAPSED_TIME_STEP_SECONDS_DEFAULT = 1
+ELAPSED_TIME_STEP_SECONDS_ENV = 'ITER8_ANALYTICS_ELAPSED_TIME_STEP_SECONDS'
+
+METRICS_BACKEND_TIMEOUT_SECONDS = 'metrics_backend_timeout_seconds'
+METRICS_BACKEND_TIMEOUT_SECONDS_DEFAULT = 5.0
+METRICS_BACKEND_TIMEOUT_SECONDS_ENV = 'ITER8_ANALYTICS_METRICS_BACKEND_TIMEOUT_SECONDS'
+
+CIRCUIT_BREAKER_FAILURE_THRESHOLD = 'circuit_breaker_failure_threshold'
+CIRCUIT_BREAKER_FAILURE_THRESHOLD_DEFAULT = 5
+CIRCUIT_BREAKER_FAILURE_THRESHOLD_ENV = 'ITER8_ANALYTICS_CIRCUIT_BREAKER_FAILURE_THRESHOLD'
+
+CIRCUIT_BREAKER_RESET_SECONDS = 'circuit_breaker_reset_seconds'
+CIRCUIT_BREAKER_RESET_SECONDS_DEFAULT = 30.0
+CIRCUIT_BREAKER_RESET_SECONDS_ENV = 'ITER8_ANALYTICS_CIRCUIT_BREAKER_RESET_SECONDS'
+
+HEDGE_PERCENTILE = 'hedge_percentile'
+HEDGE_PERCENTILE_DEFAULT = 0.0
+HEDGE_PERCENTILE_ENV = 'ITER8_ANALYTICS_HEDGE_PERCENTILE'
+
+HEDGE_MIN_SAMPLES = 'hedge_min_samples'
+HEDGE_MIN_SAMPLES_DEFAULT = 20
+HEDGE_MIN_SAMPLES_ENV = 'ITER8_ANALYTICS_HEDGE_MIN_SAMPLES'
+
+HEDGE_MAX_EXTRA_LOAD = 'hedge_max_extra_load'
+HEDGE_MAX_EXTRA_LOAD_DEFAULT = 0.1
+HEDGE_MAX_EXTRA_LOAD_ENV = 'ITER8_ANALYTICS_HEDGE_MAX_EXTRA_LOAD'
+
+HEDGE_ALTERNATE_BACKENDS = 'hedge_alternate_backends'
+HEDGE_ALTERNATE_BACKENDS_DEFAULT = ''
+HEDGE_ALTERNATE_BACKENDS_ENV = 'ITER8_ANALYTICS_HEDGE_ALTERNATE_BACKENDS'
+
+BACKEND_CONCURRENCY_INITIAL = 'backend_concurrency_initial'
+BACKEND_CONCURRENCY_INITIAL_ENV = 'ITER8_ANALYTICS_BACKEND_CONCURRENCY_INITIAL'
+
+BACKEND_CONCURRENCY_MIN = 'backend_concurrency_min'
+BACKEND_CONCURRENCY_MIN_DEFAULT = 1
+BACKEND_CONCURRENCY_MIN_ENV = 'ITER8_ANALYTICS_BACKEND_CONCURRENCY_MIN'
+
+BACKEND_CONCURRENCY_MAX = 'backend_concurrency_max'
+BACKEND_CONCURRENCY_MAX_DEFAULT = 100
+BACKEND_CONCURRENCY_MAX_ENV = 'ITER8_ANALYTICS_BACKEND_CONCURRENCY_MAX'
+
+BACKEND_CONCURRENCY_BACKOFF = 'backend_concurrency_backoff'
+BACKEND_CONCURRENCY_BACKOFF_DEFAULT = 0.5
+BACKEND_CONCURRENCY_BACKOFF_ENV = 'ITER8_ANALYTICS_BACKEND_CONCURRENCY_BACKOFF'
+
+BACKEND_LATENCY_TOLERANCE = 'backend_latency_tolerance'
+BACKEND_LATENCY_TOLERANCE_DEFAULT = 4.0
+BACKEND_LATENCY_TOLERANCE_ENV = 'ITER8_ANALYTICS_BACKEND_LATENCY_TOLERANCE'
+
+BACKEND_MAX_RESPONSE_BYTES = 'backend_max_response_bytes'
+BACKEND_MAX_RESPONSE_BYTES_DEFAULT = 10 * 1024 * 1024
+BACKEND_MAX_RESPONSE_BYTES_ENV = 'ITER8_ANALYTICS_BACKEND_MAX_RESPONSE_BYTES'
+
+CHECKPOINT_STORE_SIZE = 'checkpoint_store_size'
+CHECKPOINT_STORE_SIZE_DEFAULT = 10000
+CHECKPOINT_STORE_SIZE_ENV = 'ITER8_ANALYTICS_CHECKPOINT_STORE_SIZE'
+
+CHECKPOINT_TTL_SECONDS = 'checkpoint_ttl_seconds'
+CHECKPOINT_TTL_SECONDS_DEFAULT = 3600.0
+CHECKPOINT_TTL_SECONDS_ENV = 'ITER8_ANALYTICS_CHECKPOINT_TTL_SECONDS'
+
+PREFETCH_WORKERS = 'prefetch_workers'
+PREFETCH_WORKERS_DEFAULT = 4
+PREFETCH_WORKERS_ENV = 'ITER8_ANALYTICS_PREFETCH_WORKERS'
+
+PREFETCH_LEAD_SECONDS = 'prefetch_lead_seconds'
+PREFETCH_LEAD_SECONDS_DEFAULT = 2.0
+PREFETCH_LEAD_SECONDS_ENV = 'ITER8_ANALYTICS_PREFETCH_LEAD_SECONDS'
+
+PREFETCH_IDLE_SECONDS = 'prefetch_idle_seconds'
+PREFETCH_IDLE_SECONDS_DEFAULT = 600.0
+PREFETCH_IDLE_SECONDS_ENV = 'ITER8_ANALYTICS_PREFETCH_IDLE_SECONDS'
+
+CASSETTE_MODE = 'cassette_mode'
+CASSETTE_MODE_DEFAULT = 'off'
+CASSETTE_MODE_ENV = 'ITER8_ANALYTICS_CASSETTE_MODE'
+
+CASSETTE_PATH = 'cassette_path'
+CASSETTE_PATH_DEFAULT = 'iter8-analytics-cassette.jsonl.gz'
+CASSETTE_PATH_ENV = 'ITER8_ANALYTICS_CASSETTE_PATH'
+
+CASSETTE_REPLAY_LATENCY = 'cassette_replay_latency'
+CASSETTE_REPLAY_LATENCY_DEFAULT = 'false'
+CASSETTE_REPLAY_LATENCY_ENV = 'ITER8_ANALYTICS_CASSETTE_REPLAY_LATENCY'
+
+FAKE_BACKEND_PORT = 'fake_backend_port'
+FAKE_BACKEND_PORT_DEFAULT = 8080
+FAKE_BACKEND_PORT_ENV = 'ITER8_FAKE_BACKEND_PORT'
+
+FAKE_BACKEND_LATENCY_DISTRIBUTION = 'fake_backend_latency_distribution'
+FAKE_BACKEND_LATENCY_DISTRIBUTION_DEFAULT = 'fixed'
+FAKE_BACKEND_LATENCY_DISTRIBUTION_ENV = 'ITER8_FAKE_BACKEND_LATENCY_DISTRIBUTION'
+
+FAKE_BACKEND_LATENCY_SECONDS = 'fake_backend_latency_seconds'
+FAKE_BACKEND_LATENCY_SECONDS_DEFAULT = 0.0
+FAKE_BACKEND_LATENCY_SECONDS_ENV = 'ITER8_FAKE_BACKEND_LATENCY_SECONDS'
+
+FAKE_BACKEND_LATENCY_SPREAD = 'fake_backend_latency_spread'
+FAKE_BACKEND_LATENCY_SPREAD_DEFAULT = 0.0
+FAKE_BACKEND_LATENCY_SPREAD_ENV = 'ITER8_FAKE_BACKEND_LATENCY_SPREAD'
+
+FAKE_BACKEND_ERROR_RATE = 'fake_backend_error_rate'
+FAKE_BACKEND_ERROR_RATE_DEFAULT = 0.0
+FAKE_BACKEND_ERROR_RATE_ENV = 'ITER8_FAKE_BACKEND_ERROR_RATE'
+
+FAKE_BACKEND_RESPONSE_BYTES = 'fake_backend_response_bytes'
+FAKE_BACKEND_RESPONSE_BYTES_DEFAULT = 0
+FAKE_BACKEND_RESPONSE_BYTES_ENV = 'ITER8_FAKE_BACKEND_RESPONSE_BYTES'
+
+METRICS_BACKEND_RETRIES = 'metrics_backend_retries'
+METRICS_BACKEND_RETRIES_DEFAULT = 0
+METRICS_BACKEND_RETRIES_ENV = 'ITER8_ANALYTICS_METRICS_BACKEND_RETRIES'
+
+METRICS_BACKEND_RETRY_BASE_DELAY_SECONDS = 'metrics_backend_retry_base_delay_seconds'
+METRICS_BACKEND_RETRY_BASE_DELAY_SECONDS_DEFAULT = 0.1
+METRICS_BACKEND_RETRY_BASE_DELAY_SECONDS_ENV = \
+    'ITER8_ANALYTICS_METRICS_BACKEND_RETRY_BASE_DELAY_SECONDS'
+
+METRICS_BACKEND_RETRY_MAX_DELAY_SECONDS = 'metrics_backend_retry_max_delay_seconds'
+METRICS_BACKEND_RETRY_MAX_DELAY_SECONDS_DEFAULT = 2.0
+METRICS_BACKEND_RETRY_MAX_DELAY_SECONDS_ENV = \
+    'ITER8_ANALYTICS_METRICS_BACKEND_RETRY_MAX_DELAY_SECONDS'
+
+METRICS_BACKEND_RETRY_MIN_ATTEMPT_SECONDS = 'metrics_backend_retry_min_attempt_seconds'
+METRICS_BACKEND_RETRY_MIN_ATTEMPT_SECONDS_DEFAULT = 0.5
+METRICS_BACKEND_RETRY_MIN_ATTEMPT_SECONDS_ENV = \
+    'ITER8_ANALYTICS_METRICS_BACKEND_RETRY_MIN_ATTEMPT_SECONDS'
+
+WARMUP_BACKENDS = 'warmup_backends'
+WARMUP_BACKENDS_DEFAULT = ''
+WARMUP_BACKENDS_ENV = 'ITER8_ANALYTICS_WARMUP_BACKENDS'
+
+WARMUP_METRICS_FILE = 'warmup_metrics_file'
+WARMUP_METRICS_FILE_DEFAULT = ''
+WARMUP_METRICS_FILE_ENV = 'ITER8_ANALYTICS_WARMUP_METRICS_FILE'
+
+WARMUP_TIMEOUT_SECONDS = 'warmup_timeout_seconds'
+WARMUP_TIMEOUT_SECONDS_DEFAULT = 10.0
+WARMUP_TIMEOUT_SECONDS_ENV = 'ITER8_ANALYTICS_WARMUP_TIMEOUT_SECONDS'
+
+FALLBACK_STORE_PATH = 'fallback_store_path'
+FALLBACK_STORE_PATH_DEFAULT = ''
+FALLBACK_STORE_PATH_ENV = 'ITER8_ANALYTICS_FALLBACK_STORE_PATH'
+
+FALLBACK_STORE_BATCH_SIZE = 'fallback_store_batch_size'
+FALLBACK_STORE_BATCH_SIZE_DEFAULT = 100
+FALLBACK_STORE_BATCH_SIZE_ENV = 'ITER8_ANALYTICS_FALLBACK_STORE_BATCH_SIZE'
+
+FALLBACK_STORE_FLUSH_SECONDS = 'fallback_store_flush_seconds'
+FALLBACK_STORE_FLUSH_SECONDS_DEFAULT = 5.0
+FALLBACK_STORE_FLUSH_SECONDS_ENV = 'ITER8_ANALYTICS_FALLBACK_STORE_FLUSH_SECONDS'
+
+FALLBACK_STORE_TTL_SECONDS = 'fallback_store_ttl_seconds'
+FALLBACK_STORE_TTL_SECONDS_DEFAULT = 7 * 24 * 3600.0
+FALLBACK_STORE_TTL_SECONDS_ENV = 'ITER8_ANALYTICS_FALLBACK_STORE_TTL_SECONDS'
+
+METRICS_FETCH_ALL = 'metrics_fetch_all'
+METRICS_FETCH_ALL_DEFAULT = 'false'
+METRICS_FETCH_ALL_ENV = 'ITER8_ANALYTICS_METRICS_FETCH_ALL'
@@ -0,0 +1,250 @@
+"""Fake Prometheus and Sysdig metrics backend, for load testing iter8 analytics without a cluster.
+
+Run with `python -m iter8_analytics.fakebackend`; latency, error rate and response size
+are configured with environment variables, and can be changed at runtime with PUT /behavior.
+"""
+# core python dependencies
+import asyncio
+from enum import Enum
+import hashlib
+import json
+import logging
+import math
+import random
+import re
+import threading
+import time
+from typing import Any, Dict, List
+from urllib.parse import parse_qs
+
+# external dependencies
+from fastapi import FastAPI, Body, Request, Response
+from pydantic import BaseModel, Field
+import uvicorn
+
+# iter8 dependencies
+import iter8_analytics.constants as constants
+import iter8_analytics.config as config
+
+logger = logging.getLogger('iter8_analytics')
+
+# label matchers in PromQL queries, such as service_name=~'.*v1|.*v2'
+LABEL_MATCHER = re.compile(r"(\w+)\s*=~?\s*['\"]([^'\"]*)['\"]")
+
+class LatencyDistribution(str, Enum):
+    """
+    Distributions of fake backend latencies
+    """
+    FIXED = "fixed"
+    UNIFORM = "uniform"
+    EXPONENTIAL = "exponential"
+    LOGNORMAL = "lognormal"
+
+class Behavior(BaseModel):
+    """
+    Pydantic model for the behavior of the fake backend
+    """
+    latencyDistribution: LatencyDistribution = Field(LatencyDistribution.FIXED, \
+        description = "distribution of per-request latencies")
+    latencySeconds: float = Field(0.0, ge = 0, \
+        description = "units = seconds; mean latency, or median latency if lognormal")
+    latencySpread: float = Field(0.0, ge = 0, \
+        description = "units = seconds; half-width of uniform latencies, " + \
+            "or sigma (unitless) of lognormal latencies")
+    errorRate: float = Field(0.0, ge = 0, le = 1, \
+        description = "fraction of requests which fail with the error status")
+    errorStatus: int = Field(500, ge = 400, le = 599, \
+        description = "HTTP status of failed requests")
+    responseBytes: int = Field(0, ge = 0, \
+        description = "minimum size of response bodies; responses are padded with extra series")
+
+def get_default_behavior() -> Behavior:
+    """
+    Get the behavior of the fake backend from the environment.
+    """
+    env_config = config.env_config
+    return Behavior(
+        latencyDistribution = env_config[constants.FAKE_BACKEND_LATENCY_DISTRIBUTION],
+        latencySeconds = env_config[constants.FAKE_BACKEND_LATENCY_SECONDS],
+        latencySpread = env_config[constants.FAKE_BACKEND_LATENCY_SPREAD],
+        errorRate = env_config[constants.FAKE_BACKEND_ERROR_RATE],
+        responseBytes = env_config[constants.FAKE_BACKEND_RESPONSE_BYTES])
+
+def sample_latency(behavior: Behavior, rng: random.Random) -> float:
+    """
+    Sample the latency (in seconds) of a request.
+    """
+    mean = behavior.latencySeconds
+    if behavior.latencyDistribution == LatencyDistribution.UNIFORM:
+        latency = rng.uniform(mean - behavior.latencySpread, mean + behavior.latencySpread)
+    elif behavior.latencyDistribution == LatencyDistribution.EXPONENTIAL:
+        latency = rng.expovariate(1.0 / mean) if mean > 0 else 0.0
+    elif behavior.latencyDistribution == LatencyDistribution.LOGNORMAL:
+        latency = rng.lognormvariate(math.log(mean), behavior.latencySpread) \
+            if mean > 0 else 0.0
+    else:
+        latency = mean
+    return max(latency, 0.0)
+
+def get_fake_value(*keys: Any) -> float:
+    """
+    Get a value which is the same for the same keys, so that repeated queries agree.
+    """
+    digest = hashlib.sha256(json.dumps(keys, default = str).encode("utf-8")).digest()
+    return int.from_bytes(digest[:4], "big") % 100000 / 100.0
+
+def get_series_labels(query: str) -> List[Dict[str, str]]:
+    """
+    Get the labels of the series in the result of a PromQL query;
+    there is one series for each alternative of the first regex label matcher.
+    """
+    match = LABEL_MATCHER.search(query)
+    if match is None:
+        return [{}]
+    label, pattern = match.groups()
+    return [{label: value.replace(".*", "")} for value in pattern.split("|")]
+
+def pad(body: Dict[str, Any], padding: List[Any], entry, min_bytes: int) -> Dict[str, Any]:
+    """
+    Append entries to the padding list until the body is at least min_bytes long.
+    """
+    size = len(json.dumps(body))
+    if size >= min_bytes:
+        return body
+    entry_size = len(json.dumps(entry(0))) + 2
+    for i in range(math.ceil((min_bytes - size) / entry_size)):
+        padding.append(entry(i))
+    return body
+
+def get_prometheus_body(query: str, min_bytes: int) -> Dict[str, Any]:
+    """
+    Get the body of a Prometheus instant query response.
+    """
+    now = round(time.time(), 3)
+    result = [{
+        "metric": labels,
+        "value": [now, str(get_fake_value(query, labels))]
+    } for labels in get_series_labels(query)]
+    body = {"status": "success", "data": {"resultType": "vector", "result": result}}
+    return pad(body, result, lambda i: {
+        "metric": {"__name__": "padding", "series": str(i)},
+        "value": [now, "0"]
+    }, min_bytes)
+
+def get_sysdig_body(query: Dict[str, Any], min_bytes: int) -> Dict[str, Any]:
+    """
+    Get the body of a Sysdig data query response; there is a value for each queried metric.
+    """
+    now = int(time.time())
+    metrics = query.get("metrics") or [{}]
+    data = [{
+        "t": now,
+        "d": [get_fake_value(query.get("filter"), metric.get("id")) for metric in metrics]
+    }]
+    body = {"data": data, "start": now - int(query.get("last") or 0), "end": now}
+    return pad(body, data, lambda i: {"t": now - 600 * (i + 1), "d": [0] * len(metrics)}, \
+        min_bytes)
+
+class FakeBackend:
+    """
+    Shared behavior and request counters of the fake backend.
+
+    Attributes:
+        behavior (Behavior): Latency, errors and response size of the fake backend.
+        requests (int): Number of requests received.
+        errors (int): Number of requests which failed.
+    """
+
+    def __init__(self, behavior: Behavior, seed: int = None):
+        self.behavior = behavior
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+
+    async def respond(self, get_body) -> Response:
+        """
+        Wait for a sampled latency, then fail or respond with get_body(min_bytes).
+        """
+        with self.lock:
+            behavior = self.behavior
+            self.requests += 1
+            latency = sample_latency(behavior, self.rng)
+            failed = self.rng.random() < behavior.errorRate
+            if failed:
+                self.errors += 1
+        if latency > 0:
+            await asyncio.sleep(latency)
+        if failed:
+            return Response(content = json.dumps({"status": "error", "error": "fake error"}), \
+                status_code = behavior.errorStatus, media_type = "application/json")
+        return Response(content = json.dumps(get_body(behavior.responseBytes)), \
+            media_type = "application/json")
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Get the number of requests received and failed.
+        """
+        with self.lock:
+            return {"requests": self.requests, "errors": self.errors}
+
+fake_backend = FakeBackend(get_default_behavior())
+
+# fake backend FastAPI app
+app = FastAPI()
+
+async def get_prometheus_query(request: Request) -> str:
+    """
+    Get the PromQL query from the query parameters, or the form of a POST request.
+    """
+    query = request.query_params.get("query")
+    if query is None and request.method == "POST":
+        form = parse_qs((await request.body()).decode("utf-8"))
+        query = form.get("query", [""])[0]
+    return query or ""
+
+@app.api_route("/api/v1/query", methods = ["GET", "POST"])
+@app.api_route("/promcounter", methods = ["GET", "POST"])
+async def prometheus_query(request: Request):
+    """
+    Prometheus instant query.
+    """
+    query = await get_prometheus_query(request)
+    return await fake_backend.respond(lambda min_bytes: get_prometheus_body(query, min_bytes))
+
+@app.post("/api/data")
+@app.post("/sysdig")
+async def sysdig_query(query: Dict[str, Any] = Body(...)):
+    """
+    Sysdig-style data query.
+    """
+    return await fake_backend.respond(lambda min_bytes: get_sysdig_body(query, min_bytes))
+
+@app.get("/behavior", response_model = Behavior)
+def get_behavior():
+    """
+    Get the behavior of the fake backend.
+    """
+    return fake_backend.behavior
+
+@app.put("/behavior", response_model = Behavior)
+def put_behavior(behavior: Behavior):
+    """
+    Change the behavior of the fake backend.
+    """
+    with fake_backend.lock:
+        fake_backend.behavior = behavior
+    return behavior
+
+@app.get("/stats")
+def get_stats():
+    """
+    Get the number of requests received and failed by the fake backend.
+    """
+    return fake_backend.stats()
+
+if __name__ == '__main__':
+    uvicorn.run(app,
+                host='0.0.0.0',
+                port=int(config.env_config[constants.FAKE_BACKEND_PORT]),
+                log_level=config.env_config[constants.LOG_LEVEL])
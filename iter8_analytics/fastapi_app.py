@@ -2,9 +2,10 @@
 """
 # core python dependencies
 import logging
+from typing import List, Optional
 
 # external dependencies
-from fastapi import FastAPI, Body
+from fastapi import FastAPI, Body, Depends, Header, HTTPException, Query
 import uvicorn
 
 # iter8 dependencies
@@ -14,36 +15,118 @@ import iter8_analytics.config as config
 # v2 imports
 from iter8_analytics.api.v2.types import  ExperimentResource, \
     AggregatedMetricsAnalysis, VersionAssessmentsAnalysis, \
-    WinnerAssessmentAnalysis, WeightsAnalysis, Analysis
+    WinnerAssessmentAnalysis, WeightsAnalysis, Analysis, PrefetchRegistration, AnalysisStage
 from iter8_analytics.api.v2.examples.examples_canary import er_example, er_example_step1, \
     er_example_step2, er_example_step3
 from iter8_analytics.api.v2.experiment import get_version_assessments, get_winner_assessment, \
-     get_weights, get_analytics_results
-from iter8_analytics.api.v2.metrics import get_aggregated_metrics
+     get_weights, get_analytics_results_async
+from iter8_analytics.api.v2.metrics import get_backend_stats
+from iter8_analytics.api.v2.prefetch import prefetcher, get_prefetched_aggregated_metrics
+from iter8_analytics.api.v2.sessions import session_pool
+from iter8_analytics.api.v2.deadline import set_deadline, reset_deadline
+from iter8_analytics.api.v2.planning import FetchPlan, ALL_STAGES, set_fetch_plan, \
+    reset_fetch_plan
+from iter8_analytics.api.v2.warmup import warmup
+from iter8_analytics.api.v2.fallback_store import fallback_store
 
 logger = logging.getLogger('iter8_analytics')
 
 # main FastAPI app
 app = FastAPI()
 
+def get_deadline_budget(
+    deadline: Optional[float] = Query(None, gt = 0, \
+        description = "units = seconds; time budget for computing the response"),
+    x_iter8_deadline: Optional[float] = Header(None, gt = 0, \
+        description = "units = seconds; time budget, if the deadline query parameter is absent")):
+    """
+    Get the deadline budget (in seconds) of the request from the deadline query parameter,
+    or the X-Iter8-Deadline header; the query parameter takes precedence.
+    """
+    return deadline if deadline is not None else x_iter8_deadline
+
+def get_fetch_all(
+    fetch_all: Optional[bool] = Query(None, alias = "fetchAll", \
+        description = "fetch all metrics, including those not needed for analysis")) -> bool:
+    """
+    Get whether all metrics of the experiment are fetched, from the fetchAll query parameter,
+    or else the metrics_fetch_all setting.
+    """
+    return fetch_all if fetch_all is not None else config.env_config[constants.METRICS_FETCH_ALL]
+
+def get_analytics_fetch_plan(fetch_all: bool = Depends(get_fetch_all)) -> FetchPlan:
+    """
+    Get the fetch plan of a request for all stages of analysis.
+    """
+    return FetchPlan(ALL_STAGES, fetch_all)
+
+def get_aggregated_metrics_fetch_plan(
+    stages: Optional[List[AnalysisStage]] = Query(None, \
+        description = "stages of analysis for which aggregated metrics are fetched; \
+            defaults to all stages"),
+    fetch_all: bool = Depends(get_fetch_all)) -> FetchPlan:
+    """
+    Get the fetch plan of a request for aggregated metrics, from the stages query parameters.
+    """
+    return FetchPlan(ALL_STAGES if stages is None else frozenset(stages), fetch_all)
+
+@app.on_event("startup")
+async def start_prefetcher():
+    """
+    Start the background prefetch scheduler and fallback store flusher,
+    and warm up metrics backend connections
+    """
+    prefetcher.start()
+    fallback_store.start()
+    warmup.start()
+
+@app.on_event("shutdown")
+async def close_backend_sessions():
+    """
+    Stop the background prefetch scheduler and fallback store flusher, close pooled connections
+    to metrics backends, and write pending fallback values
+    """
+    await warmup.stop()
+    await prefetcher.stop()
+    await fallback_store.stop()
+    await session_pool.aclose()
+    fallback_store.close()
+
 @app.get("/health_check")
 def provide_iter8_analytics_health():
     """Get iter8 analytics health status"""
     return {"status": "Ok"}
 
+@app.get("/ready")
+def provide_iter8_analytics_readiness():
+    """Get iter8 analytics readiness; ready once startup warm-up has finished or timed out"""
+    if not warmup.ready:
+        raise HTTPException(status_code = 503, detail = "warming up")
+    return {"status": "Ready"}
+
 @app.post("/v2/aggregated_metrics", response_model=AggregatedMetricsAnalysis, \
     response_model_exclude_unset=True)
-def provide_aggregated_metrics(
-    ere: ExperimentResource = Body(..., example=er_example)):
+async def provide_aggregated_metrics(
+    ere: ExperimentResource = Body(..., example=er_example),
+    budget: Optional[float] = Depends(get_deadline_budget),
+    plan: FetchPlan = Depends(get_aggregated_metrics_fetch_plan)):
     """
     POST iter8 2.0 experiment resource and metric resources and obtain aggregated metrics.
+    Only metrics needed by the requested stages of analysis are fetched, unless fetchAll is set.
     \f
     :body er: ExperimentResource
     """
-    return get_aggregated_metrics(ere.convert_to_float()).convert_to_quantity()
+    token = set_deadline(budget)
+    plan_token = set_fetch_plan(plan)
+    try:
+        return (await get_prefetched_aggregated_metrics(ere.convert_to_float())) \
+            .convert_to_quantity()
+    finally:
+        reset_fetch_plan(plan_token)
+        reset_deadline(token)
 
 @app.post("/v2/version_assessments", response_model=VersionAssessmentsAnalysis)
-def provide_version_assessments(
+async def provide_version_assessments(
     experiment_resource: ExperimentResource = Body(..., example=er_example_step1)):
     """
     POST iter8 2.0 experiment resource, whose status includes aggregated metrics,
@@ -54,7 +137,7 @@ def provide_version_assessments(
     return get_version_assessments(experiment_resource.convert_to_float())
 
 @app.post("/v2/winner_assessment", response_model=WinnerAssessmentAnalysis)
-def provide_winner_assessment(
+async def provide_winner_assessment(
     experiment_resource: ExperimentResource = Body(..., example=er_example_step2)):
     """
     POST iter8 2.0 experiment resource, whose status includes
@@ -65,7 +148,7 @@ def provide_winner_assessment(
     return get_winner_assessment(experiment_resource.convert_to_float())
 
 @app.post("/v2/weights", response_model=WeightsAnalysis)
-def provide_weights(
+async def provide_weights(
     experiment_resource: ExperimentResource = Body(..., example=er_example_step3)):
     """
     POST iter8 2.0 experiment resource, whose status includes
@@ -77,14 +160,53 @@ def provide_weights(
     return get_weights(experiment_resource.convert_to_float())
 
 @app.post("/v2/analytics_results", response_model=Analysis)
-def provide_analytics_results(
-    expr: ExperimentResource = Body(..., example=er_example)):
+async def provide_analytics_results(
+    expr: ExperimentResource = Body(..., example=er_example),
+    budget: Optional[float] = Depends(get_deadline_budget),
+    plan: FetchPlan = Depends(get_analytics_fetch_plan)):
     """
     POST iter8 2.0 experiment resource and metric resources and get analytics results.
+    Only metrics needed for analysis are fetched, unless fetchAll is set.
     \f
     :body expr: ExperimentResource
     """
-    return get_analytics_results(expr.convert_to_float()).convert_to_quantity()
+    token = set_deadline(budget)
+    plan_token = set_fetch_plan(plan)
+    try:
+        return (await get_analytics_results_async(expr.convert_to_float())).convert_to_quantity()
+    finally:
+        reset_fetch_plan(plan_token)
+        reset_deadline(token)
+
+@app.post("/v2/prefetch")
+async def register_prefetch(
+    registration: PrefetchRegistration = Body(..., \
+        example={"experimentResource": er_example, "interval": 20})):
+    """
+    POST iter8 2.0 experiment resource and metric resources, and the interval at which
+    analytics results are requested for it; metric values of the experiment are prefetched
+    in the background, ahead of each expected request. Returns the key of the registration.
+    \f
+    :body registration: PrefetchRegistration
+    """
+    return {"key": prefetcher.register( \
+        registration.experimentResource.convert_to_float(), registration.interval)}
+
+@app.delete("/v2/prefetch/{key}")
+async def unregister_prefetch(key: str):
+    """
+    Stop prefetching metric values of the experiment registered with this key.
+    """
+    if not prefetcher.unregister(key):
+        raise HTTPException(status_code = 404, detail = "experiment is not registered")
+    return {"key": key}
+
+@app.get("/v2/backend_stats")
+def provide_backend_stats():
+    """
+    Get statistics about queries to metrics backends, prefetching, and startup warm-up.
+    """
+    return dict(get_backend_stats(), prefetch = prefetcher.stats(), warmup = warmup.stats())
 
 def config_logger(log_level="debug"):
     """Configures the global logger
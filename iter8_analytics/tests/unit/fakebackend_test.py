@@ -0,0 +1,111 @@
+"""Tests for iter8_analytics.fakebackend"""
+# standard python stuff
+import json
+import logging
+import random
+from unittest import TestCase, mock
+
+# python libraries
+from fastapi.testclient import TestClient
+
+# iter8 dependencies
+from iter8_analytics import fastapi_app, fakebackend
+from iter8_analytics.config import env_config
+import iter8_analytics.constants as constants
+from iter8_analytics.fakebackend import Behavior, FakeBackend, LatencyDistribution, \
+    sample_latency, get_series_labels
+from iter8_analytics.api.v2.metrics import unmarshal
+from iter8_analytics.api.v2.examples.examples_metrics import request_count, \
+    request_count_batch, cpu_utilization_merge
+
+logger = logging.getLogger('iter8_analytics')
+if not logger.hasHandlers():
+    fastapi_app.config_logger(env_config[constants.LOG_LEVEL])
+
+logger.info(env_config)
+
+sysdig_body = json.loads(cpu_utilization_merge["metricObj"]["spec"]["body"].replace( \
+    "$elapsedTime", "60").replace("$name", "v1"))
+
+class FakeBackendTest(TestCase):
+    """Test the fake metrics backend"""
+
+    def setUp(self):
+        self.backend = FakeBackend(Behavior(), seed = 0)
+        self.patcher = mock.patch.object(fakebackend, 'fake_backend', self.backend)
+        self.patcher.start()
+        self.client = TestClient(fakebackend.app)
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    def test_latency_distributions(self):
+        """Sampled latencies must follow the configured distribution"""
+        rng = random.Random(0)
+        assert sample_latency(Behavior(latencySeconds = 0.1), rng) == 0.1
+        uniform = Behavior(latencyDistribution = LatencyDistribution.UNIFORM, \
+            latencySeconds = 0.1, latencySpread = 0.05)
+        assert all(0.05 <= sample_latency(uniform, rng) <= 0.15 for _ in range(100))
+        exponential = Behavior(latencyDistribution = LatencyDistribution.EXPONENTIAL, \
+            latencySeconds = 0.1)
+        mean = sum(sample_latency(exponential, rng) for _ in range(10000)) / 10000
+        assert 0.09 < mean < 0.11
+        lognormal = Behavior(latencyDistribution = LatencyDistribution.LOGNORMAL, \
+            latencySeconds = 0.1, latencySpread = 0.5)
+        latencies = sorted(sample_latency(lognormal, rng) for _ in range(10001))
+        assert 0.09 < latencies[5000] < 0.11
+
+    def test_series_labels(self):
+        """There must be a series for each alternative of the regex label matcher"""
+        assert get_series_labels("sum(up)") == [{}]
+        assert get_series_labels("sum(x{service_name=~'.*v1|.*v2'})") == \
+            [{"service_name": "v1"}, {"service_name": "v2"}]
+
+    def test_prometheus_query(self):
+        """Prometheus responses must be usable with the example metrics"""
+        query = {"query": "sum(x{service_name=~'v1|v2'})"}
+        response = self.client.get("/promcounter", params = query)
+        assert response.status_code == 200
+        jq_expression = request_count_batch["metricObj"]["spec"]["jqExpression"]
+        v1 = unmarshal(response.json(), jq_expression, {"name": "v1"})
+        v2 = unmarshal(response.json(), jq_expression, {"name": "v2"})
+        assert v1[1] is None and v2[1] is None
+        assert v1[0] != v2[0]
+
+        # repeated queries, including POST form queries, must agree
+        response = self.client.post("/api/v1/query", data = query)
+        assert unmarshal(response.json(), jq_expression, {"name": "v1"}) == v1
+        value, err = unmarshal(response.json(), \
+            request_count["metricObj"]["spec"]["jqExpression"])
+        assert err is None and value >= 0
+
+    def test_sysdig_query(self):
+        """Sysdig responses must have a value for each queried metric"""
+        body = dict(sysdig_body, metrics = sysdig_body["metrics"] * 2)
+        body["metrics"][1] = {"id": "memory.bytes.used"}
+        response = self.client.post("/sysdig", json = body)
+        assert response.status_code == 200
+        jq_expression = cpu_utilization_merge["metricObj"]["spec"]["jqExpression"]
+        assert unmarshal(response.json(), jq_expression, {"offset": 0})[1] is None
+        assert unmarshal(response.json(), jq_expression, {"offset": 1})[1] is None
+        assert len(response.json()["data"][0]["d"]) == 2
+
+    def test_errors_and_response_size(self):
+        """Requests must fail at the error rate, and responses must be padded"""
+        response = self.client.put("/behavior", json = {"errorRate": 1.0, "errorStatus": 503})
+        assert response.status_code == 200
+        response = self.client.post("/sysdig", json = sysdig_body)
+        assert response.status_code == 503
+
+        self.client.put("/behavior", json = {"responseBytes": 100000})
+        response = self.client.get("/promcounter", params = {"query": "sum(up)"})
+        assert response.status_code == 200
+        assert len(response.content) >= 100000
+        value, err = unmarshal(response.json(), \
+            request_count["metricObj"]["spec"]["jqExpression"])
+        assert err is None and value >= 0
+        response = self.client.post("/sysdig", json = sysdig_body)
+        assert len(response.content) >= 100000
+
+        assert self.client.get("/stats").json() == {"requests": 3, "errors": 1}
+        assert self.client.get("/behavior").json()["responseBytes"] == 100000
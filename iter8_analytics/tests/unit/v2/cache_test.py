@@ -0,0 +1,132 @@
+"""Tests for iter8_analytics.api.v2.cache"""
+# standard python stuff
+from datetime import datetime, timedelta, timezone
+import logging
+from unittest import TestCase, mock
+
+# python libraries
+import requests_mock
+
+# iter8 dependencies
+from iter8_analytics import fastapi_app
+from iter8_analytics.config import env_config
+import iter8_analytics.constants as constants
+from iter8_analytics.api.v2.cache import MetricValueCache, metric_value_cache
+from iter8_analytics.api.v2.metrics import get_metric_value, get_params, \
+    get_query_elapsed_time_seconds
+from iter8_analytics.api.v2.types import ExperimentResource, MetricInfo
+from iter8_analytics.api.v2.examples.examples_canary import er_example
+from iter8_analytics.api.v2.examples.examples_metrics import request_count
+
+logger = logging.getLogger('iter8_analytics')
+if not logger.hasHandlers():
+    fastapi_app.config_logger(env_config[constants.LOG_LEVEL])
+
+logger.info(env_config)
+
+class Cache(TestCase):
+    """Test metric value cache"""
+
+    def test_ttl(self):
+        """Entries must expire after their ttl"""
+        cache = MetricValueCache(maxsize = 10)
+        with mock.patch('iter8_analytics.api.v2.cache.time.monotonic', return_value = 100.0):
+            cache.put("short", 1.0, 5.0)
+            cache.put("long", 2.0, 50.0)
+            cache.put("uncached", 3.0, 0.0)
+        with mock.patch('iter8_analytics.api.v2.cache.time.monotonic', return_value = 110.0):
+            assert cache.get("short") == (None, False)
+            assert cache.get("long") == (2.0, True)
+            assert cache.get("uncached") == (None, False)
+        assert cache.stats() == {"hits": 1, "misses": 2, "evictions": 0, "size": 1}
+
+    def test_lru_eviction(self):
+        """Least recently used entries must be evicted when the cache is full"""
+        cache = MetricValueCache(maxsize = 2)
+        cache.put("a", 1.0, 60.0)
+        cache.put("b", 2.0, 60.0)
+        cache.get("a")
+        cache.put("c", 3.0, 60.0)
+        assert cache.get("a") == (1.0, True)
+        assert cache.get("b") == (None, False)
+        assert cache.get("c") == (3.0, True)
+        assert cache.stats()["evictions"] == 1
+
+class ElapsedTimeQuantization(TestCase):
+    """Test quantization of elapsedTime in metric queries"""
+
+    def test_no_quantization(self):
+        """elapsedTime must not be rounded by default"""
+        start_time = datetime.now(timezone.utc) - timedelta(seconds = 125)
+        assert get_query_elapsed_time_seconds(start_time) in [125, 126]
+
+    @mock.patch.dict('iter8_analytics.api.v2.metrics.env_config', \
+        {constants.ELAPSED_TIME_STEP_SECONDS: 60})
+    def test_quantization(self):
+        """elapsedTime must be rounded down to a multiple of the step"""
+        start_time = datetime.now(timezone.utc) - timedelta(seconds = 125)
+        assert get_query_elapsed_time_seconds(start_time) == 120
+        start_time = datetime.now(timezone.utc) - timedelta(seconds = 30)
+        assert get_query_elapsed_time_seconds(start_time) in [30, 31]
+
+        expr = ExperimentResource(** er_example)
+        metric_info = MetricInfo(** request_count)
+        start_time = datetime.now(timezone.utc) - timedelta(seconds = 185)
+        params, err = get_params(metric_info.metricObj, expr.spec.versionInfo.baseline, start_time)
+        assert err is None
+        assert "[180s]" in params["query"]
+
+class CachedMetricValues(TestCase):
+    """Test caching of metric values"""
+
+    def setUp(self):
+        metric_value_cache.clear()
+
+    def tearDown(self):
+        metric_value_cache.clear()
+
+    @mock.patch.dict('iter8_analytics.api.v2.metrics.env_config', \
+        {constants.ELAPSED_TIME_STEP_SECONDS: 60})
+    def test_cached_metric_value(self):
+        """Repeated metric queries must be served from the cache within the metric's ttl"""
+        with requests_mock.mock(real_http=True) as req_mock:
+            metric_info = MetricInfo(** request_count)
+            metric_info.metricObj.spec.cacheTTL = 30
+            req_mock.get(metric_info.metricObj.spec.urlTemplate, json = {
+                "status": "success",
+                "data": {
+                    "resultType": "vector",
+                    "result": [{"value": [1556823494.744, "21.7639"]}]
+                }
+            })
+            expr = ExperimentResource(** er_example)
+            version = expr.spec.versionInfo.baseline
+
+            for _ in range(3):
+                value, err = get_metric_value(metric_info.metricObj, version, expr.status.startTime)
+                assert err is None
+                assert value == 21.7639
+            assert req_mock.call_count == 1
+
+            # other versions are different queries
+            get_metric_value(metric_info.metricObj, expr.spec.versionInfo.candidates[0], \
+                expr.status.startTime)
+            assert req_mock.call_count == 2
+
+    def test_uncached_metric_value(self):
+        """Metric values must not be cached when the ttl is zero"""
+        with requests_mock.mock(real_http=True) as req_mock:
+            metric_info = MetricInfo(** request_count)
+            req_mock.get(metric_info.metricObj.spec.urlTemplate, json = {
+                "status": "success",
+                "data": {
+                    "resultType": "vector",
+                    "result": [{"value": [1556823494.744, "21.7639"]}]
+                }
+            })
+            expr = ExperimentResource(** er_example)
+            version = expr.spec.versionInfo.baseline
+            get_metric_value(metric_info.metricObj, version, expr.status.startTime)
+            get_metric_value(metric_info.metricObj, version, expr.status.startTime)
+            assert req_mock.call_count == 2
+            assert metric_value_cache.stats()["size"] == 0
@@ -0,0 +1,169 @@
+"""Tests for iter8_analytics.api.v2.cassette"""
+# standard python stuff
+import asyncio
+import logging
+import os
+import tempfile
+from unittest import TestCase, mock
+
+# python libraries
+import httpx
+import requests_mock
+
+# iter8 dependencies
+from iter8_analytics import fastapi_app
+from iter8_analytics.config import env_config
+import iter8_analytics.constants as constants
+from iter8_analytics.api.v2.cassette import Cassette, CassetteMode, CassetteMissError
+from iter8_analytics.api.v2.responses import BackendResponse
+from iter8_analytics.api.v2.metrics import get_metric_value, get_raw_response, \
+    get_raw_response_async
+from iter8_analytics.api.v2.types import ExperimentResource, MetricInfo, Method
+from iter8_analytics.api.v2.examples.examples_canary import er_example
+from iter8_analytics.api.v2.examples.examples_metrics import request_count
+
+logger = logging.getLogger('iter8_analytics')
+if not logger.hasHandlers():
+    fastapi_app.config_logger(env_config[constants.LOG_LEVEL])
+
+logger.info(env_config)
+
+json_response = {
+    "status": "success",
+    "data": {
+        "resultType": "vector",
+        "result": [{"value": [1556823494.744, "21.7639"]}]
+    }
+}
+
+class CassetteRecordReplay(TestCase):
+    """Test recording and replaying metrics backend responses"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "cassette.jsonl.gz")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_record_and_replay(self):
+        """Recorded responses must be replayed for the same requests"""
+        recorder = Cassette(CassetteMode.RECORD, self.path, replay_latency = False)
+        recorder.record("http://prometheus:9090/api/v1/query", Method.GET, \
+            {"query": "up"}, None, None, BackendResponse(200, b'{"status": "success"}'), 0.25)
+        recorder.record("http://prometheus:9090/api/v1/query", Method.GET, \
+            {"query": "down"}, None, None, BackendResponse(500, b'\xff'), 0.5)
+        assert recorder.stats()["recorded"] == 2
+
+        player = Cassette(CassetteMode.REPLAY, self.path, replay_latency = True)
+        response, latency = player.replay("http://prometheus:9090/api/v1/query", Method.GET, \
+            {"query": "up"}, None, None)
+        assert response.status_code == 200
+        assert response.json() == {"status": "success"}
+        assert latency == 0.25
+        response, latency = player.replay("http://prometheus:9090/api/v1/query", Method.GET, \
+            {"query": "down"}, None, None)
+        assert response.status_code == 500
+        assert response.content == b'\xff'
+        assert latency == 0.5
+
+        with self.assertRaises(CassetteMissError):
+            player.replay("http://prometheus:9090/api/v1/query", Method.GET, \
+                {"query": "sideways"}, None, None)
+        assert player.stats() == {"mode": "replay", "recorded": 0, "replayed": 2, "missed": 1}
+
+    def test_replay_without_latency(self):
+        """Recorded latencies must not be replayed unless enabled"""
+        Cassette(CassetteMode.RECORD, self.path, False).record("http://prometheus:9090", \
+            Method.GET, None, None, None, BackendResponse(200, b'{}'), 0.25)
+        _, latency = Cassette(CassetteMode.REPLAY, self.path, False).replay( \
+            "http://prometheus:9090", Method.GET, None, None, None)
+        assert latency == 0.0
+
+    def test_number_insensitive_replay(self):
+        """Requests differing only in numbers must rotate through similar recorded responses"""
+        recorder = Cassette(CassetteMode.RECORD, self.path, False)
+        for elapsed, content in [(60, b'1'), (120, b'2')]:
+            recorder.record("http://prometheus:9090", Method.GET, \
+                {"query": f"sum(increase(requests[{elapsed}s]))"}, None, None, \
+                    BackendResponse(200, content), 0.0)
+
+        player = Cassette(CassetteMode.REPLAY, self.path, False)
+        contents = [player.replay("http://prometheus:9090", Method.GET, \
+            {"query": f"sum(increase(requests[{elapsed}s]))"}, None, None)[0].content \
+                for elapsed in [180, 240, 300]]
+        assert contents == [b'1', b'2', b'1']
+        # exact matches take precedence
+        assert player.replay("http://prometheus:9090", Method.GET, \
+            {"query": "sum(increase(requests[120s]))"}, None, None)[0].content == b'2'
+
+    def test_raw_response_record_and_replay(self):
+        """get_raw_response must record responses, and replay them without the backend"""
+        request = {
+            "url": "http://prometheus:9090/api/v1/query",
+            "method": Method.GET,
+            "params": {"query": "up"},
+            "body": None,
+            "headers": {"Authorization": "Bearer secret"},
+            "auth": None,
+            "timeout": 1.0
+        }
+        with mock.patch('iter8_analytics.api.v2.metrics.cassette', \
+            Cassette(CassetteMode.RECORD, self.path, False)):
+            with requests_mock.mock(real_http=True) as req_mock:
+                req_mock.get(request["url"], json = json_response)
+                assert get_raw_response(**request).json() == json_response
+
+        with open(self.path, "rb") as cassette_file:
+            assert b"secret" not in cassette_file.read()
+
+        with mock.patch('iter8_analytics.api.v2.metrics.cassette', \
+            Cassette(CassetteMode.REPLAY, self.path, False)):
+            with requests_mock.mock() as req_mock:
+                assert get_raw_response(**request).json() == json_response
+                assert req_mock.call_count == 0
+
+                async def replay():
+                    async with httpx.AsyncClient() as client:
+                        return await get_raw_response_async(client, **request)
+
+                assert asyncio.run(replay()).json() == json_response
+
+    def test_replayed_metric_value(self):
+        """Metric values must be computed from replayed responses"""
+        metric_info = MetricInfo(** request_count)
+        expr = ExperimentResource(** er_example)
+        version = expr.spec.versionInfo.baseline
+        with mock.patch('iter8_analytics.api.v2.metrics.cassette', \
+            Cassette(CassetteMode.RECORD, self.path, False)):
+            with requests_mock.mock(real_http=True) as req_mock:
+                req_mock.get(metric_info.metricObj.spec.urlTemplate, json = json_response)
+                assert get_metric_value(metric_info.metricObj, version, \
+                    expr.status.startTime) == (21.7639, None)
+
+        with mock.patch('iter8_analytics.api.v2.metrics.cassette', \
+            Cassette(CassetteMode.REPLAY, self.path, False)):
+            with requests_mock.mock() as req_mock:
+                assert get_metric_value(metric_info.metricObj, version, \
+                    expr.status.startTime) == (21.7639, None)
+                value, err = get_metric_value(metric_info.metricObj, \
+                    expr.spec.versionInfo.candidates[0], expr.status.startTime)
+                assert value is None
+                assert isinstance(err, CassetteMissError)
+
+    def test_unreadable_cassette(self):
+        """A missing or corrupt cassette must result in a metric error, not an exception"""
+        metric_info = MetricInfo(** request_count)
+        expr = ExperimentResource(** er_example)
+        version = expr.spec.versionInfo.baseline
+        with open(os.path.join(self.tmp_dir.name, "corrupt.jsonl.gz"), "wb") as corrupt_file:
+            corrupt_file.write(b"not gzip")
+        for path in [self.path, corrupt_file.name]:
+            player = Cassette(CassetteMode.REPLAY, path, False)
+            with self.assertRaises(CassetteMissError):
+                player.replay("http://prometheus:9090", Method.GET, None, None, None)
+            with mock.patch('iter8_analytics.api.v2.metrics.cassette', player):
+                value, err = get_metric_value(metric_info.metricObj, version, \
+                    expr.status.startTime)
+                assert value is None
+                assert isinstance(err, CassetteMissError)
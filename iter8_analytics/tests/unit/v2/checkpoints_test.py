@@ -0,0 +1,126 @@
+"""Tests for iter8_analytics.api.v2.checkpoints"""
+# standard python stuff
+import copy
+import logging
+import re
+from unittest import TestCase, mock
+
+# python libraries
+import requests_mock
+
+# iter8 dependencies
+from iter8_analytics import fastapi_app
+from iter8_analytics.config import env_config
+import iter8_analytics.constants as constants
+from iter8_analytics.api.v2.checkpoints import checkpoint_store
+from iter8_analytics.api.v2.metrics import get_metric_value
+from iter8_analytics.api.v2.types import ExperimentResource, MetricInfo
+from iter8_analytics.api.v2.examples.examples_canary import er_example
+from iter8_analytics.api.v2.examples.examples_metrics import request_count, mean_latency
+
+logger = logging.getLogger('iter8_analytics')
+if not logger.hasHandlers():
+    fastapi_app.config_logger(env_config[constants.LOG_LEVEL])
+
+logger.info(env_config)
+
+def prometheus_response(value):
+    """Prometheus vector response with a single value"""
+    return {
+        "status": "success",
+        "data": {
+            "resultType": "vector",
+            "result": [{"value": [1556823494.744, str(value)]}]
+        }
+    }
+
+def incremental(metric):
+    """Incremental version of the metric"""
+    metric = copy.deepcopy(metric)
+    metric["metricObj"]["spec"]["incremental"] = True
+    return MetricInfo(** metric).metricObj
+
+class Checkpoints(TestCase):
+    """Test incremental evaluation of counter metrics"""
+
+    def setUp(self):
+        checkpoint_store.clear()
+
+    def tearDown(self):
+        checkpoint_store.clear()
+
+    def get_value(self, metric, elapsed):
+        """Get the value of the metric for the baseline, elapsed seconds into the experiment"""
+        expr = ExperimentResource(** er_example)
+        with mock.patch('iter8_analytics.api.v2.metrics.get_elapsed_time_seconds', \
+            return_value = elapsed):
+            return get_metric_value(metric, expr.spec.versionInfo.baseline, expr.status.startTime)
+
+    def test_incremental_counter(self):
+        """Only the window since the checkpoint must be queried and added to the checkpoint"""
+        metric = incremental(request_count)
+        with requests_mock.mock(real_http=True) as req_mock:
+            req_mock.get(metric.spec.urlTemplate, [{"json": prometheus_response(100)}, \
+                {"json": prometheus_response(15)}, {"json": prometheus_response(5)}])
+            assert self.get_value(metric, 600) == (100.0, None)
+            assert self.get_value(metric, 660) == (115.0, None)
+            # no time has passed since the checkpoint
+            assert self.get_value(metric, 660) == (115.0, None)
+            assert self.get_value(metric, 720) == (120.0, None)
+
+            queries = [request.qs["query"][0] for request in req_mock.request_history]
+            assert len(queries) == 3
+            assert "[600s]" in queries[0]
+            assert "[60s]" in queries[1]
+            assert "[60s]" in queries[2]
+        assert checkpoint_store.stats()["size"] == 1
+
+    @mock.patch.dict('iter8_analytics.api.v2.metrics.env_config', \
+        {constants.ELAPSED_TIME_STEP_SECONDS: 60})
+    def test_windows_not_quantized(self):
+        """Incremental windows must add up to the value of a single query over the experiment"""
+        metric = incremental(request_count)
+        # a counter increasing by elapsed seconds squared, queried at the current time
+        now = [0]
+        def counter(elapsed):
+            return elapsed * elapsed
+
+        def increase(request, context):
+            window = int(re.search(r"\[(\d+)s\]", request.qs["query"][0]).group(1))
+            return prometheus_response(counter(now[0]) - counter(now[0] - window))
+
+        with requests_mock.mock(real_http=True) as req_mock:
+            req_mock.get(metric.spec.urlTemplate, json = increase)
+            for elapsed in [600, 637, 701, 745]:
+                now[0] = elapsed
+                value, err = self.get_value(metric, elapsed)
+                assert err is None
+            assert len(req_mock.request_history) == 4
+        checkpoint_store.clear()
+        with requests_mock.mock(real_http=True) as req_mock:
+            req_mock.get(metric.spec.urlTemplate, json = increase)
+            assert self.get_value(metric, 745) == (value, None)
+            assert value == counter(745)
+
+    def test_failed_query(self):
+        """Failed queries must not change the checkpoint"""
+        metric = incremental(request_count)
+        with requests_mock.mock(real_http=True) as req_mock:
+            req_mock.get(metric.spec.urlTemplate, [{"json": prometheus_response(100)}, \
+                {"status_code": 500, "text": "bad gateway"}, {"json": prometheus_response(30)}])
+            assert self.get_value(metric, 600) == (100.0, None)
+            value, err = self.get_value(metric, 660)
+            assert value is None
+            assert err is not None
+            assert self.get_value(metric, 720) == (130.0, None)
+            assert "[120s]" in req_mock.request_history[2].qs["query"][0]
+
+    def test_gauge_not_incremental(self):
+        """Gauge metrics must always be queried over the whole experiment"""
+        metric = incremental(mean_latency)
+        with requests_mock.mock(real_http=True) as req_mock:
+            req_mock.get(metric.spec.urlTemplate, json = prometheus_response(20))
+            assert self.get_value(metric, 600) == (20.0, None)
+            assert self.get_value(metric, 660) == (20.0, None)
+            assert "[660s]" in req_mock.request_history[1].qs["query"][0]
+        assert checkpoint_store.stats()["size"] == 0
@@ -0,0 +1,145 @@
+"""Tests for iter8_analytics.api.v2.circuit_breaker"""
+# standard python stuff
+import copy
+import logging
+from unittest import TestCase, mock
+
+# python libraries
+import requests
+import requests_mock
+
+# iter8 dependencies
+from iter8_analytics import fastapi_app
+from iter8_analytics.config import env_config
+import iter8_analytics.constants as constants
+from iter8_analytics.api.v2.circuit_breaker import CircuitBreaker, CircuitOpenError, \
+    CircuitState, circuit_breakers
+from iter8_analytics.api.v2.deadline import set_deadline, reset_deadline
+from iter8_analytics.api.v2.limiter import concurrency_limiters
+from iter8_analytics.api.v2.metrics import call_backend, get_aggregated_metrics, \
+    get_backend_stats
+from iter8_analytics.api.v2.types import ExperimentResource
+from iter8_analytics.api.v2.examples.examples_canary import er_example_step1, mr_example
+
+logger = logging.getLogger('iter8_analytics')
+if not logger.hasHandlers():
+    fastapi_app.config_logger(env_config[constants.LOG_LEVEL])
+
+logger.info(env_config)
+
+class Breaker(TestCase):
+    """Test circuit breaker states"""
+
+    def test_open_after_failures(self):
+        """Circuit must open after consecutive failures and reject queries"""
+        breaker = CircuitBreaker("http://prometheus:9090", failure_threshold = 3, \
+            reset_timeout = 30.0)
+        for _ in range(2):
+            breaker.before_call()
+            breaker.on_failure()
+        breaker.before_call()
+        breaker.on_success()
+        assert breaker.state == CircuitState.CLOSED
+        for _ in range(3):
+            breaker.before_call()
+            breaker.on_response(503)
+        assert breaker.state == CircuitState.OPEN
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+        assert breaker.stats() == {"state": "open", "failures": 3, "opened": 1, "rejected": 1}
+
+    def test_half_open(self):
+        """Open circuit must allow a single trial query after the reset timeout"""
+        breaker = CircuitBreaker("http://prometheus:9090", failure_threshold = 1, \
+            reset_timeout = 10.0)
+        with mock.patch('iter8_analytics.api.v2.circuit_breaker.time.monotonic', \
+            return_value = 100.0):
+            breaker.before_call()
+            breaker.on_failure()
+        with mock.patch('iter8_analytics.api.v2.circuit_breaker.time.monotonic', \
+            return_value = 111.0):
+            breaker.before_call()
+            assert breaker.state == CircuitState.HALF_OPEN
+            with self.assertRaises(CircuitOpenError):
+                breaker.before_call()
+            # failed trial opens the circuit again
+            breaker.on_failure()
+            assert breaker.state == CircuitState.OPEN
+        with mock.patch('iter8_analytics.api.v2.circuit_breaker.time.monotonic', \
+            return_value = 122.0):
+            breaker.before_call()
+            breaker.on_response(200)
+            assert breaker.state == CircuitState.CLOSED
+            breaker.before_call()
+
+    def test_disabled(self):
+        """Circuit must never open when the failure threshold is zero"""
+        breaker = CircuitBreaker("http://prometheus:9090", failure_threshold = 0, \
+            reset_timeout = 10.0)
+        for _ in range(10):
+            breaker.before_call()
+            breaker.on_failure()
+        assert breaker.state == CircuitState.CLOSED
+
+class FastFail(TestCase):
+    """Test fast failing of queries to unavailable metrics backends"""
+
+    def setUp(self):
+        circuit_breakers.reset()
+
+    def tearDown(self):
+        circuit_breakers.reset()
+
+    @mock.patch.dict('iter8_analytics.api.v2.metrics.env_config', \
+        {constants.METRICS_FETCH_CONCURRENCY: 1, constants.METRICS_BACKEND_RETRIES: 0})
+    def test_fast_fail_fallback(self):
+        """Queries must not be made while the circuit is open; metrics must fall back"""
+        example = copy.deepcopy(er_example_step1)
+        example['status']['metrics'] = mr_example
+        expr = ExperimentResource(** example)
+        with mock.patch.object(circuit_breakers, 'failure_threshold', 2), \
+            requests_mock.mock(real_http=True) as req_mock:
+            req_mock.get("http://metrics-mock:8080/promcounter", \
+                exc = requests.exceptions.ConnectTimeout)
+            iam = get_aggregated_metrics(expr.convert_to_float())
+
+        # two metrics and two versions; the circuit opened after two failures
+        # of the objective metric, which is fetched first
+        assert req_mock.call_count == 2
+        for metric_name in ["request-count", "mean-latency"]:
+            for version_name in ["default", "canary"]:
+                assert iam.data[metric_name].data[version_name].value == \
+                    expr.status.analysis.aggregated_metrics.data[metric_name]\
+                        .data[version_name].value
+        assert "Metrics backend unavailable for metric: request-count" in iam.message
+        stats = get_backend_stats()["circuit_breakers"]["http://metrics-mock:8080"]
+        assert stats["state"] == "open"
+        assert stats["rejected"] == 2
+
+    def test_deadline_timeouts_not_failures(self):
+        """Timeouts shortened to the deadline of a request must not count as backend failures"""
+        url = "http://prometheus-deadline:9090"
+        concurrency_limiters.reset()
+        def timeout(timeout):
+            raise requests.exceptions.ReadTimeout(f"timed out after {timeout} seconds")
+
+        with mock.patch.object(circuit_breakers, 'failure_threshold', 2):
+            token = set_deadline(0.5)
+            try:
+                for _ in range(5):
+                    with self.assertRaises(requests.exceptions.ReadTimeout):
+                        call_backend(url, timeout, \
+                            env_config[constants.METRICS_BACKEND_TIMEOUT_SECONDS])
+            finally:
+                reset_deadline(token)
+            limit = concurrency_limiters.get_limiter(url).limit
+            assert limit == env_config[constants.BACKEND_CONCURRENCY_INITIAL]
+            assert circuit_breakers.get_breaker(url).state == CircuitState.CLOSED
+
+            # timeouts at the full backend timeout are failures
+            for _ in range(2):
+                with self.assertRaises(requests.exceptions.ReadTimeout):
+                    call_backend(url, timeout, \
+                        env_config[constants.METRICS_BACKEND_TIMEOUT_SECONDS])
+            assert circuit_breakers.get_breaker(url).state == CircuitState.OPEN
+            assert concurrency_limiters.get_limiter(url).limit < limit
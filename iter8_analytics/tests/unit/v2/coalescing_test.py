@@ -0,0 +1,399 @@
+"""Tests for iter8_analytics.api.v2.coalescing"""
+# standard python stuff
+import asyncio
+import copy
+from concurrent.futures import ThreadPoolExecutor
+import gc
+import logging
+import threading
+import time
+from unittest import TestCase, mock
+import warnings
+
+# python libraries
+import httpx
+import requests
+import requests_mock
+
+# iter8 dependencies
+from iter8_analytics import fastapi_app
+from iter8_analytics.config import env_config
+import iter8_analytics.constants as constants
+from iter8_analytics.api.v2.coalescing import SingleFlight, single_flight
+from iter8_analytics.api.v2.circuit_breaker import CircuitState, circuit_breakers
+from iter8_analytics.api.v2.deadline import DeadlineExceededError, set_deadline, reset_deadline
+from iter8_analytics.api.v2.limiter import concurrency_limiters
+from iter8_analytics.api.v2.retry import retrier
+from iter8_analytics.api.v2.metrics import get_metric_value, get_metric_value_async, \
+    get_aggregated_metrics_async, get_response_async
+from iter8_analytics.api.v2.types import ExperimentResource, MetricInfo
+from iter8_analytics.api.v2.examples.examples_canary import er_example, er_example_step1, \
+    mr_example
+from iter8_analytics.api.v2.examples.examples_metrics import request_count
+
+logger = logging.getLogger('iter8_analytics')
+if not logger.hasHandlers():
+    fastapi_app.config_logger(env_config[constants.LOG_LEVEL])
+
+logger.info(env_config)
+
+class Coalescing(TestCase):
+    """Test single-flight coalescing"""
+
+    def test_concurrent_calls_coalesced(self):
+        """Concurrent calls with the same key must share a single execution"""
+        flight = SingleFlight()
+        executions = []
+        start = threading.Event()
+
+        def slow_call():
+            executions.append(1)
+            time.sleep(0.2)
+            return {"value": 42}
+
+        def call(key):
+            start.wait()
+            return flight.do(key, slow_call)
+
+        with ThreadPoolExecutor(max_workers = 5) as executor:
+            futures = [executor.submit(call, "same") for _ in range(4)] + \
+                [executor.submit(call, "other")]
+            start.set()
+            results = [future.result() for future in futures]
+
+        assert len(executions) == 2
+        assert all(result == {"value": 42} for result in results)
+        assert flight.stats() == {"calls": 5, "executed": 2, "coalesced": 3}
+
+    def test_exception_shared(self):
+        """Callers coalesced with a failing call must get its exception"""
+        flight = SingleFlight()
+        start = threading.Event()
+
+        def failing_call():
+            time.sleep(0.2)
+            raise ValueError("backend is down")
+
+        def call():
+            start.wait()
+            try:
+                flight.do("same", failing_call)
+            except ValueError as exc:
+                return exc
+            return None
+
+        with ThreadPoolExecutor(max_workers = 3) as executor:
+            futures = [executor.submit(call) for _ in range(3)]
+            start.set()
+            errors = [future.result() for future in futures]
+
+        assert all(isinstance(err, ValueError) for err in errors)
+        assert flight.stats()["executed"] == 1
+        assert len(flight.in_flight) == 0
+
+    def test_sequential_calls_not_coalesced(self):
+        """Calls which are not in flight at the same time must each execute"""
+        flight = SingleFlight()
+        assert flight.do("same", lambda: 1) == 1
+        assert flight.do("same", lambda: 2) == 2
+        assert flight.stats() == {"calls": 2, "executed": 2, "coalesced": 0}
+
+    def test_unshared_exception(self):
+        """Callers coalesced with a call failing with an unshared exception must call again"""
+        flight = SingleFlight()
+        leader_started = threading.Event()
+        executions = []
+
+        def leader_call():
+            executions.append("leader")
+            leader_started.set()
+            time.sleep(0.2)
+            raise TimeoutError("deadline of the leader")
+
+        def follower_call():
+            executions.append("follower")
+            return 42
+
+        def call(func):
+            try:
+                return flight.do("same", func, unshared = (TimeoutError,))
+            except TimeoutError as exc:
+                return exc
+
+        with ThreadPoolExecutor(max_workers = 3) as executor:
+            leader = executor.submit(call, leader_call)
+            leader_started.wait()
+            followers = [executor.submit(call, follower_call) for _ in range(2)]
+            assert isinstance(leader.result(), TimeoutError)
+            assert [future.result() for future in followers] == [42, 42]
+        # the followers make a single call again
+        assert executions[0] == "leader"
+        assert len(executions) in [2, 3]
+        assert len(flight.in_flight) == 0
+
+    def test_unshared_exception_async(self):
+        """Asynchronous callers must call again instead of sharing an unshared exception"""
+        flight = SingleFlight()
+        executions = []
+
+        async def leader_call():
+            executions.append("leader")
+            await asyncio.sleep(0.1)
+            raise TimeoutError("deadline of the leader")
+
+        async def follower_call():
+            executions.append("follower")
+            await asyncio.sleep(0.1)
+            return 42
+
+        async def calls():
+            leader = asyncio.ensure_future(flight.do_async("same", leader_call, \
+                unshared = (TimeoutError,)))
+            await asyncio.sleep(0)
+            followers = [flight.do_async("same", follower_call, unshared = (TimeoutError,)) \
+                for _ in range(2)]
+            results = await asyncio.gather(*followers)
+            with self.assertRaises(TimeoutError):
+                await leader
+            return results
+
+        assert asyncio.run(calls()) == [42, 42]
+        assert executions == ["leader", "follower"]
+        assert len(flight.async_in_flight) == 0
+
+    def test_async_calls_coalesced(self):
+        """Concurrent asynchronous calls with the same key must share a single execution"""
+        flight = SingleFlight()
+        executions = []
+
+        async def slow_call():
+            executions.append(1)
+            await asyncio.sleep(0.1)
+            return 42
+
+        async def calls():
+            return await asyncio.gather(*[flight.do_async("same", slow_call) for _ in range(3)])
+
+        assert asyncio.run(calls()) == [42, 42, 42]
+        assert len(executions) == 1
+        assert flight.stats()["coalesced"] == 2
+        assert len(flight.async_in_flight) == 0
+
+    def test_cancelled_caller(self):
+        """A cancelled caller must not cancel a call which other callers are waiting for"""
+        flight = SingleFlight()
+        executions = []
+
+        async def slow_call():
+            executions.append(1)
+            await asyncio.sleep(0.2)
+            return 42
+
+        async def calls():
+            impatient = asyncio.ensure_future(flight.do_async("same", slow_call))
+            patient = asyncio.ensure_future(flight.do_async("same", slow_call))
+            await asyncio.sleep(0.05)
+            impatient.cancel()
+            result = await patient
+            assert impatient.cancelled()
+            return result
+
+        assert asyncio.run(calls()) == 42
+        assert len(executions) == 1
+        assert len(flight.async_in_flight) == 0
+
+    def test_abandoned_call_cancelled(self):
+        """A call must be cancelled once no caller is waiting for it"""
+        flight = SingleFlight()
+        cancelled = []
+
+        async def slow_call():
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                cancelled.append(1)
+                raise
+
+        async def calls():
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(flight.do_async("same", slow_call), timeout = 0.05)
+            await asyncio.sleep(0)
+            return len(flight.async_in_flight)
+
+        assert asyncio.run(calls()) == 0
+        assert cancelled == [1]
+
+    def test_concurrent_deadlines(self):
+        """The deadline of one request must not fail a query coalesced with another request"""
+        json_response = {
+            "status": "success",
+            "data": {
+                "resultType": "vector",
+                "result": [{"value": [1556823494.744, "21.7639"]}]
+            }
+        }
+
+        async def handler(request: httpx.Request):
+            await asyncio.sleep(0.3)
+            return httpx.Response(200, json = json_response)
+
+        circuit_breakers.reset()
+        example = copy.deepcopy(er_example_step1)
+        example['status']['metrics'] = mr_example
+        expr = ExperimentResource(** example).convert_to_float()
+
+        async def get_iam(client, budget):
+            token = set_deadline(budget)
+            try:
+                return await get_aggregated_metrics_async(expr, client)
+            finally:
+                reset_deadline(token)
+
+        async def evaluations():
+            async with httpx.AsyncClient(transport = httpx.MockTransport(handler)) as client:
+                # the request with the short deadline starts the queries
+                return await asyncio.gather(get_iam(client, 0.1), get_iam(client, None))
+
+        short, unbounded = asyncio.run(evaluations())
+        assert "Skipped metric: mean-latency" in short.message
+        for metric in ["request-count", "mean-latency"]:
+            for version_name in ["default", "canary"]:
+                assert unbounded.data[metric].data[version_name].value == 21.7639
+        assert "metric" not in unbounded.message
+        assert len(single_flight.async_in_flight) == 0
+
+    def test_expired_deadline_async(self):
+        """No coalesced call must be started once the deadline has passed"""
+        async def get_response():
+            token = set_deadline(0.01)
+            try:
+                await asyncio.sleep(0.02)
+                await get_response_async({"url": "http://prometheus:9090/api/v1/query"}, \
+                    timeout = 5.0)
+            finally:
+                reset_deadline(token)
+
+        calls = single_flight.stats()["calls"]
+        with warnings.catch_warnings(record = True) as caught:
+            warnings.simplefilter("always")
+            with self.assertRaises(DeadlineExceededError):
+                asyncio.run(get_response())
+            gc.collect()
+        assert not any("never awaited" in str(warning.message) for warning in caught)
+        assert single_flight.stats()["calls"] == calls
+
+    def test_deadline_in_shared_async_query(self):
+        """The shared query must be bound by the deadline of the caller which started it"""
+        url = "http://prometheus-shared:9090/api/v1/query"
+        metric_info = MetricInfo(** request_count)
+        metric_info.metricObj.spec.urlTemplate = url
+        metric_info.metricObj.spec.retries = 3
+        expr = ExperimentResource(** er_example)
+        timeouts = []
+
+        def handler(request: httpx.Request):
+            if timeouts:
+                raise httpx.ReadTimeout("timed out", request = request)
+            return httpx.Response(503)
+
+        async def get_value():
+            token = set_deadline(0.3)
+            try:
+                async with httpx.AsyncClient(transport = httpx.MockTransport(handler)) \
+                    as client:
+                    return await get_metric_value_async(metric_info.metricObj, \
+                        expr.spec.versionInfo.baseline, expr.status.startTime, client)
+            finally:
+                reset_deadline(token)
+
+        circuit_breakers.reset()
+        concurrency_limiters.reset()
+        # retries must fit in the deadline
+        stats = retrier.stats()
+        value, err = asyncio.run(get_value())
+        assert value is None and err is not None
+        assert retrier.stats()["deadline_skipped"] == stats["deadline_skipped"] + 1
+        assert retrier.stats()["retries"] == stats["retries"]
+
+        # timeouts shortened to the deadline must not count as failures of the backend
+        timeouts.append(1)
+        with mock.patch.object(circuit_breakers, 'failure_threshold', 2):
+            for _ in range(3):
+                value, err = asyncio.run(get_value())
+                assert value is None and err is not None
+            assert circuit_breakers.get_breaker(url).state == CircuitState.CLOSED
+        circuit_breakers.reset()
+
+    def test_deadline_not_shared(self):
+        """A query failed by the deadline of one request must be made again for other requests"""
+        json_response = {
+            "status": "success",
+            "data": {
+                "resultType": "vector",
+                "result": [{"value": [1556823494.744, "21.7639"]}]
+            }
+        }
+        started = threading.Event()
+        responses = []
+
+        def response(request, context):
+            if not responses:
+                # the query of the request with the short deadline times out
+                responses.append(1)
+                started.set()
+                time.sleep(0.15)
+                raise requests.exceptions.ReadTimeout("timed out")
+            return json_response
+
+        metric_info = MetricInfo(** request_count)
+        expr = ExperimentResource(** er_example)
+        version = expr.spec.versionInfo.baseline
+
+        def get_value(budget):
+            token = set_deadline(budget)
+            try:
+                return get_metric_value(metric_info.metricObj, version, expr.status.startTime)
+            finally:
+                reset_deadline(token)
+
+        circuit_breakers.reset()
+        with requests_mock.mock(real_http=True) as req_mock:
+            req_mock.get(metric_info.metricObj.spec.urlTemplate, json = response)
+            with ThreadPoolExecutor(max_workers = 2) as executor:
+                short = executor.submit(get_value, 0.1)
+                started.wait()
+                unbounded = executor.submit(get_value, None)
+                value, err = short.result()
+                assert value is None and isinstance(err, DeadlineExceededError)
+                assert unbounded.result() == (21.7639, None)
+            assert req_mock.call_count == 2
+
+    def test_identical_metric_queries_coalesced(self):
+        """Identical concurrent metric queries must result in a single backend call"""
+        json_response = {
+            "status": "success",
+            "data": {
+                "resultType": "vector",
+                "result": [{"value": [1556823494.744, "21.7639"]}]
+            }
+        }
+
+        def slow_response(request, context):
+            time.sleep(0.2)
+            return json_response
+
+        with requests_mock.mock(real_http=True) as req_mock:
+            metric_info = MetricInfo(** request_count)
+            req_mock.get(metric_info.metricObj.spec.urlTemplate, json = slow_response)
+            expr = ExperimentResource(** er_example)
+            version = expr.spec.versionInfo.baseline
+            coalesced = single_flight.stats()["coalesced"]
+
+            with ThreadPoolExecutor(max_workers = 3) as executor:
+                futures = [executor.submit(get_metric_value, metric_info.metricObj, \
+                    version, expr.status.startTime) for _ in range(3)]
+                results = [future.result() for future in futures]
+
+            assert all(result == (21.7639, None) for result in results)
+            assert req_mock.call_count < 3
+            assert single_flight.stats()["coalesced"] - coalesced == 3 - req_mock.call_count
@@ -0,0 +1,165 @@
+"""Tests for iter8_analytics.api.v2.deadline"""
+# standard python stuff
+import asyncio
+import copy
+import logging
+import time
+from unittest import TestCase, mock
+
+# python libraries
+import httpx
+import requests_mock
+from fastapi.testclient import TestClient
+
+# iter8 dependencies
+from iter8_analytics import fastapi_app
+from iter8_analytics.config import env_config
+import iter8_analytics.constants as constants
+from iter8_analytics.api.v2.deadline import DeadlineExceededError, get_timeout, \
+    set_deadline, reset_deadline, deadline_exceeded, current_deadline
+from iter8_analytics.api.v2.circuit_breaker import circuit_breakers
+from iter8_analytics.api.v2.limiter import concurrency_limiters
+from iter8_analytics.api.v2.metrics import get_aggregated_metrics, get_aggregated_metrics_async
+from iter8_analytics.api.v2.types import ExperimentResource
+from iter8_analytics.api.v2.examples.examples_canary import er_example_step1, mr_example
+
+logger = logging.getLogger('iter8_analytics')
+if not logger.hasHandlers():
+    fastapi_app.config_logger(env_config[constants.LOG_LEVEL])
+
+logger.info(env_config)
+
+json_response = {
+    "status": "success",
+    "data": {
+        "resultType": "vector",
+        "result": [{"value": [1556823494.744, "21.7639"]}]
+    }
+}
+
+class Deadline(TestCase):
+    """Test request deadlines"""
+
+    def setUp(self):
+        circuit_breakers.reset()
+        concurrency_limiters.reset()
+
+    def test_no_deadline(self):
+        """Without a deadline, the default timeout must be used"""
+        assert get_timeout(5.0) == 5.0
+        assert not deadline_exceeded()
+
+    def test_timeout_from_budget(self):
+        """Timeout must not exceed the time left until the deadline"""
+        token = set_deadline(1.0)
+        try:
+            assert 0.5 < get_timeout(5.0) <= 1.0
+            assert get_timeout(0.1) == 0.1
+        finally:
+            reset_deadline(token)
+        assert get_timeout(5.0) == 5.0
+
+    def test_expired_deadline(self):
+        """No timeout must be given once the deadline has passed"""
+        token = set_deadline(0.01)
+        try:
+            time.sleep(0.02)
+            assert deadline_exceeded()
+            with self.assertRaises(DeadlineExceededError):
+                get_timeout(5.0)
+        finally:
+            reset_deadline(token)
+
+    @mock.patch.dict('iter8_analytics.api.v2.metrics.env_config', \
+        {constants.METRICS_FETCH_CONCURRENCY: 2})
+    def test_deadline_in_fetch_threads(self):
+        """Queries not finished by the deadline must be skipped and fall back to previous values"""
+        def slow_response(request, context):
+            time.sleep(0.3)
+            return json_response
+
+        example = copy.deepcopy(er_example_step1)
+        example['status']['metrics'] = mr_example
+        expr = ExperimentResource(** example)
+        with requests_mock.mock(real_http=True) as req_mock:
+            req_mock.get("http://metrics-mock:8080/promcounter", json = slow_response)
+            token = set_deadline(0.2)
+            start = time.monotonic()
+            try:
+                iam = get_aggregated_metrics(expr.convert_to_float())
+            finally:
+                reset_deadline(token)
+            assert time.monotonic() - start < 0.3
+
+        # two metrics and two versions; the (coalesced) queries of the objective metric
+        # were in flight at the deadline, and those of request-count were never started
+        assert req_mock.call_count == 1
+        for metric_name in ["request-count", "mean-latency"]:
+            for version_name in ["default", "canary"]:
+                assert iam.data[metric_name].data[version_name].value == \
+                    expr.status.analysis.aggregated_metrics.data[metric_name]\
+                        .data[version_name].value
+        assert "Skipped metric: mean-latency" in iam.message
+        assert "Skipped metric: request-count" in iam.message
+
+    def test_deadline_async(self):
+        """Asynchronous queries must not be made once the deadline has passed"""
+        calls = []
+        def handler(request: httpx.Request):
+            calls.append(request)
+            return httpx.Response(200, json = json_response)
+
+        example = copy.deepcopy(er_example_step1)
+        example['status']['metrics'] = mr_example
+        expr = ExperimentResource(** example)
+
+        async def get_iam():
+            token = set_deadline(0.01)
+            try:
+                await asyncio.sleep(0.02)
+                async with httpx.AsyncClient(transport = httpx.MockTransport(handler)) as client:
+                    return await get_aggregated_metrics_async(expr.convert_to_float(), client)
+            finally:
+                reset_deadline(token)
+
+        iam = asyncio.run(get_iam())
+        assert len(calls) == 0
+        for metric_name in ["request-count", "mean-latency"]:
+            for version_name in ["default", "canary"]:
+                assert iam.data[metric_name].data[version_name].value == \
+                    expr.status.analysis.aggregated_metrics.data[metric_name]\
+                        .data[version_name].value
+        assert iam.message.startswith("Error: Skipped metric: request-count")
+
+    def test_deadline_endpoint(self):
+        """Deadline must be accepted as a query parameter or header on /v2 endpoints"""
+        deadlines = []
+        def timeout(default):
+            deadlines.append(current_deadline.get())
+            raise DeadlineExceededError("deadline exceeded")
+
+        client = TestClient(fastapi_app.app)
+        example = copy.deepcopy(er_example_step1)
+        example['status']['metrics'] = mr_example
+        with mock.patch('iter8_analytics.api.v2.metrics.get_timeout', side_effect = timeout):
+            resp = client.post("/v2/aggregated_metrics?deadline=0.5", json = example)
+            assert resp.status_code == 200
+            assert "Deadline exceeded" in resp.json()["message"]
+            resp = client.post("/v2/aggregated_metrics", json = example, \
+                headers = {"X-Iter8-Deadline": "0.5"})
+            assert resp.status_code == 200
+        # only the objective metric is fetched, for two versions
+        assert len(deadlines) == 4
+        assert all(deadline is not None for deadline in deadlines)
+        resp = client.post("/v2/aggregated_metrics?deadline=-1", json = example)
+        assert resp.status_code == 422
+
+    def test_no_deadline_without_fetching(self):
+        """Endpoints which do not fetch metrics must not accept a deadline"""
+        client = TestClient(fastapi_app.app)
+        openapi = client.get("/openapi.json").json()
+        for path in ["/v2/aggregated_metrics", "/v2/analytics_results"]:
+            names = [param["name"] for param in openapi["paths"][path]["post"]["parameters"]]
+            assert "deadline" in names and "x-iter8-deadline" in names
+        for path in ["/v2/version_assessments", "/v2/winner_assessment", "/v2/weights"]:
+            assert "parameters" not in openapi["paths"][path]["post"]
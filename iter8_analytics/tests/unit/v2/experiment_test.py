@@ -1,5 +1,6 @@
 """Tests for module iter8_analytics.api.v2"""
 # standard python stuff
+import asyncio
 import copy
 from datetime import datetime, timezone, timedelta
 import json
@@ -29,7 +30,7 @@ from iter8_analytics.api.v2.examples.examples_abn import \
 
 from iter8_analytics.api.v2.metrics import get_aggregated_metrics
 from iter8_analytics.api.v2.experiment import get_version_assessments, get_winner_assessment, \
-    get_weights, get_analytics_results
+    get_weights, get_analytics_results, get_analytics_results_async
 
 
 logger = logging.getLogger('iter8_analytics')
@@ -96,6 +97,17 @@ def test_analytics_assessment_endpoint():
         expr = ExperimentResource(** er_example)
         get_analytics_results(expr.convert_to_float()).convert_to_quantity()
 
+def test_analytics_assessment_async():
+    ercopy = copy.deepcopy(er_example)
+    ercopy["status"]["metrics"] = mocked_mr_example
+    expr = ExperimentResource(** ercopy)
+
+    analysis = asyncio.run(get_analytics_results_async(expr.convert_to_float()))
+    assert analysis.aggregated_metrics.data['request-count'].data['default'].value > 100.0
+    assert analysis.version_assessments is not None
+    assert analysis.winner_assessment is not None
+    assert analysis.weights is not None
+
 def test_mock_metrics():
     ercopy = copy.deepcopy(er_example)
     ercopy["status"]["metrics"] = mocked_mr_example
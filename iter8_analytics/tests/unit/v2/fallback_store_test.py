@@ -0,0 +1,187 @@
+"""Tests for iter8_analytics.api.v2.fallback_store"""
+# standard python stuff
+import asyncio
+import copy
+import logging
+import os
+import tempfile
+import threading
+import time
+from unittest import TestCase, mock
+
+# python libraries
+import httpx
+import requests
+import requests_mock
+
+# iter8 dependencies
+from iter8_analytics import fastapi_app
+from iter8_analytics.config import env_config
+import iter8_analytics.constants as constants
+from iter8_analytics.api.v2.fallback_store import FallbackStore, get_fallback_key
+from iter8_analytics.api.v2.circuit_breaker import circuit_breakers
+from iter8_analytics.api.v2.metrics import get_aggregated_metrics, get_aggregated_metrics_async
+from iter8_analytics.api.v2.types import ExperimentResource
+from iter8_analytics.api.v2.examples.examples_canary import er_example
+
+logger = logging.getLogger('iter8_analytics')
+if not logger.hasHandlers():
+    fastapi_app.config_logger(env_config[constants.LOG_LEVEL])
+
+logger.info(env_config)
+
+json_response = {
+    "status": "success",
+    "data": {
+        "resultType": "vector",
+        "result": [{"value": [1556823494.744, "21.7639"]}]
+    }
+}
+
+class Fallbacks(TestCase):
+    """Test the persistent store of last known good metric values"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "fallbacks.db")
+        circuit_breakers.reset()
+
+    def tearDown(self):
+        circuit_breakers.reset()
+        self.tmp_dir.cleanup()
+
+    def test_fallback_key(self):
+        """Fallback keys must identify experiments by start time and versions"""
+        expr = ExperimentResource(** er_example)
+        other = copy.deepcopy(er_example)
+        other["status"]["metrics"] = []
+        assert get_fallback_key(expr) == get_fallback_key(ExperimentResource(** other))
+        other["status"]["startTime"] = "2020-04-04T12:55:50.568Z"
+        assert get_fallback_key(expr) != get_fallback_key(ExperimentResource(** other))
+        # experiments starting together, with the same version names
+        other = copy.deepcopy(er_example)
+        other["spec"]["versionInfo"]["candidates"][0]["variables"] = \
+            [{"name": "revision", "value": "other-revision"}]
+        assert get_fallback_key(expr) != get_fallback_key(ExperimentResource(** other))
+
+    def test_batched_writes(self):
+        """Values must be written in batches, and survive reopening the store"""
+        store = FallbackStore(self.path, batch_size = 3, flush_interval = 3600.0, ttl = 3600.0)
+        store.put("e", "m", "v1", 1.0)
+        store.put("e", "m", "v2", 2.0)
+        assert store.get("e", "m", "v1") == 1.0
+        assert store.stats()["flushes"] == 0
+        store.put("e", "m", "v3", 4.0)
+        assert store.stats()["flushes"] == 1
+        store.put("e", "m", "v1", 3.0)
+        assert store.stats()["pending"] == 1
+        store.close()
+
+        store = FallbackStore(self.path, batch_size = 3, flush_interval = 3600.0, ttl = 3600.0)
+        assert store.get("e", "m", "v1") == 3.0
+        assert store.get("e", "m", "v3") == 4.0
+        assert store.get("e", "other", "v1") is None
+        assert store.stats() == {"enabled": True, "hits": 2, "misses": 1, "flushes": 0, \
+            "pending": 0, "size": 3}
+        store.close()
+
+    def test_flush_interval(self):
+        """Pending values must be written once the flush interval has passed"""
+        store = FallbackStore(self.path, batch_size = 100, flush_interval = 0.1, ttl = 3600.0)
+        store.put("e", "m", "v1", 1.0)
+        time.sleep(0.2)
+        store.put("e", "m", "v2", 2.0)
+        assert store.stats()["flushes"] == 1
+        assert store.stats()["pending"] == 0
+        store.close()
+
+    def test_flusher(self):
+        """Pending values must be written every flush interval, without new values"""
+        store = FallbackStore(self.path, batch_size = 100, flush_interval = 0.1, ttl = 3600.0)
+
+        async def run():
+            store.start()
+            store.put("e", "m", "v1", 1.0)
+            await asyncio.sleep(0.25)
+            await store.stop()
+
+        asyncio.run(run())
+        assert store.stats()["flushes"] == 1
+        assert store.stats()["pending"] == 0
+        store.close()
+        assert FallbackStore("", batch_size = 1, flush_interval = 1.0, ttl = 1.0).task is None
+
+    def test_expiry(self):
+        """Values not updated within the ttl must be deleted when the store is opened"""
+        store = FallbackStore(self.path, batch_size = 1, flush_interval = 3600.0, ttl = 3600.0)
+        with mock.patch('iter8_analytics.api.v2.fallback_store.time.time', \
+            return_value = time.time() - 7200):
+            store.put("e", "m", "old", 1.0)
+        store.put("e", "m", "new", 2.0)
+        store.close()
+        store = FallbackStore(self.path, batch_size = 1, flush_interval = 3600.0, ttl = 3600.0)
+        assert store.get("e", "m", "old") is None
+        assert store.get("e", "m", "new") == 2.0
+        store.close()
+
+    def test_disabled_store(self):
+        """A store without a path must not keep values"""
+        store = FallbackStore("", batch_size = 1, flush_interval = 1.0, ttl = 1.0)
+        store.put("e", "m", "v", 1.0)
+        assert store.get("e", "m", "v") is None
+        assert not store.stats()["enabled"]
+
+    @mock.patch.dict('iter8_analytics.api.v2.metrics.env_config', \
+        {constants.METRICS_BACKEND_RETRIES: 0})
+    def test_fallback_after_restart(self):
+        """Failed metrics must fall back to the stored values of a previous service instance"""
+        expr = ExperimentResource(** er_example)
+        store = FallbackStore(self.path, batch_size = 100, flush_interval = 3600.0, ttl = 3600.0)
+        with mock.patch('iter8_analytics.api.v2.metrics.fallback_store', store), \
+            requests_mock.mock(real_http=True) as req_mock:
+            req_mock.get("http://metrics-mock:8080/promcounter", json = json_response)
+            iam = get_aggregated_metrics(expr)
+            assert iam.data["request-count"].data["canary"].value == 21.7639
+        store.close()
+
+        # a new instance of the service, without previous analysis from the caller
+        assert expr.status.analysis is None
+        store = FallbackStore(self.path, batch_size = 100, flush_interval = 3600.0, ttl = 3600.0)
+        with mock.patch('iter8_analytics.api.v2.metrics.fallback_store', store), \
+            requests_mock.mock(real_http=True) as req_mock:
+            req_mock.get("http://metrics-mock:8080/promcounter", \
+                exc = requests.exceptions.ConnectionError)
+            iam = get_aggregated_metrics(expr)
+        for metric_name in ["request-count", "mean-latency"]:
+            for version_name in ["default", "canary"]:
+                assert iam.data[metric_name].data[version_name].value == 21.7639
+        assert "Error from metrics backend" in iam.message
+        assert store.stats()["hits"] == 4
+        store.close()
+
+    def test_fallback_off_event_loop(self):
+        """The fallback store must be read and written off the event loop"""
+        expr = ExperimentResource(** er_example)
+        store = FallbackStore(self.path, batch_size = 1, flush_interval = 3600.0, ttl = 3600.0)
+        threads = []
+        put = store.put
+        def record_put(*args):
+            threads.append(threading.current_thread())
+            put(*args)
+
+        def handler(request: httpx.Request):
+            return httpx.Response(200, json = json_response)
+
+        async def get_iam():
+            async with httpx.AsyncClient(transport = httpx.MockTransport(handler)) as client:
+                return await get_aggregated_metrics_async(expr, client), \
+                    threading.current_thread()
+
+        with mock.patch('iter8_analytics.api.v2.metrics.fallback_store', store), \
+            mock.patch.object(store, 'put', side_effect = record_put):
+            iam, loop_thread = asyncio.run(get_iam())
+        assert iam.data["request-count"].data["canary"].value == 21.7639
+        assert len(threads) == 4
+        assert all(thread is not loop_thread for thread in threads)
+        assert store.stats()["flushes"] == 4
+        store.close()
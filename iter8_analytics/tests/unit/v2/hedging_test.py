@@ -0,0 +1,108 @@
+"""Tests for iter8_analytics.api.v2.hedging"""
+# standard python stuff
+import asyncio
+import logging
+import time
+from unittest import TestCase
+
+# iter8 dependencies
+from iter8_analytics import fastapi_app
+from iter8_analytics.config import env_config
+import iter8_analytics.constants as constants
+from iter8_analytics.api.v2.hedging import Hedger, parse_alternates
+
+logger = logging.getLogger('iter8_analytics')
+if not logger.hasHandlers():
+    fastapi_app.config_logger(env_config[constants.LOG_LEVEL])
+
+logger.info(env_config)
+
+PRIMARY = "http://prometheus-0:9090/api/v1/query"
+ALTERNATE = "http://prometheus-1:9090/api/v1/query"
+
+class Response:
+    """Stand-in for an HTTP response"""
+    def __init__(self, url, status_code = 200):
+        self.url = url
+        self.status_code = status_code
+
+def get_hedger(max_extra_load = 1.0):
+    """Hedger at the median latency, with prometheus-1 as the alternate of prometheus-0"""
+    hedger = Hedger(percentile = 50.0, min_samples = 3, max_extra_load = max_extra_load, \
+        alternates = parse_alternates("http://prometheus-0:9090=http://prometheus-1:9090"))
+    for _ in range(3):
+        hedger.observe(PRIMARY, 0.05)
+    return hedger
+
+def slow_primary(url):
+    """Primary is slow, alternate is fast"""
+    time.sleep(0.5 if url == PRIMARY else 0.01)
+    return Response(url)
+
+class Hedging(TestCase):
+    """Test hedged queries"""
+
+    def test_hedge_delay(self):
+        """Queries must be hedged at the percentile of recent latencies, once enough are known"""
+        hedger = Hedger(percentile = 90.0, min_samples = 5, max_extra_load = 0.1, alternates = {})
+        for latency in [0.1, 0.2, 0.3, 0.4]:
+            hedger.observe(PRIMARY, latency)
+        assert hedger.get_hedge_delay(PRIMARY) is None
+        hedger.observe(PRIMARY, 1.0)
+        assert abs(hedger.get_hedge_delay(PRIMARY) - 0.76) < 1e-6
+        assert hedger.get_hedge_delay(ALTERNATE) is None
+
+        disabled = Hedger(percentile = 0.0, min_samples = 0, max_extra_load = 0.1, alternates = {})
+        disabled.observe(PRIMARY, 0.1)
+        assert disabled.get_hedge_delay(PRIMARY) is None
+
+    def test_hedge_url(self):
+        """Hedged queries must go to the alternate replica, if any"""
+        hedger = get_hedger()
+        assert hedger.get_hedge_url(PRIMARY + "?query=up") == ALTERNATE + "?query=up"
+        other = "http://sysdig:8080/api/data"
+        assert hedger.get_hedge_url(other) == other
+
+    def test_hedged_call(self):
+        """Slow query must be hedged and the first success used"""
+        hedger = get_hedger()
+        start = time.monotonic()
+        response = hedger.call(PRIMARY, slow_primary)
+        assert response.url == ALTERNATE
+        assert time.monotonic() - start < 0.4
+        assert hedger.stats() == {"queries": 1, "hedged": 1, "hedge_wins": 1, "over_cap": 0}
+
+    def test_failed_hedge(self):
+        """Failed hedged query must not be used"""
+        def failing_alternate(url):
+            if url == ALTERNATE:
+                return Response(url, 503)
+            time.sleep(0.2)
+            return Response(url)
+
+        hedger = get_hedger()
+        assert hedger.call(PRIMARY, failing_alternate).url == PRIMARY
+        assert hedger.stats()["hedge_wins"] == 0
+
+    def test_extra_load_cap(self):
+        """Queries must not be hedged beyond the cap on extra load"""
+        hedger = get_hedger(max_extra_load = 0.0)
+        assert hedger.call(PRIMARY, slow_primary).url == PRIMARY
+        assert hedger.stats() == {"queries": 1, "hedged": 0, "hedge_wins": 0, "over_cap": 1}
+
+    def test_hedged_call_async(self):
+        """Slow asynchronous query must be hedged, and then cancelled"""
+        cancelled = []
+        async def slow_primary_async(url):
+            try:
+                await asyncio.sleep(0.5 if url == PRIMARY else 0.01)
+            except asyncio.CancelledError:
+                cancelled.append(url)
+                raise
+            return Response(url)
+
+        hedger = get_hedger()
+        response = asyncio.run(hedger.call_async(PRIMARY, slow_primary_async))
+        assert response.url == ALTERNATE
+        assert cancelled == [PRIMARY]
+        assert hedger.stats()["hedge_wins"] == 1
@@ -0,0 +1,134 @@
+"""Tests for iter8_analytics.api.v2.limiter"""
+# standard python stuff
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import random
+import threading
+import time
+from unittest import TestCase
+
+# iter8 dependencies
+from iter8_analytics import fastapi_app
+from iter8_analytics.config import env_config
+import iter8_analytics.constants as constants
+from iter8_analytics.api.v2.deadline import DeadlineExceededError, set_deadline, reset_deadline
+from iter8_analytics.api.v2.limiter import ConcurrencyLimiter, ConcurrencyLimiters
+
+logger = logging.getLogger('iter8_analytics')
+if not logger.hasHandlers():
+    fastapi_app.config_logger(env_config[constants.LOG_LEVEL])
+
+logger.info(env_config)
+
+def get_limiter(initial_limit, max_limit = 8):
+    """Limiter between 1 and max_limit, halving on failure or four times the average latency"""
+    return ConcurrencyLimiter("http://prometheus:9090", initial_limit = initial_limit, \
+        min_limit = 1, max_limit = max_limit, backoff = 0.5, latency_tolerance = 4.0)
+
+class Limiter(TestCase):
+    """Test adaptive concurrency limits"""
+
+    def test_aimd(self):
+        """Limit must increase additively on success and decrease multiplicatively on failure"""
+        limiter = get_limiter(4)
+        for _ in range(5):
+            with limiter.slot():
+                pass
+        assert limiter.stats()["limit"] == 5
+        with limiter.slot() as slot:
+            slot.failed = True
+        assert limiter.stats()["limit"] == 2
+        with self.assertRaises(ValueError):
+            with limiter.slot():
+                raise ValueError("failed query")
+        limiter.acquire()
+        limiter.release(0.01, True)
+        assert limiter.stats() == {"limit": 1, "in_flight": 0, "waiting": 0}
+
+    def test_latency(self):
+        """Limit must decrease when latency grows beyond the tolerance"""
+        limiter = get_limiter(8)
+        for _ in range(50):
+            limiter.acquire()
+            limiter.release(0.01, False)
+        assert limiter.stats()["limit"] == 8
+        for _ in range(3):
+            limiter.acquire()
+            limiter.release(0.03, False)
+        assert limiter.stats()["limit"] == 8
+        for _ in range(8):
+            limiter.acquire()
+            limiter.release(0.5, False)
+        assert limiter.stats()["limit"] == 4
+
+    def test_bimodal_latency(self):
+        """Limit must not collapse under a steady mix of cheap and expensive queries"""
+        limiter = get_limiter(8)
+        rng = random.Random(17)
+        for _ in range(1000):
+            limiter.acquire()
+            limiter.release(0.5 if rng.random() < 0.2 else 0.01, False)
+        assert limiter.stats()["limit"] == 8
+
+    def test_queueing(self):
+        """Queries beyond the limit must wait for a slot"""
+        limiter = get_limiter(2, max_limit = 2)
+        lock = threading.Lock()
+        in_flight = {"now": 0, "max": 0}
+
+        def query():
+            with limiter.slot():
+                with lock:
+                    in_flight["now"] += 1
+                    in_flight["max"] = max(in_flight["max"], in_flight["now"])
+                time.sleep(0.05)
+                with lock:
+                    in_flight["now"] -= 1
+
+        with ThreadPoolExecutor(max_workers = 6) as executor:
+            for future in [executor.submit(query) for _ in range(6)]:
+                future.result()
+        assert in_flight["max"] == 2
+        assert limiter.stats()["in_flight"] == 0
+
+    def test_deadline_while_waiting(self):
+        """Waiting for a slot must end at the request deadline"""
+        limiter = get_limiter(1)
+        limiter.acquire()
+        token = set_deadline(0.05)
+        try:
+            with self.assertRaises(DeadlineExceededError):
+                limiter.acquire()
+        finally:
+            reset_deadline(token)
+        assert limiter.stats() == {"limit": 1, "in_flight": 1, "waiting": 0}
+
+    def test_queueing_async(self):
+        """Asynchronous queries beyond the limit must wait for a slot"""
+        limiter = get_limiter(2, max_limit = 2)
+        in_flight = {"now": 0, "max": 0}
+
+        async def query():
+            async with limiter.slot():
+                in_flight["now"] += 1
+                in_flight["max"] = max(in_flight["max"], in_flight["now"])
+                await asyncio.sleep(0.02)
+                in_flight["now"] -= 1
+
+        async def queries():
+            await asyncio.gather(*[query() for _ in range(6)])
+
+        asyncio.run(queries())
+        assert in_flight["max"] == 2
+        assert limiter.stats()["in_flight"] == 0
+        assert limiter.stats()["waiting"] == 0
+
+    def test_limiters_per_backend(self):
+        """Each metrics backend must have its own limiter"""
+        limiters = ConcurrencyLimiters(initial_limit = 3, min_limit = 1, max_limit = 10, \
+            backoff = 0.5, latency_tolerance = 4.0)
+        prom = limiters.get_limiter("http://prometheus:9090/api/v1/query")
+        assert prom is limiters.get_limiter("http://prometheus:9090/api/v1/query_range")
+        assert prom is not limiters.get_limiter("https://secure.sysdig.com/api/data")
+        assert limiters.stats()["http://prometheus:9090"]["limit"] == 3
@@ -0,0 +1,120 @@
+"""Tests for iter8_analytics.api.v2.merging"""
+# standard python stuff
+import asyncio
+import json
+import logging
+from unittest import TestCase
+
+# python libraries
+import httpx
+import requests_mock
+
+# iter8 dependencies
+from iter8_analytics import fastapi_app
+from iter8_analytics.config import env_config
+import iter8_analytics.constants as constants
+from iter8_analytics.api.v2.merging import get_merge_key, merge_requests
+from iter8_analytics.api.v2.metrics import get_metric_values, get_metric_values_async, \
+    get_metric_value
+from iter8_analytics.api.v2.types import ExperimentResource, MetricInfo, Method
+from iter8_analytics.api.v2.examples.examples_canary import er_example
+from iter8_analytics.api.v2.examples.examples_metrics import cpu_utilization_merge, \
+    memory_utilization_merge, request_count
+
+logger = logging.getLogger('iter8_analytics')
+if not logger.hasHandlers():
+    fastapi_app.config_logger(env_config[constants.LOG_LEVEL])
+
+logger.info(env_config)
+
+def sysdig_response(body):
+    """Sysdig response with the value 10 * (position + 1) for each metric in the body"""
+    return {
+        "data": [{"t": 1582756200, "d": [10.0 * (i + 1) for i in range(len(body["metrics"]))]}],
+        "start": 1582755600,
+        "end": 1582756200
+    }
+
+def request(body):
+    """POST query to Sysdig with this body"""
+    return {"url": "http://metrics-mock:8080/sysdig", "method": Method.POST, "params": None, \
+        "body": body, "headers": None, "auth": None, "form": None}
+
+class Merging(TestCase):
+    """Test merging of POST queries"""
+
+    def test_merge_key(self):
+        """Queries differing only in their metrics list must have the same merge key"""
+        cpu = request({"last": 60, "metrics": [{"id": "cpu.cores.used"}]})
+        memory = request({"last": 60, "metrics": [{"id": "memory.bytes.used"}]})
+        other = request({"last": 120, "metrics": [{"id": "cpu.cores.used"}]})
+        assert get_merge_key(cpu) == get_merge_key(memory)
+        assert get_merge_key(cpu) != get_merge_key(other)
+        assert get_merge_key(request({"last": 60})) is None
+        assert get_merge_key(dict(cpu, method = Method.GET)) is None
+
+        merged, offsets = merge_requests([cpu, memory, other])
+        assert merged["body"]["metrics"] == [{"id": "cpu.cores.used"}, \
+            {"id": "memory.bytes.used"}, {"id": "cpu.cores.used"}]
+        assert offsets == [0, 1, 2]
+        # inputs are unchanged
+        assert cpu["body"]["metrics"] == [{"id": "cpu.cores.used"}]
+
+    def test_merged_metric_values(self):
+        """Merge metrics must be fetched with one POST per version"""
+        cpu = MetricInfo(** cpu_utilization_merge).metricObj
+        memory = MetricInfo(** memory_utilization_merge).metricObj
+        other = MetricInfo(** request_count).metricObj
+        expr = ExperimentResource(** er_example)
+        versions = [expr.spec.versionInfo.baseline] + expr.spec.versionInfo.candidates
+        metric_versions = [(metric, version) for metric in [cpu, other, memory] \
+            for version in versions]
+
+        with requests_mock.mock(real_http=True) as req_mock:
+            req_mock.post(cpu.spec.urlTemplate, \
+                json = lambda request, context: sysdig_response(request.json()))
+            req_mock.get(other.spec.urlTemplate, json = {"status": "success", "data": \
+                {"resultType": "vector", "result": [{"value": [1556823494.744, "5"]}]}})
+            results = get_metric_values(metric_versions, expr.status.startTime)
+
+            posts = [request.json() for request in req_mock.request_history \
+                if request.method == "POST"]
+            assert len(posts) == 2
+            for body in posts:
+                assert [metric["id"] for metric in body["metrics"]] == \
+                    ["cpu.cores.used", "memory.bytes.used"]
+            assert {"default", "canary"} == \
+                {body["filter"].split("'")[-2] for body in posts}
+        assert results == [(10.0, None), (10.0, None), (5.0, None), (5.0, None), \
+            (20.0, None), (20.0, None)]
+
+    def test_single_merge_metric(self):
+        """Merge metric must be fetched on its own when there is nothing to merge it with"""
+        cpu = MetricInfo(** cpu_utilization_merge).metricObj
+        expr = ExperimentResource(** er_example)
+        with requests_mock.mock(real_http=True) as req_mock:
+            req_mock.post(cpu.spec.urlTemplate, \
+                json = lambda request, context: sysdig_response(request.json()))
+            assert get_metric_value(cpu, expr.spec.versionInfo.baseline, \
+                expr.status.startTime) == (10.0, None)
+
+    def test_merged_metric_values_async(self):
+        """Asynchronous merge metrics must be fetched with one POST per version"""
+        bodies = []
+        def handler(request: httpx.Request):
+            body = json.loads(request.content)
+            bodies.append(body)
+            return httpx.Response(200, json = sysdig_response(body))
+
+        cpu = MetricInfo(** cpu_utilization_merge).metricObj
+        memory = MetricInfo(** memory_utilization_merge).metricObj
+        expr = ExperimentResource(** er_example)
+        version = expr.spec.versionInfo.baseline
+
+        async def get_values():
+            async with httpx.AsyncClient(transport = httpx.MockTransport(handler)) as client:
+                return await get_metric_values_async([(cpu, version), (memory, version)], \
+                    expr.status.startTime, client)
+
+        assert asyncio.run(get_values()) == [(10.0, None), (20.0, None)]
+        assert len(bodies) == 1
@@ -3,10 +3,15 @@
 import logging
 import re
 import os
+import asyncio
 import json
+import copy
+import threading
+import time
 from unittest import TestCase, mock
 
 # python libraries
+import httpx
 import requests_mock
 
 # external module dependencies
@@ -18,13 +23,16 @@ from iter8_analytics.config import env_config
 import iter8_analytics.constants as constants
 
 from iter8_analytics.api.v2.metrics import get_params, get_url, get_headers, \
-    get_basic_auth, get_body, get_metric_value, get_builtin_metrics
+    get_basic_auth, get_body, get_metric_value, get_builtin_metrics, get_aggregated_metrics, \
+    get_metric_value_async, get_aggregated_metrics_async, get_metric_values, \
+    get_metric_values_async, get_metric_request, get_interpolation_args, compile_request_plan
 from iter8_analytics.api.v2.types import ExperimentResource, MetricInfo, \
     MetricResource, NamedValue, AuthType
-from iter8_analytics.api.v2.examples.examples_canary import er_example
+from iter8_analytics.api.v2.examples.examples_canary import er_example, \
+    er_example_step1, mr_example
 from iter8_analytics.api.v2.examples.examples_metrics import cpu_utilization, \
     request_count, new_relic_embedded, new_relic_secret, sysdig_embedded, \
-    sysdig_secret, elastic_secret
+    sysdig_secret, elastic_secret, request_count_batch, mocked_request_count
 
 logger = logging.getLogger('iter8_analytics')
 if not logger.hasHandlers():
@@ -615,3 +623,320 @@ class SamplesUsedInIter8Docs(TestCase):
             value, err = get_metric_value(ela, version, start_time)
             assert err is None
             assert value == 128.33333333333334
+
+class RequestPlans(TestCase):
+    """Test compiled request plans of metrics"""
+
+    @mock.patch('iter8_analytics.api.v2.metrics.get_secret_data_for_metric')
+    def test_request_plan(self, mock_secret):
+        """Plans must resolve url and headers; requests must interpolate params per version"""
+        mock_secret.return_value = ({"mykey": "t0p-secret-api-key"}, None)
+        nre = MetricResource(** new_relic_secret)
+        plan, err = compile_request_plan(nre)
+        assert err is None
+        assert plan.url == nre.spec.urlTemplate
+        assert plan.headers == {"X-Query-Key": "t0p-secret-api-key"}
+        assert mock_secret.call_count == 1
+
+        expr = ExperimentResource(** er_example)
+        version = expr.spec.versionInfo.baseline
+        version.variables = [
+            NamedValue(name = "userfilter", value = 'usergroup!~"wakanda"'),
+            NamedValue(name = "revision", value = 'sample-app-v1')
+        ]
+        request, err = get_metric_request(nre, \
+            get_interpolation_args(version, expr.status.startTime))
+        assert err is None
+        assert request["params"] == get_params(nre, version, expr.status.startTime)[0]
+        assert request["headers"] == plan.headers
+
+        mock_secret.return_value = (None, KeyError("cannot find secret"))
+        request, err = get_metric_request(nre, {"name": "default"})
+        assert request is None and isinstance(err, KeyError)
+
+    @mock.patch('iter8_analytics.api.v2.metrics.get_secret_data_for_metric')
+    def test_secret_read_once_per_evaluation(self, mock_secret):
+        """The secret of a metric must be read once for all versions"""
+        mock_secret.return_value = ({"mykey": "t0p-secret-api-key"}, None)
+        nre = MetricResource(** new_relic_secret)
+        file_path = os.path.join(os.path.dirname(__file__), 'data/newrelic_responses',
+                                    'newrelic_sample_response.json')
+        expr = ExperimentResource(** er_example)
+        versions = [expr.spec.versionInfo.baseline] + expr.spec.versionInfo.candidates
+        with requests_mock.mock(real_http=True) as req_mock:
+            req_mock.register_uri('GET', nre.spec.urlTemplate, json = json.load(open(file_path)), \
+                status_code = 200, request_headers={'X-Query-Key': 't0p-secret-api-key'})
+            results = get_metric_values([(nre, version) for version in versions], \
+                expr.status.startTime)
+            assert results == [(80275388, None)] * len(versions)
+        assert mock_secret.call_count == 1
+
+    def test_secret_read_off_event_loop(self):
+        """On the asyncio path, secrets must be read outside the event loop thread"""
+        threads = []
+        def secret(metric_resource):
+            threads.append(threading.current_thread())
+            return {"mykey": "t0p-secret-api-key"}, None
+
+        nre = MetricResource(** new_relic_secret)
+        file_path = os.path.join(os.path.dirname(__file__), 'data/newrelic_responses',
+                                    'newrelic_sample_response.json')
+        response = json.load(open(file_path))
+        def handler(request: httpx.Request):
+            assert request.headers["X-Query-Key"] == "t0p-secret-api-key"
+            return httpx.Response(200, json = response)
+
+        expr = ExperimentResource(** er_example)
+        versions = [expr.spec.versionInfo.baseline] + expr.spec.versionInfo.candidates
+
+        async def get_values():
+            async with httpx.AsyncClient(transport = httpx.MockTransport(handler)) as client:
+                return await get_metric_values_async([(nre, version) for version in versions], \
+                    expr.status.startTime, client), \
+                        await get_metric_value_async(nre, versions[0], expr.status.startTime, \
+                            client)
+
+        with mock.patch('iter8_analytics.api.v2.metrics.get_secret_data_for_metric', \
+            side_effect = secret):
+            results, result = asyncio.run(get_values())
+        assert results == [(80275388, None)] * len(versions)
+        assert result == (80275388, None)
+        assert len(threads) == 2
+        assert threading.main_thread() not in threads
+
+class ConcurrentFetch(TestCase):
+    """Test concurrent fetching of metric values"""
+
+    def test_metric_versions_fetched_concurrently(self):
+        """All metric/version queries must be in flight together; results must be unchanged"""
+        lock = threading.Lock()
+        in_flight = {"now": 0, "max": 0}
+
+        def slow_metric_value(metric_resource, version, start_time):
+            with lock:
+                in_flight["now"] += 1
+                in_flight["max"] = max(in_flight["max"], in_flight["now"])
+            time.sleep(0.2)
+            with lock:
+                in_flight["now"] -= 1
+            if version.name == "canary":
+                return None, ValueError("metrics backend is unavailable")
+            return 42.0, None
+
+        with mock.patch('iter8_analytics.api.v2.metrics.get_metric_value', \
+            side_effect = slow_metric_value):
+            example = copy.deepcopy(er_example_step1)
+            example['status']['metrics'] = mr_example
+            expr = ExperimentResource(** example)
+            iam = get_aggregated_metrics(expr.convert_to_float())
+
+        # two metrics and two versions
+        assert in_flight["max"] == 4
+        for metric_name in ["request-count", "mean-latency"]:
+            assert iam.data[metric_name].data["default"].value == 42.0
+            # canary falls back to the value in the previous aggregated metrics
+            assert iam.data[metric_name].data["canary"].value == \
+                expr.status.analysis.aggregated_metrics.data[metric_name].data["canary"].value
+        assert iam.message.startswith("Error: Error from metrics backend for metric: request-count")
+
+    @mock.patch.dict('iter8_analytics.api.v2.metrics.env_config', \
+        {constants.METRICS_FETCH_CONCURRENCY: 1})
+    def test_concurrency_limit(self):
+        """No more than metrics_fetch_concurrency queries must be in flight"""
+        lock = threading.Lock()
+        in_flight = {"now": 0, "max": 0}
+
+        def slow_metric_value(metric_resource, version, start_time):
+            with lock:
+                in_flight["now"] += 1
+                in_flight["max"] = max(in_flight["max"], in_flight["now"])
+            time.sleep(0.05)
+            with lock:
+                in_flight["now"] -= 1
+            return 42.0, None
+
+        with mock.patch('iter8_analytics.api.v2.metrics.get_metric_value', \
+            side_effect = slow_metric_value):
+            expr = ExperimentResource(** er_example)
+            get_aggregated_metrics(expr.convert_to_float())
+
+        assert in_flight["max"] == 1
+
+class AsyncMetrics(TestCase):
+    """Test asynchronous metrics collection"""
+
+    def test_get_metric_value_async(self):
+        """GET metric query using the asynchronous client must result in a value"""
+        def handler(request: httpx.Request):
+            assert request.method == "GET"
+            assert re.search("default", request.url.params["query"]) is not None
+            return httpx.Response(200, json = {
+                "status": "success",
+                "data": {
+                    "resultType": "vector",
+                    "result": [{"value": [1556823494.744, "21.7639"]}]
+                }
+            })
+
+        expr = ExperimentResource(** er_example)
+        metric_info = MetricInfo(** request_count)
+        version = expr.spec.versionInfo.baseline
+
+        async def get_value():
+            async with httpx.AsyncClient(transport = httpx.MockTransport(handler)) as client:
+                return await get_metric_value_async(metric_info.metricObj, version, \
+                    expr.status.startTime, client)
+
+        value, err = asyncio.run(get_value())
+        assert err is None
+        assert value == 21.7639
+
+    def test_post_metric_async(self):
+        """POST metric query using the asynchronous client must result in a value"""
+        def handler(request: httpx.Request):
+            assert request.method == "POST"
+            body = json.loads(request.content)
+            assert body["filter"] == "kubernetes.node.name = 'n1' and service = 'default'"
+            return httpx.Response(200, json = {
+                "data": [{"t": 1582756200, "d": [6.481]}],
+                "start": 1582755600,
+                "end": 1582756200
+            })
+
+        expr = ExperimentResource(** er_example)
+        metric_info = MetricInfo(** cpu_utilization)
+        version = expr.spec.versionInfo.baseline
+
+        async def get_value():
+            async with httpx.AsyncClient(transport = httpx.MockTransport(handler)) as client:
+                return await get_metric_value_async(metric_info.metricObj, version, \
+                    expr.status.startTime, client)
+
+        value, err = asyncio.run(get_value())
+        assert err is None
+        assert value == 6.481
+
+    @mock.patch.dict('iter8_analytics.api.v2.metrics.env_config', \
+        {constants.METRICS_BACKEND_RETRIES: 0})
+    def test_aggregated_metrics_async_fallback(self):
+        """Metrics backend errors must fall back to previous values, as in the synchronous case"""
+        def handler(request: httpx.Request):
+            return httpx.Response(502, text = "bad gateway")
+
+        example = copy.deepcopy(er_example_step1)
+        example['status']['metrics'] = mr_example
+        expr = ExperimentResource(** example)
+
+        async def get_iam():
+            async with httpx.AsyncClient(transport = httpx.MockTransport(handler)) as client:
+                return await get_aggregated_metrics_async(expr.convert_to_float(), client)
+
+        iam = asyncio.run(get_iam())
+        for metric_name in ["request-count", "mean-latency"]:
+            for version_name in ["default", "canary"]:
+                assert iam.data[metric_name].data[version_name].value == \
+                    expr.status.analysis.aggregated_metrics.data[metric_name]\
+                        .data[version_name].value
+        assert iam.message.startswith("Error: Error from metrics backend for metric: request-count")
+
+class BatchMetrics(TestCase):
+    """Test batch metrics, queried once for all versions"""
+
+    json_response = {
+        "status": "success",
+        "data": {
+            "resultType": "vector",
+            "result": [{
+                "metric": {"service_name": "default"},
+                "value": [1556823494.744, "21.7639"]
+            }, {
+                "metric": {"service_name": "canary"},
+                "value": [1556823494.744, "13.5"]
+            }]
+        }
+    }
+
+    def test_batch_metric_values(self):
+        """Batch metric must be queried once; each version must get its own value"""
+        with requests_mock.mock(real_http=True) as req_mock:
+            metric_info = MetricInfo(** request_count_batch)
+            req_mock.get(metric_info.metricObj.spec.urlTemplate, json = self.json_response)
+            expr = ExperimentResource(** er_example)
+            versions = [expr.spec.versionInfo.baseline] + expr.spec.versionInfo.candidates
+            metric_versions = [(metric_info.metricObj, version) for version in versions]
+            # interleave a non-batch metric
+            other = MetricInfo(** mocked_request_count).metricObj
+            metric_versions.insert(1, (other, versions[0]))
+
+            results = get_metric_values(metric_versions, expr.status.startTime)
+            assert req_mock.call_count == 1
+            assert "service_name=~'default|canary'" in \
+                req_mock.request_history[0].qs["query"][0]
+            assert results[0] == (21.7639, None)
+            # mocked counter value
+            assert results[1][1] is None
+            assert results[2] == (13.5, None)
+
+    def test_batch_metric_dotted_version_names(self):
+        """Version names must match only themselves in the batch query"""
+        json_response = {
+            "status": "success",
+            "data": {
+                "resultType": "vector",
+                "result": [{
+                    "metric": {"service_name": "v1.2"},
+                    "value": [1556823494.744, "21.7639"]
+                }, {
+                    "metric": {"service_name": "v1x2"},
+                    "value": [1556823494.744, "13.5"]
+                }]
+            }
+        }
+        with requests_mock.mock(real_http=True) as req_mock:
+            metric_info = MetricInfo(** request_count_batch)
+            req_mock.get(metric_info.metricObj.spec.urlTemplate, json = json_response)
+            expr = ExperimentResource(** er_example)
+            versions = [expr.spec.versionInfo.baseline] + expr.spec.versionInfo.candidates
+            versions[0].name = "v1.2"
+            results = get_metric_values([(metric_info.metricObj, version) \
+                for version in versions], expr.status.startTime)
+            query = req_mock.request_history[0].qs["query"][0]
+            assert "service_name=~'v1\\\\.2|canary'" in query
+            # PromQL unescapes the string literal before compiling the regular expression
+            regex = re.search(r"=~'([^']*)'", query).group(1).replace("\\\\", "\\")
+            assert re.fullmatch(regex, "v1.2")
+            assert not re.fullmatch(regex, "v1x2")
+            assert results == [(21.7639, None), (0, None)]
+
+    def test_batch_metric_missing_version(self):
+        """Versions absent from the batch response must get the jqExpression default"""
+        with requests_mock.mock(real_http=True) as req_mock:
+            metric_info = MetricInfo(** request_count_batch)
+            response = copy.deepcopy(self.json_response)
+            response["data"]["result"] = response["data"]["result"][:1]
+            req_mock.get(metric_info.metricObj.spec.urlTemplate, json = response)
+            expr = ExperimentResource(** er_example)
+            versions = [expr.spec.versionInfo.baseline] + expr.spec.versionInfo.candidates
+            results = get_metric_values([(metric_info.metricObj, version) \
+                for version in versions], expr.status.startTime)
+            assert results == [(21.7639, None), (0, None)]
+
+    def test_batch_metric_values_async(self):
+        """Asynchronous batch metric must be queried once; each version must get its own value"""
+        calls = []
+        def handler(request: httpx.Request):
+            calls.append(request)
+            return httpx.Response(200, json = self.json_response)
+
+        metric_info = MetricInfo(** request_count_batch)
+        expr = ExperimentResource(** er_example)
+        versions = [expr.spec.versionInfo.baseline] + expr.spec.versionInfo.candidates
+
+        async def get_values():
+            async with httpx.AsyncClient(transport = httpx.MockTransport(handler)) as client:
+                return await get_metric_values_async([(metric_info.metricObj, version) \
+                    for version in versions], expr.status.startTime, client)
+
+        results = asyncio.run(get_values())
+        assert len(calls) == 1
+        assert results == [(21.7639, None), (13.5, None)]
@@ -0,0 +1,120 @@
+"""Tests for iter8_analytics.api.v2.planning"""
+# standard python stuff
+import asyncio
+import copy
+import logging
+from unittest import TestCase, mock
+
+# python libraries
+import httpx
+from fastapi.testclient import TestClient
+
+# iter8 dependencies
+from iter8_analytics import fastapi_app
+from iter8_analytics.config import env_config
+import iter8_analytics.constants as constants
+from iter8_analytics.api.v2.planning import FetchPlan, get_needed_metrics, plan_metrics, \
+    set_fetch_plan, reset_fetch_plan
+from iter8_analytics.api.v2.circuit_breaker import circuit_breakers
+from iter8_analytics.api.v2.metrics import get_custom_metrics
+from iter8_analytics.api.v2.prefetch import prefetcher, get_prefetched_aggregated_metrics
+from iter8_analytics.api.v2.types import AnalysisStage, ExperimentResource
+from iter8_analytics.api.v2.examples.examples_canary import er_example
+from iter8_analytics.api.v2.examples.examples_ab import ab_er_example
+
+logger = logging.getLogger('iter8_analytics')
+if not logger.hasHandlers():
+    fastapi_app.config_logger(env_config[constants.LOG_LEVEL])
+
+logger.info(env_config)
+
+json_response = {
+    "status": "success",
+    "data": {
+        "resultType": "vector",
+        "result": [{"value": [1556823494.744, "21.7639"]}]
+    }
+}
+
+class Planning(TestCase):
+    """Test demand-driven planning of metric fetches"""
+
+    def setUp(self):
+        circuit_breakers.reset()
+
+    def tearDown(self):
+        circuit_breakers.reset()
+
+    def test_needed_metrics(self):
+        """Each stage of analysis must need only the metrics in its criteria"""
+        expr = ExperimentResource(** ab_er_example)
+        assert get_needed_metrics(expr, frozenset([AnalysisStage.VERSION_ASSESSMENTS])) == \
+            {"mean-latency"}
+        assert get_needed_metrics(expr, frozenset([AnalysisStage.WEIGHTS])) == \
+            {"mean-latency", "business-revenue"}
+        assert get_needed_metrics(expr, frozenset()) == set()
+        example = copy.deepcopy(ab_er_example)
+        del example["spec"]["criteria"]
+        assert get_needed_metrics(ExperimentResource(** example), frozenset(AnalysisStage)) == \
+            set()
+
+    def test_plan_metrics(self):
+        """Metrics not needed must be skipped, unless all metrics are fetched"""
+        expr = ExperimentResource(** ab_er_example)
+        metrics = get_custom_metrics(expr)
+        planned, skipped = plan_metrics(expr, metrics, FetchPlan())
+        assert [metric_info.name for metric_info in planned] == \
+            ["mean-latency", "business-revenue"]
+        assert [metric_info.name for metric_info in skipped] == ["request-count"]
+        for plan in [None, FetchPlan(fetch_all = True)]:
+            planned, skipped = plan_metrics(expr, metrics, plan)
+            assert planned == metrics and skipped == []
+
+    def test_endpoint(self):
+        """Endpoints must fetch only the metrics needed, unless fetchAll is set"""
+        calls = []
+        def handler(request: httpx.Request):
+            calls.append(request)
+            return httpx.Response(200, json = json_response)
+
+        client = TestClient(fastapi_app.app)
+        with mock.patch('iter8_analytics.api.v2.metrics.session_pool.get_async_client', \
+            side_effect = lambda url: httpx.AsyncClient(transport = httpx.MockTransport(handler))):
+            resp = client.post("/v2/aggregated_metrics", json = er_example)
+            assert resp.status_code == 200
+            assert set(resp.json()["data"]) == {"mean-latency"}
+            assert "Not fetched (not needed for analysis): request-count" in \
+                resp.json()["message"]
+            assert len(calls) == 2
+
+            resp = client.post("/v2/aggregated_metrics?stages=version_assessments" \
+                "&stages=weights&fetchAll=true", json = er_example)
+            assert set(resp.json()["data"]) == {"request-count", "mean-latency"}
+            assert len(calls) == 6
+
+            resp = client.post("/v2/analytics_results", json = er_example)
+            assert set(resp.json()["aggregatedMetrics"]["data"]) == {"mean-latency"}
+            with mock.patch.dict(fastapi_app.config.env_config, \
+                {constants.METRICS_FETCH_ALL: True}):
+                resp = client.post("/v2/analytics_results", json = er_example)
+            assert set(resp.json()["aggregatedMetrics"]["data"]) == \
+                {"request-count", "mean-latency"}
+
+    def test_prefetched_metrics(self):
+        """Prefetched values of metrics not needed must be left out"""
+        expr = ExperimentResource(** er_example)
+        # request-count then mean-latency, for the default and canary versions
+        results = [(1.0, None), (2.0, None), (3.0, None), (4.0, None)]
+
+        async def get_iam():
+            token = set_fetch_plan(FetchPlan())
+            try:
+                return await get_prefetched_aggregated_metrics(expr)
+            finally:
+                reset_fetch_plan(token)
+
+        with mock.patch.object(prefetcher, 'get_results', return_value = results):
+            iam = asyncio.run(get_iam())
+        assert set(iam.data) == {"mean-latency"}
+        assert iam.data["mean-latency"].data["default"].value == 3.0
+        assert iam.data["mean-latency"].data["canary"].value == 4.0
@@ -0,0 +1,166 @@
+"""Tests for iter8_analytics.api.v2.prefetch"""
+# standard python stuff
+import asyncio
+import copy
+import logging
+from unittest import TestCase, mock
+
+# python libraries
+from fastapi.testclient import TestClient
+
+# iter8 dependencies
+from iter8_analytics import fastapi_app
+from iter8_analytics.config import env_config
+import iter8_analytics.constants as constants
+from iter8_analytics.api.v2.prefetch import Prefetcher, get_experiment_key, \
+    get_prefetched_aggregated_metrics
+from iter8_analytics.api.v2.types import ExperimentResource
+from iter8_analytics.api.v2.examples.examples_canary import er_example_step1, mr_example
+
+logger = logging.getLogger('iter8_analytics')
+if not logger.hasHandlers():
+    fastapi_app.config_logger(env_config[constants.LOG_LEVEL])
+
+logger.info(env_config)
+
+def get_expr():
+    """Experiment with two versions and two metrics"""
+    example = copy.deepcopy(er_example_step1)
+    example['status']['metrics'] = mr_example
+    return ExperimentResource(** example).convert_to_float()
+
+class Prefetch(TestCase):
+    """Test background prefetching"""
+
+    def test_experiment_key(self):
+        """Experiment key must depend on start time, versions, criteria and metrics only"""
+        expr = get_expr()
+        other = get_expr()
+        other.status.analysis = None
+        assert get_experiment_key(expr) == get_experiment_key(other)
+        other.spec.versionInfo.candidates[0].name = "canary-2"
+        assert get_experiment_key(expr) != get_experiment_key(other)
+        other = get_expr()
+        other.spec.criteria.objectives[0].upper_limit = 500.0
+        assert get_experiment_key(expr) != get_experiment_key(other)
+        other = get_expr()
+        other.status.metrics[0].metricObj.spec.params[0].value = "sum(up)"
+        assert get_experiment_key(expr) != get_experiment_key(other)
+
+    def test_prefetched_results(self):
+        """Requests for registered experiments must be answered from prefetched results"""
+        calls = []
+        async def metric_values(metric_versions, start_time):
+            calls.append(len(metric_versions))
+            await asyncio.sleep(0.01)
+            return [(42.0, None)] * len(metric_versions)
+
+        prefetcher = Prefetcher(max_workers = 2, lead = 0.0, idle_timeout = 60.0, tick = 0.01)
+        expr = get_expr()
+
+        async def run():
+            prefetcher.start()
+            prefetcher.register(expr, interval = 30.0)
+            await asyncio.sleep(0.1)
+            iam = await get_prefetched_aggregated_metrics(get_expr())
+            await prefetcher.stop()
+            return iam
+
+        with mock.patch('iter8_analytics.api.v2.prefetch.prefetcher', prefetcher), \
+            mock.patch('iter8_analytics.api.v2.prefetch.get_metric_values_async', \
+                side_effect = metric_values):
+            iam = asyncio.run(run())
+
+        # a single prefetch per interval
+        assert calls == [4]
+        assert iam.data["request-count"].data["canary"].value == 42.0
+        assert prefetcher.stats() == \
+            {"experiments": 1, "prefetches": 1, "hits": 1, "misses": 0, "expired": 0, \
+                "failures": 0}
+
+    def test_failed_prefetch(self):
+        """Prefetches which fail must be logged and counted, and retried in the next interval"""
+        async def metric_values(metric_versions, start_time):
+            raise RuntimeError("backend is down")
+
+        prefetcher = Prefetcher(max_workers = 2, lead = 0.0, idle_timeout = 60.0, tick = 0.01)
+        expr = get_expr()
+
+        async def run():
+            prefetcher.start()
+            prefetcher.register(expr, interval = 30.0)
+            await asyncio.sleep(0.1)
+            await prefetcher.stop()
+
+        with mock.patch('iter8_analytics.api.v2.prefetch.get_metric_values_async', \
+            side_effect = metric_values), self.assertLogs('iter8_analytics', 'ERROR') as logs:
+            asyncio.run(run())
+
+        assert any("backend is down" in line for line in logs.output)
+        assert prefetcher.stats()["failures"] == 1
+        assert prefetcher.stats()["prefetches"] == 0
+        registration = list(prefetcher.registrations.values())[0]
+        assert not registration.fetching
+        assert prefetcher.get_results(expr) is None
+
+    def test_stale_results(self):
+        """Requests must not be answered from results older than the interval"""
+        prefetcher = Prefetcher(max_workers = 2, lead = 0.0, idle_timeout = 60.0)
+        expr = get_expr()
+        prefetcher.register(expr, interval = 10.0)
+        assert prefetcher.get_results(expr) is None
+        registration = list(prefetcher.registrations.values())[0]
+        registration.results = [(1.0, None)] * 4
+        with mock.patch('iter8_analytics.api.v2.prefetch.time.monotonic', return_value = 100.0):
+            registration.fetched_at = 95.0
+            assert prefetcher.get_results(expr) == registration.results
+            registration.fetched_at = 85.0
+            assert prefetcher.get_results(expr) is None
+        assert prefetcher.stats()["misses"] == 2
+
+    def test_idle_expiry_and_workers(self):
+        """Idle experiments must expire; concurrent prefetches must be bounded"""
+        in_flight = {"now": 0, "max": 0}
+        async def metric_values(metric_versions, start_time):
+            in_flight["now"] += 1
+            in_flight["max"] = max(in_flight["max"], in_flight["now"])
+            await asyncio.sleep(0.05)
+            in_flight["now"] -= 1
+            return [(1.0, None)] * len(metric_versions)
+
+        prefetcher = Prefetcher(max_workers = 2, lead = 0.0, idle_timeout = 0.2, tick = 0.01)
+
+        async def run():
+            prefetcher.start()
+            for i in range(5):
+                expr = get_expr()
+                expr.spec.versionInfo.candidates[0].name = f"canary-{i}"
+                prefetcher.register(expr, interval = 30.0)
+            await asyncio.sleep(0.5)
+            await prefetcher.stop()
+
+        with mock.patch('iter8_analytics.api.v2.prefetch.get_metric_values_async', \
+            side_effect = metric_values):
+            asyncio.run(run())
+
+        assert in_flight["max"] == 2
+        assert prefetcher.stats()["prefetches"] == 5
+        assert prefetcher.stats()["expired"] == 5
+        assert prefetcher.stats()["experiments"] == 0
+
+    def test_registration_endpoints(self):
+        """Experiments must be registered and unregistered using /v2/prefetch"""
+        client = TestClient(fastapi_app.app)
+        example = copy.deepcopy(er_example_step1)
+        example['status']['metrics'] = mr_example
+        with mock.patch('iter8_analytics.fastapi_app.prefetcher', \
+            Prefetcher(max_workers = 1, lead = 0.0, idle_timeout = 60.0)):
+            resp = client.post("/v2/prefetch", json = \
+                {"experimentResource": example, "interval": 20})
+            assert resp.status_code == 200
+            key = resp.json()["key"]
+            assert key == get_experiment_key(get_expr())
+            assert client.delete(f"/v2/prefetch/{key}").status_code == 200
+            assert client.delete(f"/v2/prefetch/{key}").status_code == 404
+            assert client.post("/v2/prefetch", json = \
+                {"experimentResource": example, "interval": 0}).status_code == 422
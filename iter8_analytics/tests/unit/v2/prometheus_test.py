@@ -0,0 +1,129 @@
+"""Tests for iter8_analytics.api.v2.prometheus"""
+# standard python stuff
+import asyncio
+import copy
+import logging
+from unittest import TestCase, mock
+from urllib.parse import parse_qs
+
+# python libraries
+import httpx
+import requests_mock
+
+# iter8 dependencies
+from iter8_analytics import fastapi_app
+from iter8_analytics.config import env_config
+import iter8_analytics.constants as constants
+from iter8_analytics.api.v2.prometheus import parse_prometheus_response, \
+    PrometheusResponseError
+from iter8_analytics.api.v2.metrics import get_metric_value, get_metric_value_async
+from iter8_analytics.api.v2.types import ExperimentResource, MetricInfo
+from iter8_analytics.api.v2.examples.examples_canary import er_example
+from iter8_analytics.api.v2.examples.examples_metrics import request_count
+
+logger = logging.getLogger('iter8_analytics')
+if not logger.hasHandlers():
+    fastapi_app.config_logger(env_config[constants.LOG_LEVEL])
+
+logger.info(env_config)
+
+def vector(*values):
+    """Prometheus instant vector response"""
+    return {
+        "status": "success",
+        "data": {
+            "resultType": "vector",
+            "result": [{"metric": {}, "value": [1556823494.744, value]} for value in values]
+        }
+    }
+
+def prometheus_metric():
+    """request-count metric using the built-in Prometheus adapter, without jqExpression"""
+    metric = copy.deepcopy(request_count)
+    metric["metricObj"]["spec"]["adapter"] = "prometheus"
+    del metric["metricObj"]["spec"]["jqExpression"]
+    return MetricInfo(** metric).metricObj
+
+class PrometheusResponses(TestCase):
+    """Test parsing of Prometheus responses"""
+
+    def test_values(self):
+        """Scalar and vector results must be parsed into floats"""
+        assert parse_prometheus_response(vector("21.7639")) == (21.7639, None)
+        assert parse_prometheus_response(vector("3", "4")) == (3.0, None)
+        assert parse_prometheus_response({"status": "success", "data": \
+            {"resultType": "scalar", "result": [1556823494.744, "1e3"]}}) == (1000.0, None)
+
+    def test_errors(self):
+        """Responses without a usable value must result in clear errors"""
+        for response, message in [
+                (vector(), "no data"),
+                (vector("NaN"), "NaN"),
+                (vector("+Inf"), "infinite"),
+                (vector("abc"), "invalid sample"),
+                ({"status": "error", "errorType": "bad_data", "error": "parse error"}, \
+                    "bad_data: parse error"),
+                ({"status": "success", "data": {"resultType": "matrix", "result": []}}, \
+                    "unsupported Prometheus result type: matrix"),
+                ([], "not a JSON object"),
+                ({"status": "error"}, "Prometheus query failed"),
+                ({"status": "success", "data": {"resultType": "matrix", "result": [{ \
+                    "metric": {}, "values": [[1556823494.744, "1"]]}]}}, \
+                    "unsupported Prometheus result type: matrix"),
+                ({"status": "success", "data": ["vector"]}, "malformed"),
+                ({"status": "success", "data": {"resultType": "vector", "result": {}}}, \
+                    "no data"),
+                ({"status": "success", "data": {"resultType": "vector", "result": 1}}, \
+                    "malformed"),
+                ({"status": "success", "data": {"resultType": "vector", \
+                    "result": [[1556823494.744, "1"]]}}, "malformed"),
+                ({"status": "success", "data": {"resultType": "vector", \
+                    "result": [{"metric": {}}]}}, "invalid sample")]:
+            value, err = parse_prometheus_response(response)
+            assert value is None
+            assert isinstance(err, PrometheusResponseError)
+            assert message in str(err)
+
+class PrometheusAdapter(TestCase):
+    """Test metrics using the built-in Prometheus adapter"""
+
+    def test_post_form(self):
+        """Query must be sent as a POST form and parsed without jq"""
+        metric = prometheus_metric()
+        expr = ExperimentResource(** er_example)
+        with requests_mock.mock(real_http=True) as req_mock, \
+            mock.patch('iter8_analytics.api.v2.metrics.jq') as mock_jq:
+            req_mock.post(metric.spec.urlTemplate, json = vector("42"))
+            value, err = get_metric_value(metric, expr.spec.versionInfo.baseline, \
+                expr.status.startTime)
+            assert (value, err) == (42.0, None)
+            request = req_mock.request_history[0]
+            assert request.headers["Content-Type"] == "application/x-www-form-urlencoded"
+            assert "default" in parse_qs(request.text)["query"][0]
+            assert request.qs == {}
+            mock_jq.compile.assert_not_called()
+
+            req_mock.post(metric.spec.urlTemplate, json = vector("NaN"))
+            value, err = get_metric_value(metric, expr.spec.versionInfo.candidates[0], \
+                expr.status.startTime)
+            assert value is None
+            assert isinstance(err, PrometheusResponseError)
+
+    def test_post_form_async(self):
+        """Asynchronous query must be sent as a POST form and parsed without jq"""
+        def handler(request: httpx.Request):
+            assert request.method == "POST"
+            assert "default" in parse_qs(request.content.decode())["query"][0]
+            return httpx.Response(200, json = vector())
+
+        metric = prometheus_metric()
+        expr = ExperimentResource(** er_example)
+
+        async def get_value():
+            async with httpx.AsyncClient(transport = httpx.MockTransport(handler)) as client:
+                return await get_metric_value_async(metric, expr.spec.versionInfo.baseline, \
+                    expr.status.startTime, client)
+
+        value, err = asyncio.run(get_value())
+        assert value is None
+        assert "no data" in str(err)
@@ -0,0 +1,220 @@
+"""Tests for iter8_analytics.api.v2.responses"""
+# standard python stuff
+import asyncio
+import gzip
+import io
+import json
+import logging
+import zlib
+from unittest import TestCase, mock
+
+# python libraries
+import httpx
+import requests
+import requests_mock
+import urllib3
+
+# iter8 dependencies
+from iter8_analytics import fastapi_app
+from iter8_analytics.config import env_config
+import iter8_analytics.constants as constants
+from iter8_analytics.api.v2.responses import ResponseTooLargeError, BackendResponse, \
+    byte_counters
+from iter8_analytics.api.v2.sessions import SessionPool
+from iter8_analytics.api.v2.metrics import get_raw_response, get_raw_response_async, \
+    get_metric_value
+from iter8_analytics.api.v2.types import ExperimentResource, MetricInfo, Method
+from iter8_analytics.api.v2.examples.examples_canary import er_example
+from iter8_analytics.api.v2.examples.examples_metrics import request_count
+
+logger = logging.getLogger('iter8_analytics')
+if not logger.hasHandlers():
+    fastapi_app.config_logger(env_config[constants.LOG_LEVEL])
+
+logger.info(env_config)
+
+URL = "http://prometheus:9090/api/v1/query"
+
+def large_response(series):
+    """Prometheus vector response with many series"""
+    return {
+        "status": "success",
+        "data": {
+            "resultType": "vector",
+            "result": [{"metric": {"pod": f"pod-{i}"}, "value": [1556823494.744, "1"]} \
+                for i in range(series)]
+        }
+    }
+
+class Responses(TestCase):
+    """Test size-bounded reads of metrics backend responses"""
+
+    def test_backend_response(self):
+        """Backend response must parse its body and preview it for logs"""
+        response = BackendResponse(200, b'{"status": "success"}')
+        assert response.json() == {"status": "success"}
+        assert response.preview(10) == '{"status":...'
+        assert response.text == '{"status": "success"}'
+
+    def test_bounded_read(self):
+        """Responses up to the maximum size must be read; larger responses must be rejected"""
+        with requests_mock.mock(real_http=True) as req_mock:
+            req_mock.get(URL, json = large_response(10))
+            response = get_raw_response(url = URL, method = Method.GET, params = None, \
+                body = None, headers = None, auth = None, timeout = 1.0)
+            assert response.json() == large_response(10)
+
+            req_mock.get(URL, content = json.dumps(large_response(1000)).encode())
+            with mock.patch.dict('iter8_analytics.api.v2.metrics.env_config', \
+                {constants.BACKEND_MAX_RESPONSE_BYTES: 10000}):
+                with self.assertRaises(ResponseTooLargeError):
+                    get_raw_response(url = URL, method = Method.GET, params = None, \
+                        body = None, headers = None, auth = None, timeout = 1.0)
+
+    def test_truncated_read(self):
+        """A body shorter than its declared length must fail like other connection errors"""
+        def truncated():
+            return urllib3.HTTPResponse(body = io.BytesIO(b'{"status": "succ'), \
+                headers = {"Content-Length": "1000"}, status = 200, \
+                    preload_content = False, enforce_content_length = True)
+
+        with requests_mock.mock(real_http=True) as req_mock:
+            req_mock.get(URL, raw = truncated())
+            with self.assertRaises(requests.exceptions.ChunkedEncodingError):
+                get_raw_response(url = URL, method = Method.GET, params = None, \
+                    body = None, headers = None, auth = None, timeout = 1.0)
+
+            metric_info = MetricInfo(** request_count)
+            req_mock.get(metric_info.metricObj.spec.urlTemplate, raw = truncated())
+            expr = ExperimentResource(** er_example)
+            value, err = get_metric_value(metric_info.metricObj, \
+                expr.spec.versionInfo.baseline, expr.status.startTime)
+            assert value is None
+            assert isinstance(err, requests.exceptions.ChunkedEncodingError)
+
+    @mock.patch.dict('iter8_analytics.api.v2.metrics.env_config', \
+        {constants.BACKEND_MAX_RESPONSE_BYTES: 10000})
+    def test_bounded_read_async(self):
+        """Asynchronous reads must stop once the response exceeds the maximum size"""
+        chunks_read = []
+        async def chunks():
+            for _ in range(100):
+                chunks_read.append(1)
+                yield b" " * 1000
+
+        def handler(request: httpx.Request):
+            return httpx.Response(200, content = chunks())
+
+        async def get_response():
+            async with httpx.AsyncClient(transport = httpx.MockTransport(handler)) as client:
+                return await get_raw_response_async(client, url = URL, method = Method.GET, \
+                    params = None, body = None, headers = None, auth = None, timeout = 1.0)
+
+        with self.assertRaises(ResponseTooLargeError):
+            asyncio.run(get_response())
+        assert len(chunks_read) < 100
+
+    @mock.patch.dict('iter8_analytics.api.v2.metrics.env_config', \
+        {constants.BACKEND_MAX_RESPONSE_BYTES: 10000})
+    def test_too_large_metric_value(self):
+        """Too large responses must result in a metric value error"""
+        with requests_mock.mock(real_http=True) as req_mock:
+            metric_info = MetricInfo(** request_count)
+            req_mock.get(metric_info.metricObj.spec.urlTemplate, json = large_response(1000))
+            expr = ExperimentResource(** er_example)
+            value, err = get_metric_value(metric_info.metricObj, \
+                expr.spec.versionInfo.baseline, expr.status.startTime)
+            assert value is None
+            assert isinstance(err, ResponseTooLargeError)
+
+def raw_deflate(data):
+    """Deflate data without the zlib header"""
+    compressor = zlib.compressobj(wbits = -zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+class CompressedResponses(TestCase):
+    """Test decoding and byte accounting of compressed metrics backend responses"""
+
+    def setUp(self):
+        byte_counters.reset()
+
+    def tearDown(self):
+        byte_counters.reset()
+
+    def get(self):
+        """Query the backend at URL"""
+        return get_raw_response(url = URL, method = Method.GET, params = None, \
+            body = None, headers = None, auth = None, timeout = 1.0)
+
+    def test_accept_encoding(self):
+        """Sessions and asynchronous clients must negotiate the configured encodings"""
+        pool = SessionPool(4, True, 60.0, accept_encoding = "gzip")
+        assert pool.get_session(URL).headers["Accept-Encoding"] == "gzip"
+        assert pool.create_async_client().headers["Accept-Encoding"] == "gzip"
+        pool.close()
+
+    def test_compressed_responses(self):
+        """gzip and deflate responses must be decoded; wire and decoded bytes must be counted"""
+        content = json.dumps(large_response(100)).encode()
+        with requests_mock.mock(real_http=True) as req_mock:
+            for encoding, encoded in [("gzip", gzip.compress(content)), \
+                ("deflate", zlib.compress(content)), ("deflate", raw_deflate(content)), \
+                    ("identity", content)]:
+                req_mock.get(URL, content = encoded, headers = {"Content-Encoding": encoding})
+                assert self.get().json() == large_response(100)
+
+            req_mock.get(URL, content = content, headers = {"Content-Encoding": "br"})
+            with self.assertRaises(ValueError):
+                self.get()
+
+        counters = byte_counters.stats()["http://prometheus:9090"]
+        assert counters["responses"] == 4
+        assert counters["decoded_bytes"] == 4 * len(content)
+        assert counters["wire_bytes"] < 2 * len(content)
+
+    def test_decoded_size_limit(self):
+        """Compressed responses must be rejected once their decoded size exceeds the maximum"""
+        encoded = gzip.compress(b" " * 10 * 1024 * 1024)
+        with requests_mock.mock(real_http=True) as req_mock:
+            req_mock.get(URL, content = encoded, headers = {"Content-Encoding": "gzip", \
+                "Content-Length": str(len(encoded))})
+            with mock.patch.dict('iter8_analytics.api.v2.metrics.env_config', \
+                {constants.BACKEND_MAX_RESPONSE_BYTES: 10000}):
+                with self.assertRaises(ResponseTooLargeError):
+                    self.get()
+        counters = byte_counters.stats()["http://prometheus:9090"]
+        assert counters["decoded_bytes"] <= 10001
+        assert counters["wire_bytes"] == len(encoded)
+
+    @mock.patch.dict('iter8_analytics.api.v2.metrics.env_config', \
+        {constants.BACKEND_MAX_RESPONSE_BYTES: 10000})
+    def test_compressed_responses_async(self):
+        """Asynchronous reads must decode compressed responses within the maximum size"""
+        def encoded_chunks(data):
+            async def chunks():
+                for i in range(0, len(data), 100):
+                    yield data[i:i + 100]
+            return chunks()
+
+        small = json.dumps(large_response(10)).encode()
+        def handler(request: httpx.Request):
+            assert request.headers["Accept-Encoding"] == "gzip, deflate"
+            if request.url.params.get("query") == "small":
+                return httpx.Response(200, content = encoded_chunks(gzip.compress(small)), \
+                    headers = {"Content-Encoding": "gzip"})
+            return httpx.Response(200, content = encoded_chunks(gzip.compress(b" " * 1000000)), \
+                headers = {"Content-Encoding": "gzip"})
+
+        async def get_response(query):
+            async with httpx.AsyncClient(transport = httpx.MockTransport(handler), \
+                headers = {"Accept-Encoding": "gzip, deflate"}) as client:
+                return await get_raw_response_async(client, url = URL, method = Method.GET, \
+                    params = {"query": query}, body = None, headers = None, auth = None, \
+                        timeout = 1.0)
+
+        assert asyncio.run(get_response("small")).json() == large_response(10)
+        with self.assertRaises(ResponseTooLargeError):
+            asyncio.run(get_response("large"))
+        counters = byte_counters.stats()["http://prometheus:9090"]
+        assert counters["responses"] == 2
+        assert counters["wire_bytes"] < counters["decoded_bytes"]
@@ -0,0 +1,218 @@
+"""Tests for iter8_analytics.api.v2.retry"""
+# standard python stuff
+import asyncio
+import copy
+import logging
+from unittest import TestCase
+
+# python libraries
+import httpx
+import requests
+import requests_mock
+
+# iter8 dependencies
+from iter8_analytics import fastapi_app
+from iter8_analytics.config import env_config
+import iter8_analytics.constants as constants
+from iter8_analytics.api.v2.retry import Retrier, RetryPolicy, is_retryable_error
+from iter8_analytics.api.v2.responses import BackendResponse
+from iter8_analytics.api.v2.circuit_breaker import CircuitOpenError, circuit_breakers
+from iter8_analytics.api.v2.deadline import set_deadline, reset_deadline
+from iter8_analytics.api.v2.metrics import get_metric_value, get_metric_value_async, \
+    get_retry_policy
+from iter8_analytics.api.v2.types import ExperimentResource, MetricInfo, Method
+from iter8_analytics.api.v2.examples.examples_canary import er_example
+from iter8_analytics.api.v2.examples.examples_metrics import request_count, cpu_utilization
+
+logger = logging.getLogger('iter8_analytics')
+if not logger.hasHandlers():
+    fastapi_app.config_logger(env_config[constants.LOG_LEVEL])
+
+logger.info(env_config)
+
+json_response = {
+    "status": "success",
+    "data": {
+        "resultType": "vector",
+        "result": [{"value": [1556823494.744, "21.7639"]}]
+    }
+}
+
+def responses(*status_codes):
+    """Return a function returning responses with the given status codes, in order"""
+    calls = []
+    def func():
+        calls.append(1)
+        status_code = status_codes[len(calls) - 1]
+        if isinstance(status_code, Exception):
+            raise status_code
+        return BackendResponse(status_code, b'{}')
+    return func, calls
+
+class Retry(TestCase):
+    """Test retries of failed metrics backend queries"""
+
+    def setUp(self):
+        self.retrier = Retrier(base_delay = 0.01, max_delay = 0.02, min_attempt = 0.5, seed = 0)
+
+    def test_backoff(self):
+        """Backoffs must be jittered below an exponentially growing, capped bound"""
+        retrier = Retrier(base_delay = 1.0, max_delay = 3.0, min_attempt = 0.0, seed = 0)
+        for attempt, cap in [(0, 1.0), (1, 2.0), (2, 3.0), (5, 3.0)]:
+            backoffs = [retrier.get_backoff(attempt) for _ in range(100)]
+            assert all(0 <= backoff <= cap for backoff in backoffs)
+            assert max(backoffs) > cap / 2
+            assert len(set(backoffs)) == 100
+
+    def test_retryable_errors(self):
+        """Connection errors and timeouts must be retryable; other errors must not"""
+        assert is_retryable_error(requests.exceptions.ConnectionError())
+        assert is_retryable_error(requests.exceptions.ReadTimeout())
+        assert is_retryable_error(httpx.ConnectError("reset"))
+        assert not is_retryable_error(CircuitOpenError("open"))
+        assert not is_retryable_error(ValueError("bad response"))
+
+    def test_transient_failures_retried(self):
+        """Retryable failures must be retried up to the retry count"""
+        func, calls = responses(502, requests.exceptions.ConnectionError(), 200)
+        assert self.retrier.call(RetryPolicy(2), Method.GET, func).status_code == 200
+        assert len(calls) == 3
+
+        func, calls = responses(503, 503, 503)
+        assert self.retrier.call(RetryPolicy(1), Method.GET, func).status_code == 503
+        assert len(calls) == 2
+
+        func, calls = responses(requests.exceptions.ConnectTimeout())
+        with self.assertRaises(requests.exceptions.ConnectTimeout):
+            self.retrier.call(RetryPolicy(0), Method.GET, func)
+        assert self.retrier.stats() == \
+            {"retries": 3, "recovered": 1, "exhausted": 1, "deadline_skipped": 0}
+
+    def test_permanent_failures_not_retried(self):
+        """Non-retryable responses and errors must not be retried"""
+        func, calls = responses(500, 200)
+        assert self.retrier.call(RetryPolicy(2), Method.GET, func).status_code == 500
+        func, calls = responses(CircuitOpenError("open"), 200)
+        with self.assertRaises(CircuitOpenError):
+            self.retrier.call(RetryPolicy(2), Method.GET, func)
+        assert len(calls) == 1
+
+    def test_post_opt_in(self):
+        """POST queries must be retried only if the policy opts in"""
+        func, calls = responses(502, 200)
+        assert self.retrier.call(RetryPolicy(2), Method.POST, func).status_code == 502
+        assert len(calls) == 1
+        func, calls = responses(502, 200)
+        assert self.retrier.call(RetryPolicy(2, retry_post = True), Method.POST, func)\
+            .status_code == 200
+
+    def test_deadline(self):
+        """Retries which do not fit in the remaining deadline must be skipped"""
+        token = set_deadline(0.2)
+        try:
+            func, calls = responses(502, 200)
+            assert self.retrier.call(RetryPolicy(2), Method.GET, func).status_code == 502
+            assert len(calls) == 1
+        finally:
+            reset_deadline(token)
+        assert self.retrier.stats()["deadline_skipped"] == 1
+
+        token = set_deadline(2.0)
+        try:
+            func, calls = responses(502, 200)
+            assert self.retrier.call(RetryPolicy(2), Method.GET, func).status_code == 200
+        finally:
+            reset_deadline(token)
+
+    def test_async_retries(self):
+        """Asynchronous queries must be retried like synchronous ones"""
+        func, calls = responses(httpx.ReadTimeout("slow"), 504, 200)
+
+        async def call():
+            async def async_func():
+                return func()
+            return await self.retrier.call_async(RetryPolicy(2), Method.GET, async_func)
+
+        assert asyncio.run(call()).status_code == 200
+        assert len(calls) == 3
+
+class RetriedMetrics(TestCase):
+    """Test retries of metric queries"""
+
+    def setUp(self):
+        circuit_breakers.reset()
+
+    def tearDown(self):
+        circuit_breakers.reset()
+
+    def test_retried_metric_value(self):
+        """A transient backend failure must not drop the metric value"""
+        expr = ExperimentResource(** er_example)
+        metric_info = MetricInfo(** request_count)
+        version = expr.spec.versionInfo.baseline
+        metric_info.metricObj.spec.retries = 1
+        with requests_mock.mock(real_http=True) as req_mock:
+            req_mock.get(metric_info.metricObj.spec.urlTemplate, [
+                {"status_code": 502, "text": "bad gateway"},
+                {"status_code": 200, "json": json_response}])
+            assert get_metric_value(metric_info.metricObj, version, expr.status.startTime) == \
+                (21.7639, None)
+            assert req_mock.call_count == 2
+
+        # queries are not retried unless retries are configured
+        metric_info.metricObj.spec.retries = None
+        with requests_mock.mock(real_http=True) as req_mock:
+            req_mock.get(metric_info.metricObj.spec.urlTemplate, [
+                {"status_code": 502, "text": "bad gateway"},
+                {"status_code": 200, "json": json_response}])
+            value, err = get_metric_value(metric_info.metricObj, version, expr.status.startTime)
+            assert value is None and err is not None
+            assert req_mock.call_count == 1
+
+    def test_retried_post_metric_value_async(self):
+        """POST metric queries must be retried only if the metric opts in"""
+        calls = []
+        def handler(request: httpx.Request):
+            calls.append(request)
+            if len(calls) % 2 == 1:
+                return httpx.Response(503, text = "unavailable")
+            return httpx.Response(200, json = {"data": [{"t": 1582756200, "d": [6.481]}]})
+
+        expr = ExperimentResource(** er_example)
+        metric_info = MetricInfo(** cpu_utilization)
+        metric_info.metricObj.spec.retries = 1
+        version = expr.spec.versionInfo.baseline
+
+        async def get_value():
+            async with httpx.AsyncClient(transport = httpx.MockTransport(handler)) as client:
+                return await get_metric_value_async(metric_info.metricObj, version, \
+                    expr.status.startTime, client)
+
+        value, err = asyncio.run(get_value())
+        assert value is None and err is not None
+        assert len(calls) == 1
+
+        calls.clear()
+        metric_info.metricObj.spec.retryPost = True
+        assert asyncio.run(get_value()) == (6.481, None)
+        assert len(calls) == 2
+
+    def test_retried_prometheus_adapter_query(self):
+        """Form queries of the Prometheus adapter must be retried without retryPost"""
+        metric = copy.deepcopy(request_count)
+        metric["metricObj"]["spec"]["adapter"] = "prometheus"
+        metric["metricObj"]["spec"]["retries"] = 1
+        metric_info = MetricInfo(** metric)
+        assert get_retry_policy(metric_info.metricObj) == RetryPolicy(1, retry_post = True)
+        metric_info.metricObj.spec.retryPost = False
+        assert get_retry_policy(metric_info.metricObj) == RetryPolicy(1, retry_post = False)
+        metric_info.metricObj.spec.retryPost = None
+
+        expr = ExperimentResource(** er_example)
+        with requests_mock.mock(real_http=True) as req_mock:
+            req_mock.post(metric_info.metricObj.spec.urlTemplate, [
+                {"status_code": 503, "text": "unavailable"},
+                {"status_code": 200, "json": json_response}])
+            assert get_metric_value(metric_info.metricObj, expr.spec.versionInfo.baseline, \
+                expr.status.startTime) == (21.7639, None)
+            assert req_mock.call_count == 2
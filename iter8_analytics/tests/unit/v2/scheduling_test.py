@@ -0,0 +1,123 @@
+"""Tests for iter8_analytics.api.v2.scheduling"""
+# standard python stuff
+import asyncio
+import copy
+import logging
+import time
+from unittest import TestCase, mock
+
+# python libraries
+import httpx
+import requests_mock
+
+# iter8 dependencies
+from iter8_analytics import fastapi_app
+from iter8_analytics.config import env_config
+import iter8_analytics.constants as constants
+from iter8_analytics.api.v2.scheduling import FetchSkippedError, fetch_scheduler, \
+    get_metric_priorities, schedule_groups, DECISION_PRIORITY, INFORMATIONAL_PRIORITY
+from iter8_analytics.api.v2.circuit_breaker import circuit_breakers
+from iter8_analytics.api.v2.deadline import DeadlineExceededError, set_deadline, reset_deadline
+from iter8_analytics.api.v2.metrics import get_aggregated_metrics, \
+    get_aggregated_metrics_async, get_custom_metrics
+from iter8_analytics.api.v2.types import ExperimentResource
+from iter8_analytics.api.v2.examples.examples_canary import er_example, er_example_step1, \
+    mr_example
+from iter8_analytics.api.v2.examples.examples_ab import ab_er_example
+
+logger = logging.getLogger('iter8_analytics')
+if not logger.hasHandlers():
+    fastapi_app.config_logger(env_config[constants.LOG_LEVEL])
+
+logger.info(env_config)
+
+json_response = {
+    "status": "success",
+    "data": {
+        "resultType": "vector",
+        "result": [{"value": [1556823494.744, "21.7639"]}]
+    }
+}
+
+class Scheduling(TestCase):
+    """Test the prioritized scheduling of metric fetches"""
+
+    def setUp(self):
+        circuit_breakers.reset()
+        fetch_scheduler.reset()
+
+    def tearDown(self):
+        circuit_breakers.reset()
+
+    def test_metric_priorities(self):
+        """Objective and reward metrics must be fetched before informational metrics"""
+        expr = ExperimentResource(** er_example)
+        assert get_metric_priorities(expr, get_custom_metrics(expr)) == {
+            "request-count": INFORMATIONAL_PRIORITY,
+            "mean-latency": DECISION_PRIORITY
+        }
+        expr = ExperimentResource(** ab_er_example)
+        assert get_metric_priorities(expr, get_custom_metrics(expr)) == {
+            "request-count": INFORMATIONAL_PRIORITY,
+            "mean-latency": DECISION_PRIORITY,
+            "business-revenue": DECISION_PRIORITY
+        }
+
+    def test_schedule_groups(self):
+        """Groups must be ordered by their highest priority, keeping the order of equals"""
+        groups = [("a", [], [0]), ("b", [], [1, 2]), ("c", [], [3])]
+        assert schedule_groups(groups, [1, 1, 0, 1]) == [groups[1], groups[0], groups[2]]
+        assert schedule_groups(groups) == groups
+        assert issubclass(FetchSkippedError, DeadlineExceededError)
+
+    @mock.patch.dict('iter8_analytics.api.v2.metrics.env_config', \
+        {constants.METRICS_FETCH_CONCURRENCY: 1})
+    def test_decision_metrics_first(self):
+        """Queries of objective metrics must be made before those of informational metrics"""
+        queries = []
+        def response(request, context):
+            queries.append(request.qs["query"][0])
+            return json_response
+
+        expr = ExperimentResource(** er_example)
+        with requests_mock.mock(real_http=True) as req_mock:
+            req_mock.get("http://metrics-mock:8080/promcounter", json = response)
+            iam = get_aggregated_metrics(expr)
+        assert len(queries) == 4
+        assert all("latencies_sum" in query for query in queries[:2])
+        assert not any("latencies_sum" in query for query in queries[2:])
+        assert iam.data["request-count"].data["canary"].value == 21.7639
+        assert fetch_scheduler.stats() == \
+            {"fetched": {"decision": 2, "informational": 2}, "skipped": {}}
+
+    def test_partial_results_async(self):
+        """Informational metrics not fetched by the deadline must be skipped and marked"""
+        async def handler(request: httpx.Request):
+            if "latencies_sum" not in request.url.params["query"]:
+                await asyncio.sleep(2)
+            return httpx.Response(200, json = json_response)
+
+        example = copy.deepcopy(er_example_step1)
+        example['status']['metrics'] = mr_example
+        expr = ExperimentResource(** example).convert_to_float()
+
+        async def get_iam():
+            token = set_deadline(0.3)
+            try:
+                async with httpx.AsyncClient(transport = httpx.MockTransport(handler)) as client:
+                    return await get_aggregated_metrics_async(expr, client)
+            finally:
+                reset_deadline(token)
+
+        start = time.monotonic()
+        iam = asyncio.run(get_iam())
+        assert time.monotonic() - start < 1.5
+        for version_name in ["default", "canary"]:
+            assert iam.data["mean-latency"].data[version_name].value == 21.7639
+            assert iam.data["request-count"].data[version_name].value == \
+                expr.status.analysis.aggregated_metrics.data["request-count"]\
+                    .data[version_name].value
+        assert "Skipped metric: request-count" in iam.message
+        assert "mean-latency" not in iam.message
+        assert fetch_scheduler.stats() == \
+            {"fetched": {"decision": 2}, "skipped": {"informational": 2}}
@@ -0,0 +1,200 @@
+"""Tests for iter8_analytics.api.v2.sessions"""
+# standard python stuff
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import time
+from unittest import TestCase, mock
+
+# python libraries
+import httpx
+import requests_mock
+
+# iter8 dependencies
+from iter8_analytics import fastapi_app
+from iter8_analytics.config import env_config
+import iter8_analytics.constants as constants
+from iter8_analytics.api.v2.sessions import SessionPool, StreamStats, get_backend_key, \
+    parse_backends
+from iter8_analytics.api.v2.metrics import get_raw_response, get_raw_response_async
+from iter8_analytics.api.v2.types import Method
+
+logger = logging.getLogger('iter8_analytics')
+if not logger.hasHandlers():
+    fastapi_app.config_logger(env_config[constants.LOG_LEVEL])
+
+logger.info(env_config)
+
+class BackendKey(TestCase):
+    """Test metrics backend keys"""
+
+    def test_backend_key(self):
+        """Backend key must consist of scheme and host"""
+        assert get_backend_key("http://Prometheus:9090/api/v1/query?query=up") == \
+            "http://prometheus:9090"
+        assert get_backend_key("https://secure.sysdig.com/api/data") == \
+            "https://secure.sysdig.com"
+
+class Sessions(TestCase):
+    """Test pooled sessions"""
+
+    def test_session_reuse(self):
+        """Sessions must be reused per backend and shared SSL context"""
+        pool = SessionPool(pool_size = 4, keep_alive = True, max_idle = 60.0)
+        prom1 = pool.get_session("http://prometheus:9090/api/v1/query")
+        prom2 = pool.get_session("http://prometheus:9090/api/v1/query_range")
+        sysdig = pool.get_session("https://secure.sysdig.com/api/data")
+        assert prom1 is prom2
+        assert prom1 is not sysdig
+        assert not sysdig.verify
+        assert sysdig.get_adapter("https://secure.sysdig.com").ssl_context is pool.ssl_context
+        assert sysdig.get_adapter("https://secure.sysdig.com")._pool_maxsize == 4
+        assert sysdig.headers["Connection"] == "keep-alive"
+        pool.close()
+
+    def test_no_keep_alive(self):
+        """Connections must be closed after each request when keep alive is disabled"""
+        pool = SessionPool(pool_size = 4, keep_alive = False, max_idle = 60.0)
+        session = pool.get_session("http://prometheus:9090/api/v1/query")
+        assert session.headers["Connection"] == "close"
+        pool.close()
+
+    def test_idle_session_expiry(self):
+        """Sessions idle for longer than max_idle must be closed and replaced"""
+        pool = SessionPool(pool_size = 4, keep_alive = True, max_idle = 10.0)
+        with mock.patch('iter8_analytics.api.v2.sessions.time.monotonic', return_value = 100.0):
+            session1 = pool.get_session("http://prometheus:9090/api/v1/query")
+        with mock.patch('iter8_analytics.api.v2.sessions.time.monotonic', return_value = 105.0):
+            session2 = pool.get_session("http://prometheus:9090/api/v1/query")
+        with mock.patch('iter8_analytics.api.v2.sessions.time.monotonic', return_value = 120.0):
+            session3 = pool.get_session("http://prometheus:9090/api/v1/query")
+        assert session1 is session2
+        assert session2 is not session3
+        pool.close()
+
+    def test_async_client_reuse(self):
+        """Asynchronous clients must be reused per backend within an event loop"""
+        pool = SessionPool(pool_size = 4, keep_alive = True, max_idle = 60.0)
+
+        async def get_clients():
+            prom1 = pool.get_async_client("http://prometheus:9090/api/v1/query")
+            prom2 = pool.get_async_client("http://prometheus:9090/api/v1/query_range")
+            sysdig = pool.get_async_client("https://secure.sysdig.com/api/data")
+            await pool.aclose()
+            return prom1, prom2, sysdig
+
+        prom1, prom2, sysdig = asyncio.run(get_clients())
+        assert prom1 is prom2
+        assert prom1 is not sysdig
+        assert len(pool.async_clients) == 0
+
+    def test_idle_async_client_expiry(self):
+        """Asynchronous clients idle for longer than max_idle must be closed on their loop"""
+        pool = SessionPool(pool_size = 4, keep_alive = True, max_idle = 10.0)
+
+        async def get_clients():
+            with mock.patch('iter8_analytics.api.v2.sessions.time.monotonic', \
+                return_value = 100.0):
+                client1 = pool.get_async_client("http://prometheus:9090/api/v1/query")
+            # expired by a session of another thread
+            with mock.patch('iter8_analytics.api.v2.sessions.time.monotonic', \
+                return_value = 120.0):
+                await asyncio.get_running_loop().run_in_executor(None, \
+                    pool.get_session, "http://prometheus:9090/api/v1/query")
+            assert len(pool.async_clients) == 0
+            await asyncio.sleep(0.01)
+            assert client1.is_closed
+            with mock.patch('iter8_analytics.api.v2.sessions.time.monotonic', \
+                return_value = 120.0):
+                client2 = pool.get_async_client("http://prometheus:9090/api/v1/query")
+            await pool.aclose()
+            return client1, client2
+
+        client1, client2 = asyncio.run(get_clients())
+        assert client1 is not client2
+
+    def test_raw_response_uses_pooled_session(self):
+        """get_raw_response must query the metrics backend using its pooled session"""
+        with requests_mock.mock(real_http=True) as req_mock:
+            req_mock.get("http://prometheus:9090/api/v1/query", json = {"status": "success"})
+            with mock.patch('iter8_analytics.api.v2.metrics.session_pool') as mock_pool:
+                mock_pool.uses_http2.return_value = False
+                mock_pool.get_session.return_value = \
+                    SessionPool(4, True, 60.0).get_session("http://prometheus:9090")
+                response = get_raw_response(url = "http://prometheus:9090/api/v1/query", \
+                    method = Method.GET, params = {"query": "up"}, body = None, \
+                        headers = None, auth = None, timeout = 1.0)
+                mock_pool.get_session.assert_called_with("http://prometheus:9090/api/v1/query")
+            assert response.json() == {"status": "success"}
+
+class Http2(TestCase):
+    """Test HTTP/2 clients for metrics backends"""
+
+    def setUp(self):
+        self.pool = SessionPool(pool_size = 4, keep_alive = True, max_idle = 60.0, \
+            http2_backends = parse_backends("https://envoy:8443/api, ,http://Gateway:8080"))
+        self.stream_stats = StreamStats()
+
+    def test_http2_backends(self):
+        """Only the listed backends must be queried over HTTP/2, and only if h2 is installed"""
+        assert self.pool.http2_backends == {"https://envoy:8443", "http://gateway:8080"}
+        with mock.patch('iter8_analytics.api.v2.sessions.HTTP2_AVAILABLE', True):
+            assert self.pool.uses_http2("https://envoy:8443/api/v1/query")
+            assert not self.pool.uses_http2("http://prometheus:9090/api/v1/query")
+        with mock.patch('iter8_analytics.api.v2.sessions.HTTP2_AVAILABLE', False):
+            assert not self.pool.uses_http2("https://envoy:8443/api/v1/query")
+        assert self.pool.get_limits(http2 = True).max_connections == 1
+        assert self.pool.get_limits().max_connections == 4
+
+    def test_http2_streams(self):
+        """Concurrent queries from threads must share the HTTP/2 client, as timed streams"""
+        def handler(request: httpx.Request):
+            time.sleep(0.1)
+            return httpx.Response(200, json = {"status": "success"}, \
+                extensions = {"http_version": b"HTTP/2"})
+
+        client = httpx.Client(transport = httpx.MockTransport(handler))
+        with mock.patch('iter8_analytics.api.v2.metrics.session_pool', self.pool), \
+            mock.patch('iter8_analytics.api.v2.metrics.stream_stats', self.stream_stats), \
+            mock.patch('iter8_analytics.api.v2.sessions.HTTP2_AVAILABLE', True), \
+            mock.patch.object(self.pool, 'get_http2_client', return_value = client):
+            with ThreadPoolExecutor(max_workers = 4) as executor:
+                responses = list(executor.map(lambda _: get_raw_response( \
+                    url = "https://envoy:8443/api/v1/query", method = Method.GET, \
+                        params = {"query": "up"}, body = None, headers = None, auth = None, \
+                            timeout = 1.0), range(4)))
+        assert all(response.json() == {"status": "success"} for response in responses)
+        stats = self.stream_stats.stats()["https://envoy:8443"]
+        assert stats["streams"] == 4 and stats["http2_streams"] == 4
+        assert stats["errors"] == 0 and stats["in_flight"] == 0
+        assert stats["max_concurrent_streams"] > 1
+        assert 0.1 <= stats["p50_latency"] <= stats["p99_latency"] <= stats["max_latency"]
+
+    def test_http2_streams_async(self):
+        """Asynchronous queries to HTTP/2 backends must be timed as streams"""
+        def handler(request: httpx.Request):
+            if "fail" in request.url.path:
+                raise httpx.ConnectError("refused")
+            return httpx.Response(200, json = {"status": "success"})
+
+        async def query(client, url):
+            return await get_raw_response_async(client, url = url, method = Method.GET, \
+                params = None, body = None, headers = None, auth = None, timeout = 1.0)
+
+        async def run():
+            async with httpx.AsyncClient(transport = httpx.MockTransport(handler)) as client:
+                await query(client, "http://gateway:8080/query")
+                await query(client, "http://prometheus:9090/query")
+                with self.assertRaises(httpx.ConnectError):
+                    await query(client, "http://gateway:8080/fail")
+
+        with mock.patch('iter8_analytics.api.v2.metrics.session_pool', self.pool), \
+            mock.patch('iter8_analytics.api.v2.metrics.stream_stats', self.stream_stats), \
+            mock.patch('iter8_analytics.api.v2.sessions.HTTP2_AVAILABLE', True):
+            asyncio.run(run())
+        stats = self.stream_stats.stats()
+        assert list(stats) == ["http://gateway:8080"]
+        # the mock transport answers over HTTP/1.1
+        assert stats["http://gateway:8080"]["streams"] == 2
+        assert stats["http://gateway:8080"]["http2_streams"] == 0
+        assert stats["http://gateway:8080"]["errors"] == 1
@@ -0,0 +1,123 @@
+"""Tests for iter8_analytics.api.v2.warmup"""
+# standard python stuff
+import asyncio
+import logging
+import os
+import tempfile
+import time
+from unittest import TestCase, mock
+
+# python libraries
+import httpx
+import requests_mock
+import yaml
+from fastapi.testclient import TestClient
+
+# iter8 dependencies
+from iter8_analytics import fastapi_app
+from iter8_analytics.config import env_config
+import iter8_analytics.constants as constants
+from iter8_analytics.api.v2.warmup import Warmup, get_warmup_urls, warmup as default_warmup
+from iter8_analytics.api.v2.examples.examples_metrics import request_count, cpu_utilization, \
+    new_relic_secret
+
+logger = logging.getLogger('iter8_analytics')
+if not logger.hasHandlers():
+    fastapi_app.config_logger(env_config[constants.LOG_LEVEL])
+
+logger.info(env_config)
+
+class WarmupTest(TestCase):
+    """Test startup warm-up"""
+
+    def test_warmup_urls(self):
+        """There must be one url per backend, from the configured urls and metric resources"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "metrics.yaml")
+            with open(path, "w") as stream:
+                yaml.safe_dump_all([request_count["metricObj"], \
+                    {"kind": "List", "items": [cpu_utilization["metricObj"], \
+                        new_relic_secret]}], stream)
+            urls = get_warmup_urls(" http://prometheus:9090/api/v1/query, ,"
+                "http://metrics-mock:8080/other", path)
+        # metric resources whose urls need secrets outside a cluster are skipped
+        assert urls == ["http://prometheus:9090/api/v1/query", "http://metrics-mock:8080/other"]
+        assert get_warmup_urls("", "/does/not/exist.yaml") == []
+
+    def test_warmup(self):
+        """Backends must be resolved and pre-connected; the service must then be ready"""
+        warmup = Warmup(timeout = 5.0, urls = ["http://localhost:9090/api/v1/query", \
+            "http://unresolvable.invalid/api"])
+
+        def handler(request: httpx.Request):
+            # no query is made
+            assert request.method == "HEAD"
+            assert str(request.url) == "http://localhost:9090/"
+            return httpx.Response(405)
+
+        async def run():
+            with mock.patch('iter8_analytics.api.v2.warmup.session_pool.get_async_client', \
+                return_value = httpx.AsyncClient(transport = httpx.MockTransport(handler))):
+                warmup.start()
+                assert not warmup.ready
+                await warmup.task
+
+        with requests_mock.mock(real_http=True) as req_mock:
+            req_mock.head("http://localhost:9090/", status_code = 405)
+            asyncio.run(run())
+            assert req_mock.call_count == 1
+            assert req_mock.request_history[0].url == "http://localhost:9090/"
+
+        stats = warmup.stats()
+        assert stats["ready"] and not stats["timed_out"]
+        assert stats["backends"]["http://localhost:9090"] == \
+            {"resolved": True, "connected": True, "error": None}
+        assert not stats["backends"]["http://unresolvable.invalid"]["resolved"]
+        assert not stats["kube_client"]
+
+    def test_urls_from_settings(self):
+        """Urls must be read from the settings when warm-up starts, not at import"""
+        assert default_warmup.urls is None
+        warmed = []
+        async def warm_backend(url):
+            warmed.append(url)
+
+        warmup = Warmup(timeout = 5.0)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "metrics.yaml")
+            with open(path, "w") as stream:
+                yaml.safe_dump(request_count["metricObj"], stream)
+            with mock.patch.dict('iter8_analytics.api.v2.warmup.env_config', \
+                {constants.WARMUP_BACKENDS: "http://prometheus:9090/api/v1/query", \
+                    constants.WARMUP_METRICS_FILE: path}), \
+                mock.patch.object(warmup, 'warm_backend', warm_backend):
+                asyncio.run(warmup.run())
+        assert warmed == ["http://prometheus:9090/api/v1/query", \
+            request_count["metricObj"]["spec"]["urlTemplate"]]
+        assert warmup.urls is None
+
+    def test_warmup_timeout(self):
+        """The service must be ready once warm-up times out"""
+        warmup = Warmup(timeout = 0.1, urls = ["http://localhost:9090/api/v1/query"])
+
+        async def slow_backend(url):
+            await asyncio.sleep(10)
+
+        with mock.patch.object(warmup, 'warm_backend', slow_backend):
+            start = time.monotonic()
+            asyncio.run(warmup.run())
+        assert time.monotonic() - start < 5
+        assert warmup.ready and warmup.stats()["timed_out"]
+
+    def test_ready_endpoint(self):
+        """The readiness probe must fail until warm-up has finished"""
+        with mock.patch.object(fastapi_app.warmup, 'ready', False):
+            client = TestClient(fastapi_app.app)
+            assert client.get("/ready").status_code == 503
+            with mock.patch.object(fastapi_app.warmup, 'urls', []), client:
+                for _ in range(50):
+                    if client.get("/ready").status_code == 200:
+                        break
+                    time.sleep(0.1)
+                assert client.get("/ready").json() == {"status": "Ready"}
+                assert client.get("/v2/backend_stats").json()["warmup"]["ready"]